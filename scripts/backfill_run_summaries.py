@@ -0,0 +1,78 @@
+# This script projects the summary of every run in the databroker catalogs and
+# stores it in run_summaries, so that /runs listings don't have to project them
+# the first time they are asked for. Without it, summaries are stored as runs are listed.
+#
+# Runs whose stored summary is complete (the run has a stop document) are
+# skipped, so the script can be stopped and re-run at any point. Summaries of
+# open runs are projected again.
+#
+#   MONGO_DB_URI=... python scripts/backfill_run_summaries.py [catalog ...]
+
+import os
+import sys
+
+import pymongo
+from databroker import catalog
+
+from splash.runs.run_summaries import RunSummaries, summary_document
+from splash.runs.runs_service import is_complete, project_run_summary
+
+mongo_uri = os.getenv("MONGO_DB_URI")
+print(f"using {mongo_uri}")
+db = pymongo.MongoClient(mongo_uri).get_database()
+
+BATCH_SIZE = 1000
+
+
+def update():
+    summaries = RunSummaries(db, "run_summaries")
+    catalog_names = sys.argv[1:] or list(catalog)
+    for catalog_name in catalog_names:
+        stored, skipped, failed = backfill(summaries, catalog_name)
+        print(f"{catalog_name}: stored: {stored}  already complete: {skipped}  failed: {failed}")
+
+
+def backfill(summaries, catalog_name):
+    runs = catalog[catalog_name]
+    stored = 0
+    skipped = 0
+    failed = 0
+    batch = []
+
+    def flush():
+        nonlocal stored, skipped, failed
+        existing = summaries.get_many(catalog_name, batch)
+        documents = []
+        for uid in batch:
+            if uid in existing and existing[uid]["complete"]:
+                skipped += 1
+                continue
+            try:
+                run = runs[uid]
+                data_groups = run.metadata['start'].get('data_groups')
+                if data_groups is None:
+                    # Nobody can see a run without data groups
+                    continue
+                summary = project_run_summary(uid, run)
+            except Exception as e:
+                print(f"{catalog_name}: {uid} can't be projected: {e}")
+                failed += 1
+                continue
+            documents.append(summary_document(
+                catalog_name, summary, data_groups, is_complete(run), run.metadata['start'].get('time')
+            ))
+        summaries.put_many(documents)
+        stored += len(documents)
+        batch.clear()
+
+    for uid in runs:
+        batch.append(uid)
+        if len(batch) >= BATCH_SIZE:
+            flush()
+    if len(batch) > 0:
+        flush()
+    return stored, skipped, failed
+
+
+if __name__ == "__main__":
+    update()
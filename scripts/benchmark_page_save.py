@@ -0,0 +1,62 @@
+# Times page saves through PagesService.update against the database in MONGO_DB_URI.
+# Pages are written to scratch collections that are dropped afterwards.
+#
+# The "four round trips" row replays the save that PagesService.update made
+# before it wrote with a single find_one_and_update: read the current version,
+# read it again in MongoService.update, replace the whole document and insert
+# the old one into the history. Both rows save the same pages to the same
+# server, so they can be compared directly.
+#
+#   MONGO_DB_URI=mongodb://localhost:27017/splash_bench python scripts/benchmark_page_save.py [saves]
+
+from datetime import datetime
+import os
+import sys
+import uuid
+
+import pymongo
+
+from benchmark_utils import report, timed, user
+from splash.pages import NewPage, UpdatePage
+from splash.pages.pages_service import PagesService
+
+mongo_uri = os.getenv("MONGO_DB_URI")
+print(f"using {mongo_uri}")
+db = pymongo.MongoClient(mongo_uri).get_database()
+
+SAVES = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+COLLECTION = "bench_pages"
+
+
+def page(n, model=UpdatePage):
+    return model(title=f"Benchmark page {n}", page_type="benchmark", documentation="x" * 2000, references=[])
+
+
+def four_round_trips(service, data, uid):
+    current_document = service._collection.find_one({"uid": uid}, {"_id": False})
+    data["splash_md"] = {"version": current_document["splash_md"]["version"] + 1}
+    metadata = service._collection.find_one({"uid": uid}, {"_id": False})["splash_md"]
+    metadata.update(data["splash_md"])
+    data["uid"] = uid
+    data["splash_md"] = metadata
+    data["splash_md"]["last_edit"] = datetime.utcnow().replace(microsecond=0)
+    data["splash_md"]["edit_record"].append({"date": data["splash_md"]["last_edit"], "user": user.uid})
+    data["splash_md"]["etag"] = str(uuid.uuid4())
+    service._collection.replace_one({"uid": uid}, data)
+    service._versions_svc._collection.insert_one(current_document)
+
+
+def benchmark():
+    service = PagesService(db, COLLECTION, COLLECTION + "_old")
+    try:
+        uid = service.create(user, page(0, NewPage))["uid"]
+        report("four round trips", timed(lambda n: four_round_trips(service, page(n).dict(), uid), range(SAVES)))
+        uid = service.create(user, page(0, NewPage))["uid"]
+        report("update", timed(lambda n: service.update(user, page(n), uid), range(SAVES)))
+    finally:
+        for suffix in ("", "_old", "_edits"):
+            db.drop_collection(COLLECTION + suffix)
+
+
+if __name__ == "__main__":
+    benchmark()
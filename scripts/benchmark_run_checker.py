@@ -0,0 +1,52 @@
+# Times the authorization of a listing of runs by TeamRunChecker, with no database.
+#
+# The "linear scan" row repeats the check that can_do used to make for every run,
+# comparing each of the user's teams against the run's data groups, so both can
+# be compared on the same runs.
+#
+#   python scripts/benchmark_run_checker.py [runs] [teams]
+
+import random
+import sys
+
+from benchmark_utils import report, timed, user
+from splash.runs.runs_service import TeamRunChecker
+from splash.teams import Team
+
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+TEAMS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+DATA_GROUPS = 50
+REPEATS = 20
+
+teams = [
+    Team.construct(name=f"group-{n}") for n in random.sample(range(DATA_GROUPS), TEAMS)
+]
+# Runs of a beamtime share a few data group combinations
+combinations = [random.sample([f"group-{n}" for n in range(DATA_GROUPS)], 3) for _ in range(10)]
+runs = [list(random.choice(combinations)) for _ in range(RUNS)]
+
+
+def linear_scan():
+    allowed = 0
+    for run_data_groups in runs:
+        for team in teams:
+            if team.name in run_data_groups:
+                allowed += 1
+                break
+    return allowed
+
+
+def run_access():
+    access = TeamRunChecker().for_user(user, [team.name for team in teams])
+    return sum(1 for run_data_groups in runs if access.can_retrieve(run_data_groups))
+
+
+def benchmark():
+    assert linear_scan() == run_access()
+    print(f"{RUNS} runs, user in {TEAMS} teams")
+    report("linear scan", timed(lambda _: linear_scan(), range(REPEATS)))
+    report("run access", timed(lambda _: run_access(), range(REPEATS)))
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,71 @@
+# Times TeamsService.get_user_teams against the database in MONGO_DB_URI,
+# over a scratch collection of teams that is dropped afterwards.
+#
+# The "members.<uid>" row repeats the query that get_user_teams used to send,
+# which no index can serve, so both can be compared against the same server.
+#
+#   MONGO_DB_URI=mongodb://localhost:27017/splash_bench python scripts/benchmark_user_teams.py [teams] [lookups]
+
+import os
+import random
+import sys
+
+import pymongo
+
+from benchmark_utils import report, timed, user
+from splash.teams import NewTeam
+from splash.teams.teams_service import TeamsService
+
+mongo_uri = os.getenv("MONGO_DB_URI")
+print(f"using {mongo_uri}")
+db = pymongo.MongoClient(mongo_uri).get_database()
+
+TEAMS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+LOOKUPS = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+MEMBERS = 10
+USERS = TEAMS * 2
+COLLECTION = "bench_teams"
+
+
+def teams():
+    for n in range(TEAMS):
+        members = {f"user-{random.randrange(USERS)}": ["member"] for _ in range(MEMBERS)}
+        yield NewTeam(name=f"team-{n}", members=members)
+
+
+def lookups():
+    return [f"user-{random.randrange(USERS)}" for _ in range(LOOKUPS)]
+
+
+def winning_stage(query):
+    plan = db[COLLECTION].find(query).explain()["queryPlanner"]["winningPlan"]
+    while "inputStage" in plan:
+        plan = plan["inputStage"]
+    return plan["stage"]
+
+
+def benchmark():
+    service = TeamsService(db, COLLECTION)
+    try:
+        batch = []
+        for team in teams():
+            batch.append(team)
+            if len(batch) == 1000:
+                service.bulk_create(user, batch)
+                batch = []
+        if len(batch) > 0:
+            service.bulk_create(user, batch)
+
+        def members_query(uid):
+            return list(service.retrieve_multiple(user, query={"members." + uid: {"$exists": True}}))
+
+        report("members.<uid>", timed(members_query, lookups()), winning_stage({"members.user-0": {"$exists": True}}))
+        report("member_uids", timed(lambda uid: list(service.get_user_teams(user, uid)), lookups()),
+               winning_stage({"member_uids": "user-0"}))
+    finally:
+        for suffix in ("", "_edits"):
+            db.drop_collection(COLLECTION + suffix)
+
+
+if __name__ == "__main__":
+    benchmark()
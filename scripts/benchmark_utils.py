@@ -0,0 +1,32 @@
+# Helpers shared by the benchmark_*.py scripts, which import it from this directory.
+
+import statistics
+import time
+
+from splash.users import User
+
+# The user that benchmarks write and authorize as
+user = User(
+    uid="benchmark",
+    given_name="bench",
+    family_name="mark",
+    splash_md={"creator": "benchmark", "create_date": "2021-01-01T00:00:00", "last_edit": "2021-01-01T00:00:00",
+               "edit_record": [], "etag": "benchmark"},
+)
+
+
+def timed(run, arguments) -> list:
+    """Calls `run` with each of `arguments` and returns how long each call took, in ms"""
+    timings = []
+    for argument in arguments:
+        start = time.perf_counter()
+        run(argument)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list, note: str = ""):
+    timings = sorted(timings)
+    p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+    print(f"{name:<16} mean {statistics.mean(timings):7.2f} ms  p50 {statistics.median(timings):7.2f} ms  "
+          f"p95 {p95:7.2f} ms  {note}".rstrip())
@@ -0,0 +1,83 @@
+# This script rewrites the page history in pages_old to the layout that
+# PagesService writes with the given delta limit: every (limit + 1)th
+# version stored whole and the versions in between stored as deltas.
+# A limit of 0 turns every entry back into a full copy.
+#
+# Entries that are already in the right form are left alone, so the script
+# can be stopped and re-run at any point.
+#
+#   MONGO_DB_URI=... PAGES_HISTORY_DELTA_LIMIT=10 python scripts/compress_history.py
+
+import os
+
+import pymongo
+from pymongo import DESCENDING
+from pymongo.operations import ReplaceOne
+
+from splash.service.history import DELTA_KEY, apply_delta, history_entry
+
+mongo_uri = os.getenv("MONGO_DB_URI")
+print(f"using {mongo_uri}")
+db = pymongo.MongoClient(mongo_uri).get_database()
+
+DELTA_LIMIT = int(os.getenv("PAGES_HISTORY_DELTA_LIMIT", "0"))
+BATCH_SIZE = 1000
+
+
+def update():
+    size_before = db.command("collStats", "pages_old")["size"]
+    rewritten, skipped = compress("pages", "pages_old")
+    size_after = db.command("collStats", "pages_old")["size"]
+    print(f"pages_old: rewritten: {rewritten}  left as they were: {skipped}")
+    print(f"pages_old: data size before: {size_before}  after: {size_after}")
+
+
+def compress(collection_name, history_name):
+    collection = db[collection_name]
+    history = db[history_name]
+    requests = []
+    rewritten = 0
+    skipped = 0
+    uid = None
+    newer = None
+    # Walk each page's history from the newest entry down, so that the
+    # version above an entry is always known when it is rewritten
+    cursor = history.find().sort([("uid", DESCENDING), ("splash_md.version", DESCENDING)])
+    for entry in cursor:
+        if entry["uid"] != uid:
+            uid = entry["uid"]
+            newer = collection.find_one({"uid": uid}, {"_id": False})
+        version = entry["splash_md"]["version"]
+        if newer is not None and newer["splash_md"]["version"] != version + 1:
+            newer = None
+        entry_id = entry.pop("_id")
+        if DELTA_KEY not in entry:
+            full = entry
+        elif newer is not None:
+            full = apply_delta(newer, entry)
+        else:
+            print(f"{uid}: version {version} can't be rebuilt, there is a gap above it")
+            skipped += 1
+            continue
+
+        if newer is not None:
+            replacement = history_entry(full, newer, DELTA_LIMIT)
+        else:
+            replacement = full
+        if replacement != entry:
+            requests.append(ReplaceOne({"_id": entry_id}, replacement))
+            rewritten += 1
+        else:
+            skipped += 1
+        newer = full
+
+        if len(requests) >= BATCH_SIZE:
+            history.bulk_write(requests, ordered=False)
+            requests = []
+    if len(requests) > 0:
+        history.bulk_write(requests, ordered=False)
+    return rewritten, skipped
+
+
+if __name__ == "__main__":
+    update()
@@ -0,0 +1,42 @@
+# This script stores the summaries of new runs in run_summaries, as the catalog
+# indexer does when RUNS_INDEXER_INTERVAL is set, so that it can run apart from
+# the server. Progress is kept in run_index_checkpoints, so it can be stopped
+# and restarted at any point.
+#
+#   MONGO_DB_URI=... python scripts/index_catalogs.py [--once] [--interval 60] [--workers 4]
+
+import argparse
+import os
+import time
+
+import pymongo
+
+from splash.runs.indexer import CatalogIndexer
+from splash.runs.run_summaries import RunSummaries
+from splash.runs.runs_service import RunsService, TeamRunChecker
+from splash.teams.teams_service import TeamsService
+
+mongo_uri = os.getenv("MONGO_DB_URI")
+print(f"using {mongo_uri}")
+db = pymongo.MongoClient(mongo_uri).get_database()
+
+
+def update():
+    parser = argparse.ArgumentParser(description="Store the summaries of new runs in run_summaries")
+    parser.add_argument("--once", action="store_true", help="make one pass over the catalogs and exit")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between passes")
+    parser.add_argument("--workers", type=int, default=4, help="runs projected at the same time")
+    args = parser.parse_args()
+
+    summaries = RunSummaries(db, "run_summaries")
+    runs_service = RunsService(TeamsService(db, "teams"), TeamRunChecker(), summaries)
+    indexer = CatalogIndexer(runs_service, summaries, db, workers=args.workers, interval=args.interval)
+    while True:
+        print(f"stored: {indexer.index_all()}")
+        if args.once:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    update()
@@ -0,0 +1,168 @@
+# This script thins out the page history in pages_old. History entries are
+# kept or deleted by the age of the version, taken from its splash_md.last_edit:
+#
+#   younger than --keep-days           every version is kept
+#   younger than --daily-days          the newest version of each day is kept
+#   older                              the newest version of each month is kept
+#
+# The current version of a page lives in pages and is never touched.
+#
+# Deletes are sent with bulk_write in batches of whole pages. After each batch
+# the last page done is saved in the history_retention collection, so an
+# interrupted run picks up where it stopped. Entries stored as deltas (see
+# splash.service.history) need the version right above them to be rebuilt,
+# so an entry whose next version is deleted is first rewritten whole.
+#
+#   MONGO_DB_URI=... python scripts/prune_history.py --keep-days 30 --daily-days 365 [--dry-run] [--compact]
+
+import argparse
+import os
+from datetime import datetime, timedelta
+
+import bson
+import pymongo
+from pymongo import ASCENDING
+from pymongo.operations import DeleteOne, ReplaceOne
+
+from splash.service.history import DELTA_KEY, apply_delta
+
+mongo_uri = os.getenv("MONGO_DB_URI")
+print(f"using {mongo_uri}")
+db = pymongo.MongoClient(mongo_uri).get_database()
+
+BATCH_SIZE = 1000
+
+
+def versions_to_keep(entries, now, keep_days, daily_days):
+    """Returns the versions to keep out of a page's history `entries`, sorted by descending version"""
+    keep = set()
+    buckets = set()
+    for entry in entries:
+        last_edit = entry["splash_md"]["last_edit"]
+        age = now - last_edit
+        if age < timedelta(days=keep_days):
+            bucket = entry["splash_md"]["version"]
+        elif age < timedelta(days=daily_days):
+            bucket = last_edit.date()
+        else:
+            bucket = (last_edit.year, last_edit.month)
+        # Entries are newest first, so the first one in each bucket is the one kept
+        if bucket not in buckets:
+            buckets.add(bucket)
+            keep.add(entry["splash_md"]["version"])
+    return keep
+
+
+def page_requests(entries, current, keep):
+    """Returns the writes that prune one page's history entries, sorted by descending version.
+    Rewrites come first, so that no delta is ever left without the version above it"""
+    rewrites = []
+    deletes = []
+    newer = current
+    for entry in entries:
+        version = entry["splash_md"]["version"]
+        if newer is not None and newer["splash_md"]["version"] != version + 1:
+            newer = None
+        if DELTA_KEY not in entry:
+            full = entry
+        elif newer is not None:
+            full = apply_delta(newer, entry)
+        else:
+            full = None
+        if version not in keep:
+            deletes.append(DeleteOne({"_id": entry["_id"]}))
+        elif (
+            DELTA_KEY in entry
+            and version + 1 not in keep
+            and (current is None or current["splash_md"]["version"] != version + 1)
+        ):
+            if full is None:
+                print(f"{entry['uid']}: version {version} can't be rebuilt, keeping it as it is")
+            else:
+                rewrites.append(ReplaceOne({"_id": entry["_id"]}, {k: v for k, v in full.items() if k != "_id"}))
+        newer = full
+    return rewrites + deletes
+
+
+def prune(collection_name, history_name, keep_days, daily_days, dry_run=False):
+    collection = db[collection_name]
+    history = db[history_name]
+    checkpoints = db["history_retention"]
+    checkpoint = checkpoints.find_one({"_id": history_name})
+    query = {}
+    if checkpoint is not None:
+        print(f"{history_name}: resuming after page {checkpoint['last_uid']}")
+        query = {"uid": {"$gt": checkpoint["last_uid"]}}
+
+    now = datetime.utcnow()
+    deleted = 0
+    deleted_bytes = 0
+    rewritten = 0
+    requests = []
+    last_uid = None
+
+    def flush():
+        if len(requests) > 0 and not dry_run:
+            history.bulk_write(requests, ordered=True)
+            checkpoints.replace_one({"_id": history_name}, {"_id": history_name, "last_uid": last_uid}, upsert=True)
+        requests.clear()
+
+    def prune_page(uid, entries):
+        nonlocal deleted, deleted_bytes, rewritten
+        entries.reverse()
+        keep = versions_to_keep(entries, now, keep_days, daily_days)
+        if len(keep) == len(entries):
+            return
+        current = collection.find_one({"uid": uid}, {"_id": False})
+        page = page_requests(entries, current, keep)
+        pruned = [entry for entry in entries if entry["splash_md"]["version"] not in keep]
+        deleted += len(pruned)
+        deleted_bytes += sum(len(bson.BSON.encode(entry)) for entry in pruned)
+        rewritten += len(page) - len(pruned)
+        requests.extend(page)
+
+    uid = None
+    entries = []
+    cursor = history.find(query).sort([("uid", ASCENDING), ("splash_md.version", ASCENDING)])
+    for entry in cursor:
+        if entry["uid"] != uid:
+            if uid is not None:
+                prune_page(uid, entries)
+                last_uid = uid
+                if len(requests) >= BATCH_SIZE:
+                    flush()
+            uid = entry["uid"]
+            entries = []
+        entries.append(entry)
+    if uid is not None:
+        prune_page(uid, entries)
+        last_uid = uid
+    flush()
+    if not dry_run:
+        checkpoints.delete_one({"_id": history_name})
+    return deleted, deleted_bytes, rewritten
+
+
+def update():
+    parser = argparse.ArgumentParser(description="Delete old page versions from pages_old")
+    parser.add_argument("--keep-days", type=int, default=30, help="keep every version younger than this")
+    parser.add_argument("--daily-days", type=int, default=365, help="then keep one version a day up to this age")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be deleted without deleting")
+    parser.add_argument("--compact", action="store_true", help="compact the collection afterwards")
+    args = parser.parse_args()
+
+    stats_before = db.command("collStats", "pages_old")
+    deleted, deleted_bytes, rewritten = prune("pages", "pages_old", args.keep_days, args.daily_days, args.dry_run)
+    print(f"pages_old: deleted: {deleted} ({deleted_bytes} bytes)  rewritten whole: {rewritten}")
+    if args.dry_run:
+        return
+    if args.compact:
+        # Deleted documents only give space back to the filesystem once the collection is compacted
+        db.command("compact", "pages_old")
+    stats_after = db.command("collStats", "pages_old")
+    for stat in ("size", "storageSize", "totalIndexSize"):
+        print(f"pages_old: {stat} before: {stats_before[stat]}  after: {stats_after[stat]}")
+
+
+if __name__ == "__main__":
+    update()
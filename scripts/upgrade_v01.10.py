@@ -0,0 +1,90 @@
+# This script moves the edit_record array of every document into the
+# append-only <collection>_edits collection and trims the inline
+# edit_record down to the tail that MongoService keeps.
+#
+# Run it with every server stopped, before starting the version that keeps the
+# edit log. That version trims edit_record on the first write to a document,
+# which would drop the older edits before they are moved.
+# Log entries are keyed on the position of the edit in edit_record, so edits
+# made by one user within the same second are all kept. They are upserted, so
+# the script can be safely re-run until the servers are started again. Once the
+# new version has logged edits itself, the positions no longer line up with the
+# log and the script refuses to run.
+
+import os
+import sys
+import pymongo
+from pymongo import ASCENDING, DESCENDING
+from pymongo.operations import IndexModel, UpdateOne
+
+mongo_uri = os.getenv("MONGO_DB_URI")
+print(f"using {mongo_uri}")
+db = pymongo.MongoClient(mongo_uri).get_database()
+
+# Keep in sync with MongoService.edit_record_limit
+EDIT_RECORD_LIMIT = 20
+BATCH_SIZE = 1000
+
+
+def update():
+    collection_names = ["pages", "references", "teams", "users"]
+    for collection_name in collection_names:
+        # Entries logged by the service have an ObjectId, the ones moved here are keyed on their position
+        if db[collection_name + "_edits"].find_one({"_id": {"$type": "objectId"}}) is not None:
+            sys.exit(f"{collection_name}: edits were already logged by a server, not moving edit records")
+    for collection_name in collection_names:
+        upserted, matched = move_edit_records(collection_name)
+        print(f"{collection_name}: edits moved: {upserted}  already present: {matched}")
+
+        results = trim_edit_records(collection_name)
+        print(
+            f"{collection_name}: trimmed: matched: {results.matched_count}  modified: {results.modified_count}"
+        )
+
+
+def move_edit_records(collection_name):
+    collection = db[collection_name]
+    edits = db[collection_name + "_edits"]
+    edits.create_indexes([IndexModel([("uid", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)])])
+
+    cursor = collection.find(
+        {"splash_md.edit_record.0": {"$exists": True}},
+        {"_id": False, "uid": True, "splash_md.edit_record": True},
+    )
+    upserted = 0
+    matched = 0
+    requests = []
+    for document in cursor:
+        for index, edit in enumerate(document["splash_md"]["edit_record"]):
+            entry = {"uid": document["uid"], "date": edit["date"], "user": edit["user"]}
+            key = {"uid": document["uid"], "index": index}
+            requests.append(UpdateOne({"_id": key}, {"$setOnInsert": entry}, upsert=True))
+        if len(requests) >= BATCH_SIZE:
+            result = edits.bulk_write(requests, ordered=False)
+            upserted += result.upserted_count
+            matched += result.matched_count
+            requests = []
+    if len(requests) > 0:
+        result = edits.bulk_write(requests, ordered=False)
+        upserted += result.upserted_count
+        matched += result.matched_count
+    return upserted, matched
+
+
+def trim_edit_records(collection_name):
+    collection = db[collection_name]
+    return collection.update_many(
+        {f"splash_md.edit_record.{EDIT_RECORD_LIMIT}": {"$exists": True}},
+        [
+            {
+                "$set": {
+                    "splash_md.edit_record": {
+                        "$slice": ["$splash_md.edit_record", -EDIT_RECORD_LIMIT]
+                    }
+                }
+            }
+        ],
+    )
+
+
+update()
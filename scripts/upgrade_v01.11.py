@@ -0,0 +1,35 @@
+# This script fills in member_uids, the array of member uids that TeamsService
+# keeps next to the members dict so that get_user_teams can use an index.
+# Teams that get_user_teams should find are invisible to it until this has run.
+# The array is rebuilt from members on the server, so the script can be safely re-run.
+
+import os
+import pymongo
+
+mongo_uri = os.getenv("MONGO_DB_URI")
+print(f"using {mongo_uri}")
+db = pymongo.MongoClient(mongo_uri).get_database()
+
+
+def update():
+    teams = db["teams"]
+    results = teams.update_many(
+        {},
+        [
+            {
+                "$set": {
+                    "member_uids": {
+                        "$map": {
+                            "input": {"$objectToArray": {"$ifNull": ["$members", {}]}},
+                            "in": "$$this.k",
+                        }
+                    }
+                }
+            }
+        ],
+    )
+    print(f"teams: matched: {results.matched_count}  modified: {results.modified_count}")
+    teams.create_index("member_uids")
+
+
+update()
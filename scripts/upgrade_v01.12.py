@@ -0,0 +1,37 @@
+# This script drops the sort indexes that listings can no longer use.
+# Listings sort with the en_US collation and a sort only uses an index with
+# the same collation, so the services now create their sort indexes with it,
+# under names ending in _en_US. The older indexes on the same keys have the
+# simple collation and only slow down writes. Run it after deploying,
+# once the services have created the new indexes. It can be safely re-run.
+
+import os
+import pymongo
+
+mongo_uri = os.getenv("MONGO_DB_URI")
+print(f"using {mongo_uri}")
+db = pymongo.MongoClient(mongo_uri).get_database()
+
+# The sort keys of every listing, with and without the uid tiebreak that later versions added
+last_edit = [("splash_md.last_edit", pymongo.DESCENDING)]
+uid = [("uid", pymongo.DESCENDING)]
+superseded = {
+    "pages": [[("title", pymongo.ASCENDING)] + last_edit],
+    "references": [],
+    "teams": [[("name", pymongo.ASCENDING)] + last_edit],
+    "users": [[("family_name", pymongo.ASCENDING)] + last_edit],
+}
+
+
+def update():
+    for collection_name, sorts in superseded.items():
+        collection = db[collection_name]
+        keys = [sort + uid for sort in sorts] + sorts + [last_edit + uid]
+        for name, index in collection.index_information().items():
+            if "collation" in index or [tuple(key) for key in index["key"]] not in keys:
+                continue
+            collection.drop_index(name)
+            print(f"{collection_name}: dropped {name}")
+
+
+update()
@@ -10,19 +10,23 @@ from fastapi import (
     status,
     Form
 )
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2AuthorizationCodeBearer, SecurityScopes
 from google.oauth2 import id_token
-from google.auth.transport import requests
 from jose import JWTError, jwt
 from pydantic import BaseModel
 from .config import ConfigStore
+from .google_certs import CachingRequest
 
 
+from splash.service.claims import ClaimsVersion
+from splash.teams.teams_service import TeamsService
 from splash.users.users_service import (
+    AsyncUsersService,
     UsersService,
     MultipleUsersAuthenticatorException,
     UserNotFoundException)
-from splash.users import User
+from splash.users import TokenUser, User, UserSplashMd
 
 logger = logging.getLogger('splash.auth')
 
@@ -56,13 +60,28 @@ class TokenResponseModel(BaseModel):
 @dataclass
 class Services():
     users: UsersService
+    # When set, get_current_user reads the user without blocking the event loop
+    async_users: AsyncUsersService = None
+    # When set, access tokens carry the user's admin flag and team names,
+    # and get_current_user trusts them while their version is current
+    teams: TeamsService = None
+    claims: ClaimsVersion = None
 
 
 services = Services(None)
 
+# Google's certs are fetched once per their max-age instead of on every sign-in
+certs_request = CachingRequest()
 
-def set_services(users_service: UsersService):
+
+def set_services(users_service: UsersService,
+                 async_users_service: AsyncUsersService = None,
+                 teams_service: TeamsService = None,
+                 claims_version: ClaimsVersion = None):
     services.users = users_service
+    services.async_users = async_users_service
+    services.teams = teams_service
+    services.claims = claims_version
 
 
 # oauth2_scheme dependency alllows fastapi to interrogate the Authorization: Beaarer <token>
@@ -110,10 +129,11 @@ def id_token_verify(
         return None
     try:
         # Specify the CLIENT_ID of the app that accesses the backend:
-        idinfo = id_token.verify_oauth2_token(
+        idinfo = id_token.verify_token(
             g_token_request.token,
-            requests.Request(),
-            ConfigStore.GOOGLE_CLIENT_ID)
+            certs_request,
+            ConfigStore.GOOGLE_CLIENT_ID,
+            certs_url=ConfigStore.GOOGLE_CERTS_URL)
 
         # Or, if multiple clients access the backend server:
         # idinfo = id_token.verify_oauth2_token(token, requests.Request())
@@ -133,8 +153,11 @@ def id_token_verify(
             # when authenticated, return a fresh access token and a refresh token
             # https://blog.tecladocode.com/jwt-authentication-and-token-refreshing-in-rest-apis/
             access_token_expires = timedelta(minutes=ConfigStore.ACCESS_TOKEN_EXPIRE_MINUTES)
+            token_data = {"sub": user.uid, "scopes": ['splash']}
+            if services.claims is not None:
+                token_data["authz"] = authorization_claims(user)
             access_token = create_access_token(
-                {"sub": user.uid, "scopes": ['splash']},
+                token_data,
                 expires_delta=access_token_expires)
 
             response = TokenResponseModel(
@@ -165,6 +188,37 @@ def validate_info(token):
         raise OauthVerificationError('user email not verified')
 
 
+def authorization_claims(user: User) -> dict:
+    """The claims that let get_current_user authorize `user` without reading them.
+    The version is read before the teams, so a team written in between makes the
+    claims stale rather than trusted"""
+    version = services.claims.current(user.uid)
+    teams = services.teams.get_user_teams(user, user.uid)
+    return {
+        "admin": user.splash_md.admin is True,
+        "teams": [team.name for team in teams],
+        "v": version,
+    }
+
+
+async def user_from_claims(user_uid: str, claims: Optional[dict]) -> Optional[TokenUser]:
+    """Returns the user described by the claims of an access token,
+    or None if there are none or they are out of date"""
+    if claims is None or services.claims is None:
+        return None
+    version = services.claims.cached(user_uid)
+    if version is None:
+        # Reading the version blocks, so keep it off the event loop
+        version = await run_in_threadpool(services.claims.current, user_uid)
+    if claims.get("v") != version:
+        return None
+    return TokenUser.construct(
+        uid=user_uid,
+        splash_md=UserSplashMd.construct(admin=claims["admin"]),
+        teams=claims["teams"],
+    )
+
+
 def create_access_token(
             data: dict,
             expires_delta: Optional[timedelta] = None):
@@ -203,7 +257,12 @@ async def get_current_user(
     except JWTError as e:
         logger.error("exception loggine in", exc_info=e)
         raise credentials_exception
-    user = services.users.insecure_get_user(user_uid)
+    # Claims that are still current save reading the user
+    user = await user_from_claims(user_uid, payload.get("authz"))
+    if user is None and services.async_users is not None:
+        user = await services.async_users.insecure_get_user(user_uid)
+    elif user is None:
+        user = services.users.insecure_get_user(user_uid)
 
     if user is None:
         raise credentials_exception
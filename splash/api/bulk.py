@@ -0,0 +1,115 @@
+from enum import Enum
+from typing import Any, Callable, List, Optional, Type
+
+from pydantic import BaseModel, ValidationError, conlist
+
+from .config import ConfigStore
+
+
+class BulkOperationType(str, Enum):
+    create = "create"
+    update = "update"
+    archive = "archive"
+    restore = "restore"
+
+
+class BulkOperation(BaseModel):
+    op: BulkOperationType
+    # Required by every operation except create
+    uid: Optional[str]
+    # Makes an update, archive or restore conditional, like the If-Match header
+    etag: Optional[str]
+    # Body of a create or update, validated like the body of POST or PUT
+    data: Optional[dict]
+
+
+class BulkRequest(BaseModel):
+    operations: conlist(BulkOperation, min_items=1, max_items=ConfigStore.BULK_MAX_OPERATIONS)
+
+
+class BulkResult(BaseModel):
+    uid: Optional[str]
+    splash_md: Optional[dict]
+    # Set when the operation failed, e.g. `validation_error`, `not_found` or `etag_mismatch_error`
+    err: Optional[str]
+    detail: Optional[Any]
+    # Current etag of the document when `err` is `etag_mismatch_error`
+    etag: Optional[str]
+
+
+def run_bulk(
+    service,
+    current_user,
+    operations: List[BulkOperation],
+    new_model: Type[BaseModel],
+    update_model: Type[BaseModel],
+    to_service: Callable[[BaseModel], Any] = None,
+) -> List[BulkResult]:
+    """Validates each operation and sends the valid ones to the service's bulk methods.
+
+    Operations of the same kind go to the database in one call, creates first,
+    then updates, archives and restores, so a document should appear only once
+    per request. Results come back in the order of `operations`.
+
+    `to_service` converts a validated body into what the service expects,
+    by default the model itself is passed."""
+    results, batches = _validate_operations(operations, new_model, update_model, to_service)
+    for op, batch in batches.items():
+        if len(batch) > 0:
+            _collect(results, batch, _bulk_call(service, current_user, op, batch))
+    return results
+
+
+async def run_bulk_async(
+    service,
+    current_user,
+    operations: List[BulkOperation],
+    new_model: Type[BaseModel],
+    update_model: Type[BaseModel],
+    to_service: Callable[[BaseModel], Any] = None,
+) -> List[BulkResult]:
+    """Same as `run_bulk`, for the async services"""
+    results, batches = _validate_operations(operations, new_model, update_model, to_service)
+    for op, batch in batches.items():
+        if len(batch) > 0:
+            _collect(results, batch, await _bulk_call(service, current_user, op, batch))
+    return results
+
+
+def _validate_operations(operations, new_model, update_model, to_service):
+    if to_service is None:
+        to_service = lambda model: model  # noqa: E731
+    results = [None] * len(operations)
+    # Ordered as the operations are applied
+    batches = {op: [] for op in BulkOperationType}
+    for index, operation in enumerate(operations):
+        if operation.op != BulkOperationType.create and operation.uid is None:
+            results[index] = BulkResult(err="validation_error", detail=f"`{operation.op.value}` requires a uid")
+            continue
+        try:
+            if operation.op == BulkOperationType.create:
+                item = to_service(new_model.parse_obj(operation.data or {}))
+            elif operation.op == BulkOperationType.update:
+                data = to_service(update_model.parse_obj(operation.data or {}))
+                item = {"uid": operation.uid, "data": data, "etag": operation.etag}
+            else:
+                item = {"uid": operation.uid, "etag": operation.etag}
+        except ValidationError as e:
+            results[index] = BulkResult(uid=operation.uid, err="validation_error", detail=e.errors())
+            continue
+        batches[operation.op].append((index, item))
+    return results, batches
+
+
+def _bulk_call(service, current_user, op: BulkOperationType, batch: list):
+    items = [item for _, item in batch]
+    if op == BulkOperationType.create:
+        return service.bulk_create(current_user, items)
+    if op == BulkOperationType.update:
+        return service.bulk_update(current_user, items)
+    return service.bulk_archive_action(current_user, op.value, items)
+
+
+def _collect(results: list, batch: list, service_results: list):
+    for (index, _), result in zip(batch, service_results):
+        results[index] = BulkResult(**result)
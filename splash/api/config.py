@@ -10,6 +10,9 @@ class ConfigStore():
     # Client ID used to validate google tokens
     GOOGLE_CLIENT_ID = config("GOOGLE_CLIENT_ID", cast=str, default="foobar")
 
+    # Where the keys that sign google tokens are fetched from
+    GOOGLE_CERTS_URL = config("GOOGLE_CERTS_URL", cast=str, default="https://www.googleapis.com/oauth2/v1/certs")
+
     # Client secret used to validate google tokens during OCID access check
     GOOGLE_CLIENT_SECRET = config("GOOGLE_CLIENT_SECRET", cast=str, default="foobar")
 
@@ -25,4 +28,50 @@ class ConfigStore():
     # EXPERIMENTAL auth token redirect url for verifiying token
     OAUTH_TOKEN_URL = config("OAUTH_TOKEN_URL", cast=str, default="http://localhost:8080/api/idtokensignin/verifier")
 
+    # Serve pages, references, users and teams from async routes on Motor instead of
+    # sync routes on pymongo, so that concurrency is not capped by the threadpool
+    ASYNC_ROUTES = config("ASYNC_ROUTES", cast=bool, default=False)
+
+    # Save page versions and their history entries in one transaction.
+    # Needs MONGO_DB_URI to point at a replica set or a sharded cluster
+    MONGO_TRANSACTIONS = config("MONGO_TRANSACTIONS", cast=bool, default=False)
+
+    # Store page history as deltas, so that rebuilding an old version applies at most
+    # this many. 0 stores every version whole. See scripts/compress_history.py
+    PAGES_HISTORY_DELTA_LIMIT = config("PAGES_HISTORY_DELTA_LIMIT", cast=int, default=0)
+
+    # Seconds that an authenticated user is cached for. Users edited through another
+    # server process can be seen with their old admin flag or disabled state for this long
+    USER_CACHE_TTL = config("USER_CACHE_TTL", cast=int, default=30)
+
+    # Seconds that the teams of a user are cached for by the runs routes. Team changes
+    # made through another server process can take this long to grant or revoke access
+    TEAM_MEMBERSHIP_CACHE_TTL = config("TEAM_MEMBERSHIP_CACHE_TTL", cast=int, default=60)
+
+    # Threads that project the run summaries of a /runs listing, and the seconds
+    # a listing waits for them. Runs that take longer are left out of the page
+    RUNS_SUMMARY_WORKERS = config("RUNS_SUMMARY_WORKERS", cast=int, default=8)
+    RUNS_SUMMARY_TIMEOUT = config("RUNS_SUMMARY_TIMEOUT", cast=float, default=10.0)
+
+    # Seconds between passes of the catalog indexer, which stores the summaries of new
+    # runs before they are listed, on this many threads. 0 leaves it off. Turn it on in
+    # one server process only, or run scripts/index_catalogs.py instead
+    RUNS_INDEXER_INTERVAL = config("RUNS_INDEXER_INTERVAL", cast=float, default=0)
+    RUNS_INDEXER_WORKERS = config("RUNS_INDEXER_WORKERS", cast=int, default=4)
+
+    # Pages and references read by uid cached in each server process. 0 leaves the cache off.
+    # Writes only clear the cache of the process that made them, so this is only safe when
+    # a single server process (one gunicorn worker) serves the api. Otherwise other processes
+    # keep serving the old body and etag, and old page versions can not be found
+    DOCUMENT_CACHE_SIZE = config("DOCUMENT_CACHE_SIZE", cast=int, default=0)
+
+    # Put the user's admin flag and team names in access tokens, so that requests are
+    # authorized without reading the user or their teams. A write to a user, or to a team
+    # they are or were in, makes their tokens issued before it fall back to reading them,
+    # until they sign in again
+    TOKEN_CLAIMS = config("TOKEN_CLAIMS", cast=bool, default=False)
+
+    # Most operations accepted in one request to a /bulk endpoint
+    BULK_MAX_OPERATIONS = config("BULK_MAX_OPERATIONS", cast=int, default=1000)
+
     SPLASH_LOG_LEVEL = config("SPLASH_LOG_LEVEL", cast=str, default="INFO")
\ No newline at end of file
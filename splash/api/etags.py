@@ -0,0 +1,37 @@
+from typing import Optional
+
+from fastapi import Header, Response
+
+# Clients that cached a document can send its etag back in If-None-Match
+# and get a 304 without the body when the document has not changed
+
+
+def etag_header(etag: str) -> str:
+    return f'"{etag}"'
+
+
+def strip_etag(value: str) -> str:
+    """Returns the bare splash_md.etag from an etag as sent in a header, which may be quoted or weak"""
+    value = value.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        value = value[1:-1]
+    return value
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return any(strip_etag(candidate) == etag for candidate in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag_header(etag)})
+
+
+def if_match_etag(if_match: Optional[str] = Header(None)) -> Optional[str]:
+    """Dependency that reads If-Match, so that the value of an ETag header can be sent back as it is"""
+    if if_match is None:
+        return None
+    return strip_etag(if_match)
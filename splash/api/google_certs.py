@@ -0,0 +1,100 @@
+import logging
+import re
+import threading
+import time
+
+from google.auth import transport
+from google.auth.transport import requests as google_requests
+import requests
+
+logger = logging.getLogger("splash.auth")
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class _CachedResponse(transport.Response):
+    def __init__(self, status, headers, data):
+        self._status = status
+        self._headers = headers
+        self._data = data
+
+    @property
+    def status(self):
+        return self._status
+
+    @property
+    def headers(self):
+        return self._headers
+
+    @property
+    def data(self):
+        return self._data
+
+
+class CachingRequest(transport.Request):
+    """A google-auth transport that keeps GET responses for as long as their
+    Cache-Control max-age allows, for verifying id tokens against Google's certs.
+
+    All requests go through one pooled requests.Session. A response that is used
+    within `refresh_ahead` seconds of expiring is fetched again on a background
+    thread, so sign-ins don't wait on the certs endpoint while it is up."""
+
+    def __init__(self, session: requests.Session = None, refresh_ahead: float = 300, clock=time.monotonic):
+        self._request = google_requests.Request(session=session or requests.Session())
+        self.refresh_ahead = refresh_ahead
+        self._clock = clock
+        self._responses = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.fetches = 0
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        if method != "GET" or body is not None:
+            return self._request(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+        with self._lock:
+            cached = self._responses.get(url)
+        now = self._clock()
+        if cached is not None and now < cached[0]:
+            if cached[0] - now < self.refresh_ahead:
+                self._refresh_in_background(url, headers, timeout)
+            return cached[1]
+        return self._fetch(url, headers, timeout)
+
+    def _fetch(self, url, headers=None, timeout=None):
+        response = self._request(url, method="GET", headers=headers, timeout=timeout)
+        cached = _CachedResponse(response.status, dict(response.headers), response.data)
+        max_age = _max_age(cached.headers)
+        with self._lock:
+            if cached.status == 200 and max_age is not None:
+                self._responses[url] = (self._clock() + max_age, cached)
+            self.fetches += 1
+        return cached
+
+    def _refresh_in_background(self, url, headers, timeout):
+        with self._lock:
+            if url in self._refreshing:
+                return
+            self._refreshing.add(url)
+        threading.Thread(target=self._refresh, args=(url, headers, timeout), daemon=True).start()
+
+    def _refresh(self, url, headers, timeout):
+        try:
+            self._fetch(url, headers, timeout)
+        except Exception as e:
+            # The cached response stays in use until it expires
+            logger.warning(f"refreshing {url} failed", exc_info=e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(url)
+
+
+def _max_age(headers: dict):
+    for name, value in headers.items():
+        if name.lower() != "cache-control":
+            continue
+        if "no-store" in value or "no-cache" in value:
+            return None
+        match = _MAX_AGE.search(value)
+        if match is not None:
+            return int(match.group(1))
+    return None
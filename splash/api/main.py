@@ -5,25 +5,45 @@ from fastapi.responses import JSONResponse
 
 from fastapi.encoders import jsonable_encoder
 
-from splash.service.base import EtagMismatchError
+from splash.service.cache import TTLCache, cache_stats
+from splash.service.claims import ClaimsVersion
+from splash.users import User
+from splash.service.base import (
+    BadPageArgument,
+    BadPageToken,
+    BadProjectionArgument,
+    EtagMismatchError,
+    ImmutableMetadataField,
+    InvalidPatchError,
+    UidInDictError,
+)
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Security
 from fastapi.requests import Request
 from .config import ConfigStore
-from splash.api.auth import auth_router, set_services as set_auth_services
+from splash.api.auth import auth_router, get_current_user, set_services as set_auth_services
+from splash.pages.pages_async_routes import set_async_pages_service, async_pages_router
 from splash.pages.pages_routes import set_pages_service, pages_router
-from splash.pages.pages_service import PagesService
+from splash.pages.pages_service import AsyncPagesService, PagesService
+from splash.users.users_async_routes import set_async_users_service, async_users_router
 from splash.users.users_routes import set_users_service, users_router
-from splash.users.users_service import UsersService
+from splash.users.users_service import AsyncUsersService, UsersService
+from splash.references.references_async_routes import (
+    set_async_references_service,
+    async_references_router,
+)
 from splash.references.references_routes import (
     set_references_service,
     references_router,
 )
-from splash.references.references_service import ReferencesService
+from splash.references.references_service import AsyncReferencesService, ReferencesService
 from splash.runs.runs_routes import set_runs_service, runs_router
+from splash.runs.indexer import CatalogIndexer
+from splash.runs.run_summaries import RunSummaries
 from splash.runs.runs_service import RunsService, TeamRunChecker
+from splash.teams.teams_async_routes import set_async_teams_service, async_teams_router
 from splash.teams.teams_routes import set_teams_service, teams_router
-from splash.teams.teams_service import TeamsService
+from splash.teams.teams_service import AsyncTeamsService, TeamsService
 
 logger = logging.getLogger("splash")
 db = None
@@ -61,20 +81,73 @@ def setup_services():
     db_uri = ConfigStore.MONGO_DB_URI
     db = MongoClient(db_uri).splash
     users_svc = UsersService(db, "users")
+    user_cache = TTLCache(UsersService.user_cache_size, ConfigStore.USER_CACHE_TTL)
+    users_svc.set_user_cache(user_cache)
     pages_svc = PagesService(db, "pages", "pages_old")
+    pages_svc.history_transactions = ConfigStore.MONGO_TRANSACTIONS
+    pages_svc.history_delta_limit = ConfigStore.PAGES_HISTORY_DELTA_LIMIT
     references_svc = ReferencesService(db, "references")
     teams_svc = TeamsService(db, "teams")
-    runs_svc = RunsService(teams_svc, TeamRunChecker())
+    document_cache = None
+    if ConfigStore.DOCUMENT_CACHE_SIZE > 0:
+        # Keyed by collection and uid, so the sync and async services can share it
+        document_cache = TTLCache(ConfigStore.DOCUMENT_CACHE_SIZE, PagesService.document_cache_ttl)
+        pages_svc.set_document_cache(document_cache)
+        references_svc.set_document_cache(document_cache)
+    run_summaries = RunSummaries(db, "run_summaries")
+    runs_svc = RunsService(teams_svc, TeamRunChecker(), run_summaries)
+    membership_cache = TTLCache(RunsService.membership_cache_size, ConfigStore.TEAM_MEMBERSHIP_CACHE_TTL)
+    runs_svc.set_membership_cache(membership_cache)
+    runs_svc.summary_workers = ConfigStore.RUNS_SUMMARY_WORKERS
+    runs_svc.summary_timeout = ConfigStore.RUNS_SUMMARY_TIMEOUT
+    claims_version = None
+    if ConfigStore.TOKEN_CLAIMS:
+        claims_version = ClaimsVersion(db)
+        users_svc.set_claims_version(claims_version)
+        teams_svc.set_claims_version(claims_version)
     logger.info(f"setting MONGO_DB_URI {db_uri}")
     logger.info(f"setting db {db}")
 
-    set_auth_services(users_svc)
     set_pages_service(pages_svc)
     set_references_service(references_svc)
     set_runs_service(runs_svc)
     set_teams_service(teams_svc)
     set_users_service(users_svc)
 
+    if ConfigStore.RUNS_INDEXER_INTERVAL > 0:
+        CatalogIndexer(
+            runs_svc,
+            run_summaries,
+            db,
+            workers=ConfigStore.RUNS_INDEXER_WORKERS,
+            interval=ConfigStore.RUNS_INDEXER_INTERVAL,
+        ).start()
+
+    if not ConfigStore.ASYNC_ROUTES:
+        set_auth_services(users_svc, teams_service=teams_svc, claims_version=claims_version)
+        return
+    # The sync services above still create the indexes and serve auth tokens and runs
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async_db = AsyncIOMotorClient(db_uri).splash
+    async_users_svc = AsyncUsersService(async_db, "users")
+    async_users_svc.set_user_cache(user_cache)
+    async_users_svc.set_claims_version(claims_version)
+    set_auth_services(users_svc, async_users_svc, teams_svc, claims_version)
+    async_pages_svc = AsyncPagesService(async_db, "pages", "pages_old")
+    async_pages_svc.history_transactions = ConfigStore.MONGO_TRANSACTIONS
+    async_pages_svc.history_delta_limit = ConfigStore.PAGES_HISTORY_DELTA_LIMIT
+    async_pages_svc.set_document_cache(document_cache)
+    set_async_pages_service(async_pages_svc)
+    async_references_svc = AsyncReferencesService(async_db, "references")
+    async_references_svc.set_document_cache(document_cache)
+    set_async_references_service(async_references_svc)
+    async_teams_svc = AsyncTeamsService(async_db, "teams")
+    async_teams_svc.set_claims_version(claims_version)
+    async_teams_svc.set_membership_cache(membership_cache)
+    set_async_teams_service(async_teams_svc)
+    set_async_users_service(async_users_svc)
+
 
 @app.exception_handler(EtagMismatchError)
 async def handle_wrong_etag(response, exc):
@@ -90,11 +163,52 @@ async def handle_wrong_etag(response, exc):
     )
 
 
+@app.exception_handler(BadPageArgument)
+@app.exception_handler(BadPageToken)
+async def handle_bad_page(response, exc):
+    return JSONResponse(
+        status_code=422,
+        content={"err": "bad_page_argument", "detail": exc.args[0]},
+    )
+
+
+@app.exception_handler(BadProjectionArgument)
+async def handle_bad_projection(response, exc):
+    return JSONResponse(
+        status_code=422,
+        content={"err": "bad_projection_argument", "detail": exc.args[0]},
+    )
+
+
+@app.exception_handler(InvalidPatchError)
+async def handle_invalid_patch(response, exc):
+    return JSONResponse(
+        status_code=422,
+        content={"err": "invalid_patch", "detail": exc.args[0]},
+    )
+
+
+@app.exception_handler(UidInDictError)
+@app.exception_handler(ImmutableMetadataField)
+async def handle_metadata_in_body(response, exc):
+    return JSONResponse(
+        status_code=422,
+        content={"err": "validation_error", "detail": exc.args[0]},
+    )
+
+
 @app.get("/api/v1/settings")
 async def get_settings():
     return {"google_client_id": ConfigStore.GOOGLE_CLIENT_ID}
 
 
+@app.get("/api/v1/metrics/caches")
+async def get_cache_metrics(current_user: User = Security(get_current_user)):
+    if current_user.splash_md.admin is not True:
+        raise HTTPException(status_code=403, detail="user is not an admin")
+    return cache_stats()
+
+
 app.include_router(
     auth_router,
     prefix="/api/v1/idtokensignin",
@@ -103,14 +217,14 @@ app.include_router(
 )
 
 app.include_router(
-    users_router,
+    async_users_router if ConfigStore.ASYNC_ROUTES else users_router,
     prefix="/api/v1/users",
     tags=["users"],
     responses={404: {"description": "Not found"}},
 )
 
 app.include_router(
-    pages_router,
+    async_pages_router if ConfigStore.ASYNC_ROUTES else pages_router,
     prefix="/api/v1/pages",
     tags=["pages"],
     responses={404: {"description": "Not found"}},
@@ -124,14 +238,14 @@ app.include_router(
 )
 
 app.include_router(
-    teams_router,
+    async_teams_router if ConfigStore.ASYNC_ROUTES else teams_router,
     prefix="/api/v1/teams",
     tags=["teams"],
     responses={404: {"description": "Not found"}},
 )
 
 app.include_router(
-    references_router,
+    async_references_router if ConfigStore.ASYNC_ROUTES else references_router,
     prefix="/api/v1/references",
     tags=["references"],
     responses={404: {"description": "Not found"}},
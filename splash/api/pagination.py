@@ -0,0 +1,39 @@
+from enum import Enum
+from typing import List
+
+from fastapi import Response
+from pydantic import parse_obj_as
+
+from .projection import partial_response
+
+# Header holding the opaque token that a client passes back as `?next=` to get the following page
+NEXT_PAGE_HEADER = "X-Next-Page-Token"
+
+# Header holding the number of documents in the whole listing, sent when the client asks with `?count=`
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+
+class CountMode(str, Enum):
+    exact = "exact"
+    # Unfiltered listings are counted from the collection metadata, archived documents included
+    estimated = "estimated"
+
+
+def add_next_page_header(response: Response, service, results: list, page_size: int):
+    # A short page is the last one, so there is nothing to continue from
+    if len(results) > 0 and len(results) == page_size:
+        response.headers[NEXT_PAGE_HEADER] = service.page_token(results[-1])
+
+
+def add_total_count_header(response: Response, total: int):
+    response.headers[TOTAL_COUNT_HEADER] = str(total)
+
+
+def list_response(response: Response, service, documents: list, page_size: int, model, partial_model, fields=None):
+    """Returns one page of a listing validated as a list of `model`, or of `partial_model`
+    when it was read with `fields`, and adds the header of the next page"""
+    results = parse_obj_as(List[model if fields is None else partial_model], documents)
+    add_next_page_header(response, service, results, page_size)
+    if fields is not None:
+        return partial_response(results, response)
+    return results
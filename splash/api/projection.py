@@ -0,0 +1,25 @@
+from typing import List, Optional
+
+from fastapi import Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+
+def fields_query(
+        fields: Optional[str] = Query(
+            None, description="comma separated list of top level fields to return, e.g. `title,page_type`")
+) -> Optional[List[str]]:
+    """Dependency that reads the `fields` query parameter as a list of field names"""
+    if fields is None:
+        return None
+    return [field.strip() for field in fields.split(",") if field.strip() != ""]
+
+
+def partial_response(content, response: Response) -> JSONResponse:
+    """Serializes documents read with a projection. Fields that were not read are
+    left out rather than returned as null, which the route's response model would do"""
+    partial = JSONResponse(jsonable_encoder(content, exclude_unset=True))
+    for key, value in response.headers.items():
+        if key != "content-length":
+            partial.headers[key] = value
+    return partial
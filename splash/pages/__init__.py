@@ -1,7 +1,8 @@
 from pydantic.types import StrictBool
 from splash.service import CreatedVersionedDocument
-from typing import List
-from pydantic import BaseModel, Extra, constr
+from typing import List, Optional
+from pydantic import BaseModel, Extra, constr, validator
+from splash.service.models import partial_model, reject_null
 
 
 class ReferenceDois(BaseModel):
@@ -23,5 +24,20 @@ class UpdatePage(NewPage):
     pass
 
 
+class PatchPage(BaseModel):
+    page_type: Optional[constr(min_length=1)]
+    title: Optional[constr(min_length=1)]
+    documentation: Optional[constr(min_length=1)]
+    references: Optional[List[ReferenceDois]]
+
+    _not_null = validator("*", pre=True, allow_reuse=True)(reject_null)
+
+    class Config:
+        extra = Extra.forbid
+
+
 class Page(NewPage, CreatedVersionedDocument):
     pass
+
+
+PartialPage = partial_model(Page)
@@ -0,0 +1,259 @@
+from typing import List, Optional, Union
+
+from attr import dataclass
+from fastapi import APIRouter, Depends, HTTPException, Response, Security
+from fastapi.param_functions import Header, Query
+from pydantic import parse_obj_as
+from starlette.responses import JSONResponse
+
+from splash.api.auth import get_current_user
+from splash.api.bulk import BulkRequest, BulkResult, run_bulk_async
+from splash.api.models import PatchBody
+from splash.api.pagination import NEXT_PAGE_HEADER, CountMode, add_total_count_header, list_response
+from splash.api.etags import etag_header, etag_matches, if_match_etag, not_modified
+from splash.api.projection import fields_query, partial_response
+from . import Page, NewPage, PartialPage, PatchPage, UpdatePage
+from .pages_routes import CreatePageResponse, NumVersionsResponse
+from .pages_service import AsyncPagesService
+from ..service.base import ArchiveConflictError, ObjectNotFoundError, RestoreConflictError, VersionNotFoundError
+from ..service.models import EditElement, VersionDiff, VersionElement
+from ..users import User
+
+# Same routes as pages_routes, served from the event loop by AsyncPagesService
+async_pages_router = APIRouter()
+
+
+@dataclass
+class Services:
+    pages: AsyncPagesService
+
+
+services = Services(None)
+
+
+def set_async_pages_service(pages_svc: AsyncPagesService):
+    services.pages = pages_svc
+
+
+@async_pages_router.get("", tags=["pages"], response_model=List[Page])
+async def read_pages(
+    response: Response,
+    current_user: User = Security(get_current_user),
+    page: Optional[int] = Query(1, gt=0),
+    page_size: Optional[int] = Query(10, gt=0),
+    after: Optional[str] = Query(None, alias="next"),
+    fields: Optional[List[str]] = Depends(fields_query),
+    count: Optional[CountMode] = Query(None),
+):
+    pages = services.pages.retrieve_multiple(
+        current_user, page=page, page_size=page_size, after=after, fields=fields
+    )
+    if count is not None:
+        total = await services.pages.count(current_user, estimated=count == CountMode.estimated)
+        add_total_count_header(response, total)
+    results = [page async for page in pages]
+    return list_response(response, services.pages, results, page_size, Page, PartialPage, fields)
+
+
+@async_pages_router.get(
+    "/num_versions/{uid}", tags=["pages"], response_model=NumVersionsResponse
+)
+async def get_num_versions(uid: str, current_user: User = Security(get_current_user)):
+    try:
+        num_versions = await services.pages.get_num_versions(current_user, uid)
+    except ObjectNotFoundError:
+        raise HTTPException(status_code=404, detail="object not found")
+    return NumVersionsResponse(number=num_versions)
+
+
+@async_pages_router.get("/page_type/{page_type}", tags=["pages"], response_model=List[Page])
+async def get_pages_by_type(
+    page_type: str,
+    response: Response,
+    current_user: User = Security(get_current_user),
+    page: Optional[int] = Query(1, gt=0),
+    page_size: Optional[int] = Query(10, gt=0),
+    after: Optional[str] = Query(None, alias="next"),
+    fields: Optional[List[str]] = Depends(fields_query),
+    count: Optional[CountMode] = Query(None),
+):
+    pages = services.pages.retrieve_by_page_type(
+        current_user, page_type, page, page_size, after=after, fields=fields
+    )
+    if count is not None:
+        add_total_count_header(response, await services.pages.count_by_page_type(current_user, page_type))
+    results = [page async for page in pages]
+    return list_response(response, services.pages, results, page_size, Page, PartialPage, fields)
+
+
+@async_pages_router.get("/archived", tags=["pages"], response_model=List[Page])
+async def retrieve_archived_pages(
+    current_user: User = Security(get_current_user),
+    page: Optional[int] = Query(1, gt=0),
+    page_size: Optional[int] = Query(10, gt=0),
+):
+    pages = services.pages.retrieve_archived(current_user, page, page_size)
+    return parse_obj_as(List[Page], [page async for page in pages])
+
+
+@async_pages_router.get("/{uid}/edits", tags=["pages"], response_model=List[EditElement])
+async def read_page_edits(
+    uid: str,
+    current_user: User = Security(get_current_user),
+    page: Optional[int] = Query(1, gt=0),
+    page_size: Optional[int] = Query(10, gt=0),
+):
+    try:
+        edits = await services.pages.retrieve_edits(current_user, uid, page, page_size)
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="object not found",
+        )
+    return [edit async for edit in edits]
+
+
+@async_pages_router.get("/{uid}/versions", tags=["pages"], response_model=List[VersionElement])
+async def read_page_versions(
+    uid: str,
+    response: Response,
+    current_user: User = Security(get_current_user),
+    page_size: Optional[int] = Query(10, gt=0),
+    after: Optional[str] = Query(None, alias="next"),
+):
+    # Only the metadata of each version is read, see retrieve_version for the documents
+    try:
+        versions = await services.pages.retrieve_versions(current_user, uid, page_size=page_size, after=after)
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="object not found",
+        )
+    if len(versions) == page_size and versions[-1]["splash_md"]["version"] > 1:
+        response.headers[NEXT_PAGE_HEADER] = services.pages.version_page_token(versions[-1])
+    return versions
+
+
+@async_pages_router.get("/{uid}/diff", tags=["pages"], response_model=VersionDiff, response_model_exclude_unset=True)
+async def read_page_diff(
+    uid: str,
+    from_version: int = Query(..., alias="from", gt=0),
+    to_version: int = Query(..., alias="to", gt=0),
+    current_user: User = Security(get_current_user),
+):
+    try:
+        return await services.pages.diff_versions(current_user, uid, from_version, to_version)
+    except VersionNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="version not found",
+        )
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="object not found",
+        )
+
+
+@async_pages_router.get("/{uid}", tags=["pages"])
+async def read_page(
+    uid: str,
+    response: Response,
+    version: Optional[int] = Query(None, gt=0),
+    current_user: User = Security(get_current_user),
+    fields: Optional[List[str]] = Depends(fields_query),
+    if_none_match: Optional[str] = Header(None),
+):
+    # `fields` only applies to the current version, older versions are returned whole
+
+    if version is not None:
+        try:
+            return await services.pages.retrieve_version(current_user, uid, version)
+        except VersionNotFoundError:
+            raise HTTPException(
+                status_code=404,
+                detail="version not found",
+            )
+        except ObjectNotFoundError:
+            raise HTTPException(
+                status_code=404,
+                detail="object not found",
+            )
+    # A projection is a different representation of the document, so only
+    # whole documents are validated against the etag
+    if if_none_match is not None and fields is None:
+        etag = await services.pages.retrieve_etag(current_user, uid)
+        if etag is not None and etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    page = await services.pages.retrieve_one(current_user, uid, fields=fields)
+    if page is None:
+        raise HTTPException(
+            status_code=404,
+            detail="object not found",
+        )
+    if fields is not None:
+        return partial_response(page, response)
+    response.headers["ETag"] = etag_header(page.splash_md.etag)
+    return page
+
+
+@async_pages_router.put(
+    "/{uid}",
+    tags=["pages"],
+    response_model=CreatePageResponse,
+)
+async def replace_page(
+    uid: str,
+    page: UpdatePage,
+    current_user: User = Security(get_current_user),
+    if_match: Optional[str] = Depends(if_match_etag),
+):
+    try:
+        return await services.pages.update(current_user, page, uid, etag=if_match)
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="object not found",
+        )
+
+
+@async_pages_router.patch(
+    "/{uid}",
+    tags=["pages"],
+    response_model=CreatePageResponse,
+)
+async def patch_page(
+    uid: str,
+    patch_body: Union[PatchBody, PatchPage],
+    current_user: User = Security(get_current_user),
+    if_match: Optional[str] = Depends(if_match_etag),
+):
+    try:
+        if isinstance(patch_body, PatchPage):
+            return await services.pages.patch(current_user, patch_body, uid, etag=if_match)
+        return await services.pages.archive_action(current_user, patch_body.archive_action, uid, etag=if_match)
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="object not found",
+        )
+    except ArchiveConflictError:
+        return JSONResponse(
+            status_code=409,
+            content={"err": "already_archived"},
+        )
+    except RestoreConflictError:
+        return JSONResponse(
+            status_code=409,
+            content={"err": "not_archived"},
+        )
+
+
+@async_pages_router.post("", tags=["pages"], response_model=CreatePageResponse)
+async def create_page(new_page: NewPage, current_user: User = Security(get_current_user)):
+    return await services.pages.create(current_user, new_page)
+
+
+@async_pages_router.post("/bulk", tags=["pages"], response_model=List[BulkResult])
+async def bulk_pages(request: BulkRequest, current_user: User = Security(get_current_user)):
+    return await run_bulk_async(services.pages, current_user, request.operations, NewPage, UpdatePage)
@@ -3,17 +3,22 @@ from splash.api.models import PatchBody
 from attr import dataclass
 
 
-from fastapi import APIRouter, Security, HTTPException, Response
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Security, HTTPException, Response
+from typing import List, Optional, Union
 from fastapi.param_functions import Header, Query
 from pydantic import parse_obj_as, BaseModel
 
-from . import Page, NewPage, UpdatePage
+from . import Page, NewPage, PartialPage, PatchPage, UpdatePage
 from ..users import User
 from splash.api.auth import get_current_user
+from splash.api.bulk import BulkRequest, BulkResult, run_bulk
+from splash.api.pagination import NEXT_PAGE_HEADER, CountMode, add_total_count_header, list_response
+from splash.api.etags import etag_header, etag_matches, if_match_etag, not_modified
+from splash.api.projection import fields_query, partial_response
 from .pages_service import PagesService
 from ..service.base import ArchiveConflictError, ObjectNotFoundError, RestoreConflictError, VersionNotFoundError
 from ..service import VersionedSplashMetadata
+from ..service.models import EditElement, VersionDiff, VersionElement
 
 pages_router = APIRouter()
 
@@ -40,15 +45,21 @@ class CreatePageResponse(BaseModel):
 
 @pages_router.get("", tags=["pages"], response_model=List[Page])
 def read_pages(
+    response: Response,
     current_user: User = Security(get_current_user),
     page: Optional[int] = Query(1, gt=0),
     page_size: Optional[int] = Query(10, gt=0),
+    after: Optional[str] = Query(None, alias="next"),
+    fields: Optional[List[str]] = Depends(fields_query),
+    count: Optional[CountMode] = Query(None),
 ):
     pages = services.pages.retrieve_multiple(
-        current_user, page=page, page_size=page_size
+        current_user, page=page, page_size=page_size, after=after, fields=fields
     )
-    results = parse_obj_as(List[Page], list(pages))
-    return results
+    if count is not None:
+        total = services.pages.count(current_user, estimated=count == CountMode.estimated)
+        add_total_count_header(response, total)
+    return list_response(response, services.pages, list(pages), page_size, Page, PartialPage, fields)
 
 
 @pages_router.get(
@@ -65,15 +76,20 @@ def get_num_versions(uid: str, current_user: User = Security(get_current_user)):
 @pages_router.get("/page_type/{page_type}", tags=["pages"], response_model=List[Page])
 def get_pages_by_type(
     page_type: str,
+    response: Response,
     current_user: User = Security(get_current_user),
     page: Optional[int] = Query(1, gt=0),
     page_size: Optional[int] = Query(10, gt=0),
+    after: Optional[str] = Query(None, alias="next"),
+    fields: Optional[List[str]] = Depends(fields_query),
+    count: Optional[CountMode] = Query(None),
 ):
     pages = services.pages.retrieve_by_page_type(
-        current_user, page_type, page, page_size
+        current_user, page_type, page, page_size, after=after, fields=fields
     )
-    results = parse_obj_as(List[Page], list(pages))
-    return results
+    if count is not None:
+        add_total_count_header(response, services.pages.count_by_page_type(current_user, page_type))
+    return list_response(response, services.pages, list(pages), page_size, Page, PartialPage, fields)
 
 
 @pages_router.get("/archived", tags=["pages"], response_model=List[Page])
@@ -89,12 +105,75 @@ def retrieve_archived_pages(
     return results
 
 
+@pages_router.get("/{uid}/edits", tags=["pages"], response_model=List[EditElement])
+def read_page_edits(
+    uid: str,
+    current_user: User = Security(get_current_user),
+    page: Optional[int] = Query(1, gt=0),
+    page_size: Optional[int] = Query(10, gt=0),
+):
+    try:
+        edits = services.pages.retrieve_edits(current_user, uid, page, page_size)
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="object not found",
+        )
+    return list(edits)
+
+
+@pages_router.get("/{uid}/versions", tags=["pages"], response_model=List[VersionElement])
+def read_page_versions(
+    uid: str,
+    response: Response,
+    current_user: User = Security(get_current_user),
+    page_size: Optional[int] = Query(10, gt=0),
+    after: Optional[str] = Query(None, alias="next"),
+):
+    # Only the metadata of each version is read, see retrieve_version for the documents
+    try:
+        versions = services.pages.retrieve_versions(current_user, uid, page_size=page_size, after=after)
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="object not found",
+        )
+    if len(versions) == page_size and versions[-1]["splash_md"]["version"] > 1:
+        response.headers[NEXT_PAGE_HEADER] = services.pages.version_page_token(versions[-1])
+    return versions
+
+
+@pages_router.get("/{uid}/diff", tags=["pages"], response_model=VersionDiff, response_model_exclude_unset=True)
+def read_page_diff(
+    uid: str,
+    from_version: int = Query(..., alias="from", gt=0),
+    to_version: int = Query(..., alias="to", gt=0),
+    current_user: User = Security(get_current_user),
+):
+    try:
+        return services.pages.diff_versions(current_user, uid, from_version, to_version)
+    except VersionNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="version not found",
+        )
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="object not found",
+        )
+
+
 @pages_router.get("/{uid}", tags=["pages"])
 def read_page(
     uid: str,
+    response: Response,
     version: Optional[int] = Query(None, gt=0),
     current_user: User = Security(get_current_user),
+    fields: Optional[List[str]] = Depends(fields_query),
+    if_none_match: Optional[str] = Header(None),
 ):
+    # `fields` only applies to the current version, older versions are returned whole
 
     if version is not None:
         try:
@@ -111,12 +190,21 @@ def read_page(
             )
         return page
     else:
-        page = services.pages.retrieve_one(current_user, uid)
+        # A projection is a different representation of the document, so only
+        # whole documents are validated against the etag
+        if if_none_match is not None and fields is None:
+            etag = services.pages.retrieve_etag(current_user, uid)
+            if etag is not None and etag_matches(if_none_match, etag):
+                return not_modified(etag)
+        page = services.pages.retrieve_one(current_user, uid, fields=fields)
         if page is None:
             raise HTTPException(
                 status_code=404,
                 detail="object not found",
             )
+        if fields is not None:
+            return partial_response(page, response)
+        response.headers["ETag"] = etag_header(page.splash_md.etag)
         return page
 
 
@@ -129,7 +217,7 @@ def replace_page(
     uid: str,
     page: UpdatePage,
     current_user: User = Security(get_current_user),
-    if_match: Optional[str] = Header(None),
+    if_match: Optional[str] = Depends(if_match_etag),
 ):
     try:
         update_response = services.pages.update(current_user, page, uid, etag=if_match)
@@ -149,11 +237,15 @@ def replace_page(
 )
 def patch_page(
     uid: str,
-    patch_body: PatchBody,
+    patch_body: Union[PatchBody, PatchPage],
     current_user: User = Security(get_current_user),
-    if_match: Optional[str] = Header(None),
+    if_match: Optional[str] = Depends(if_match_etag),
 ):
+    # A body with an `archive_action` archives or restores the page,
+    # any other body is a merge patch of the page's fields
     try:
+        if isinstance(patch_body, PatchPage):
+            return services.pages.patch(current_user, patch_body, uid, etag=if_match)
         archive_response = services.pages.archive_action(current_user, patch_body.archive_action, uid, etag=if_match)
     except ObjectNotFoundError:
         raise HTTPException(
@@ -179,3 +271,9 @@ def patch_page(
 def create_page(new_page: NewPage, current_user: User = Security(get_current_user)):
     response = services.pages.create(current_user, new_page)
     return response
+
+
+@pages_router.post("/bulk", tags=["pages"], response_model=List[BulkResult])
+def bulk_pages(request: BulkRequest, current_user: User = Security(get_current_user)):
+    # Each operation succeeds or fails on its own, failures are reported in its result
+    return run_bulk(services.pages, current_user, request.operations, NewPage, UpdatePage)
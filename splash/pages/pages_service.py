@@ -1,31 +1,47 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator, List
 
 from pymongo.operations import IndexModel
 from pymongo import ASCENDING, DESCENDING, TEXT
-from . import Page, NewPage, UpdatePage
-from ..service.base import VersionedMongoService
+from . import Page, NewPage, PartialPage, PatchPage, UpdatePage
+from ..service.async_base import AsyncVersionedMongoService
+from ..service.base import VersionedMongoService, collated_sort_index
 from ..users import User
 
 
-class PagesService(VersionedMongoService):
+class PagesServiceMixin:
+    """What PagesService and AsyncPagesService add to their base service without talking to Mongo"""
 
+    default_sort = [("title", ASCENDING), ("splash_md.last_edit", DESCENDING)]
+
+    def retrieve_by_page_type(self,
+                              current_user: User,
+                              page_type: str,
+                              page: int = 1,
+                              page_size=10,
+                              after=None,
+                              fields=None):
+        query = {'page_type': page_type}
+        return self.retrieve_multiple(current_user, page, query, page_size, after=after, fields=fields)
+
+
+class PagesService(PagesServiceMixin, VersionedMongoService):
     def __init__(self, db, collection_name,  versioned_collection_name):
         super().__init__(db, collection_name,  versioned_collection_name)
 
     def _create_indexes(self):
         text_index = IndexModel([("title", TEXT), ("documentation", TEXT)])
-        sort_index = IndexModel([("title", ASCENDING), ("splash_md.last_edit", DESCENDING)])
+        sort_index = collated_sort_index(self.default_sort)
         self._collection.create_indexes([text_index, sort_index])
         super()._create_indexes()
 
     def create(self, current_user: User, page: NewPage) -> str:
         return super().create(current_user, page.dict())
 
-    def retrieve_one(self, current_user: User, uid: str) -> Page:
-        Page_dict = super().retrieve_one(current_user, uid)
-        if Page_dict is None:
-            return None
-        return Page(**Page_dict)
+    def bulk_create(self, current_user: User, pages: List[NewPage]) -> list:
+        return super().bulk_create(current_user, [page.dict() for page in pages])
+
+    def retrieve_one(self, current_user: User, uid: str, fields=None) -> Page:
+        return _page_model(super().retrieve_one(current_user, uid, fields=fields), fields)
 
     def retrieve_version(self, current_user: User, uid: str, version):
         return super().retrieve_version(current_user, uid, version)
@@ -38,25 +54,71 @@ class PagesService(VersionedMongoService):
                           page: int = 1,
                           query=None,
                           page_size=10,
-                          sort=[("title", ASCENDING), ("splash_md.last_edit", DESCENDING)]) -> Generator[Page, None, None]:
-        cursor = super().retrieve_multiple(current_user, page, query, page_size, sort)
+                          sort=PagesServiceMixin.default_sort,
+                          after=None,
+                          fields=None) -> Generator[Page, None, None]:
+        cursor = super().retrieve_multiple(current_user, page, query, page_size, sort, after=after, fields=fields)
         for page_dict in cursor:
-            yield Page(**page_dict)
+            yield _page_model(page_dict, fields)
 
-    def retrieve_by_page_type(self,
-                              current_user: User,
-                              page_type: str,
-                              page: int = 1,
-                              page_size=10):
-        query = {'page_type': page_type}
-        return self.retrieve_multiple(current_user, page, query, page_size)
+    def count_by_page_type(self, current_user: User, page_type: str) -> int:
+        return self.count(current_user, {'page_type': page_type})
 
     def update(self, current_user: User, data: UpdatePage, uid: str, etag: str = None):
         return super().update(current_user, data.dict(), uid, etag=etag)
 
+    def bulk_update(self, current_user: User, items: list) -> list:
+        return super().bulk_update(current_user, [{**item, "data": item["data"].dict()} for item in items])
+
+    def patch(self, current_user: User, data: PatchPage, uid: str, etag: str = None):
+        return super().patch(current_user, data.dict(exclude_unset=True), uid, etag=etag)
+
     def delete(self, current_user: User, uid):
         raise NotImplementedError
 
     def get_user_pages(self, request_user: User, uid: str):
         # find Pages that contain the member by uid
         raise NotImplementedError()
+
+
+class AsyncPagesService(PagesServiceMixin, AsyncVersionedMongoService):
+    async def create(self, current_user: User, page: NewPage) -> str:
+        return await super().create(current_user, page.dict())
+
+    async def bulk_create(self, current_user: User, pages: List[NewPage]) -> list:
+        return await super().bulk_create(current_user, [page.dict() for page in pages])
+
+    async def retrieve_one(self, current_user: User, uid: str, fields=None) -> Page:
+        return _page_model(await super().retrieve_one(current_user, uid, fields=fields), fields)
+
+    async def retrieve_multiple(self,
+                                current_user: User,
+                                page: int = 1,
+                                query=None,
+                                page_size=10,
+                                sort=PagesServiceMixin.default_sort,
+                                after=None,
+                                fields=None) -> AsyncGenerator[Page, None]:
+        cursor = super().retrieve_multiple(current_user, page, query, page_size, sort, after=after, fields=fields)
+        async for page_dict in cursor:
+            yield _page_model(page_dict, fields)
+
+    async def count_by_page_type(self, current_user: User, page_type: str) -> int:
+        return await self.count(current_user, {'page_type': page_type})
+
+    async def update(self, current_user: User, data: UpdatePage, uid: str, etag: str = None):
+        return await super().update(current_user, data.dict(), uid, etag=etag)
+
+    async def bulk_update(self, current_user: User, items: list) -> list:
+        return await super().bulk_update(current_user, [{**item, "data": item["data"].dict()} for item in items])
+
+    async def patch(self, current_user: User, data: PatchPage, uid: str, etag: str = None):
+        return await super().patch(current_user, data.dict(exclude_unset=True), uid, etag=etag)
+
+
+def _page_model(page_dict: dict, fields=None):
+    if page_dict is None:
+        return None
+    if fields is not None:
+        return PartialPage(**page_dict)
+    return Page(**page_dict)
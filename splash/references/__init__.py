@@ -2,6 +2,7 @@ from typing import Optional
 
 from pydantic.types import constr
 from splash.service import CreatedDocument
+from splash.service.models import partial_model
 from pydantic import BaseModel, Extra
 
 
@@ -19,3 +20,10 @@ class Reference(NewReference, CreatedDocument):
 
 class UpdateReference(NewReference):
     pass
+
+
+PartialReference = partial_model(Reference)
+
+
+class PatchReference(NewReference):
+    pass
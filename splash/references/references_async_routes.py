@@ -0,0 +1,164 @@
+import json
+from typing import List, Optional
+
+from attr import dataclass
+from fastapi import APIRouter, Depends, Header, Query, Response, Security
+from fastapi.exceptions import HTTPException
+
+from splash.api.auth import get_current_user
+from splash.api.bulk import BulkRequest, BulkResult, run_bulk_async
+from splash.api.pagination import CountMode, add_total_count_header, list_response
+from splash.api.etags import etag_header, etag_matches, if_match_etag, not_modified
+from splash.api.projection import fields_query, partial_response
+from splash.service.base import ObjectNotFoundError, UidInDictError
+from splash.service.models import EditElement
+from . import Reference, NewReference, PartialReference, PatchReference, UpdateReference
+from .references_routes import CreateReferenceResponse
+from .references_service import AsyncReferencesService
+from ..users import User
+
+# Same routes as references_routes, served from the event loop by AsyncReferencesService
+async_references_router = APIRouter()
+
+
+@dataclass
+class Services():
+    references: AsyncReferencesService
+
+
+services = Services(None)
+
+
+def set_async_references_service(references_svc: AsyncReferencesService):
+    services.references = references_svc
+
+
+@async_references_router.get("", tags=["references"], response_model=List[Reference])
+async def read_references(
+        response: Response,
+        current_user: User = Security(get_current_user),
+        page: Optional[int] = Query(1, gt=0),
+        page_size: Optional[int] = Query(10, gt=0),
+        search: Optional[str] = Query(None, max_length=50),
+        after: Optional[str] = Query(None, alias="next"),
+        fields: Optional[List[str]] = Depends(fields_query),
+        count: Optional[CountMode] = Query(None)):
+    if search is not None:
+        references = services.references.search(
+            current_user, search, page=page, page_size=page_size, after=after, fields=fields)
+        if count is not None:
+            add_total_count_header(response, await services.references.count_search(current_user, search))
+    else:
+        references = services.references.retrieve_multiple(
+            current_user, page=page, page_size=page_size, after=after, fields=fields)
+        if count is not None:
+            total = await services.references.count(current_user, estimated=count == CountMode.estimated)
+            add_total_count_header(response, total)
+    results = [reference async for reference in references]
+    return list_response(response, services.references, results, page_size, Reference, PartialReference, fields)
+
+
+@async_references_router.get("/uid/{uid}", tags=['references'])
+async def read_reference_by_uid(
+        uid: str,
+        response: Response,
+        current_user: User = Security(get_current_user),
+        fields: Optional[List[str]] = Depends(fields_query),
+        if_none_match: Optional[str] = Header(None)):
+    # A projection is a different representation of the document, so only
+    # whole documents are validated against the etag
+    if if_none_match is not None and fields is None:
+        etag = await services.references.retrieve_etag(current_user, uid)
+        if etag is not None and etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    reference = await services.references.retrieve_one(current_user, uid, fields=fields)
+    if reference is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Not found",
+        )
+    if fields is not None:
+        return partial_response(reference, response)
+    response.headers["ETag"] = etag_header(reference.splash_md.etag)
+    return reference
+
+
+@async_references_router.get("/uid/{uid}/edits", tags=['references'], response_model=List[EditElement])
+async def read_reference_edits(
+        uid: str,
+        current_user: User = Security(get_current_user),
+        page: Optional[int] = Query(1, gt=0),
+        page_size: Optional[int] = Query(10, gt=0)):
+    try:
+        edits = await services.references.retrieve_edits(current_user, uid, page, page_size)
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="Not found",
+        )
+    return [edit async for edit in edits]
+
+
+@async_references_router.get("/doi/{doi:path}", tags=['references'])
+async def read_reference_by_doi(
+        doi: str,
+        current_user: User = Security(get_current_user)):
+    references = services.references.retrieve_by_doi(current_user, doi=doi)
+    return [reference async for reference in references]
+
+
+@async_references_router.put("/uid/{uid}", tags=['compounds'], response_model=CreateReferenceResponse)
+async def replace_reference_by_uid(
+        uid: str,
+        reference: UpdateReference,
+        current_user: User = Security(get_current_user),
+        if_match: Optional[str] = Depends(if_match_etag)):
+    # See create_reference in references_routes for why the body goes through json
+    try:
+        return await services.references.update(current_user, json.loads(reference.json()), uid=uid, etag=if_match)
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="Not found",
+        )
+
+
+@async_references_router.patch("/uid/{uid}", tags=['references'], response_model=CreateReferenceResponse)
+async def patch_reference_by_uid(
+        uid: str,
+        reference: PatchReference,
+        current_user: User = Security(get_current_user),
+        if_match: Optional[str] = Depends(if_match_etag)):
+    try:
+        return await services.references.patch(
+            current_user, json.loads(reference.json(exclude_unset=True)), uid, etag=if_match)
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="Not found",
+        )
+
+
+@async_references_router.post("", tags=['references'], response_model=CreateReferenceResponse)
+async def create_reference(
+        new_reference: NewReference,
+        current_user: User = Security(get_current_user)):
+    try:
+        return await services.references.create(current_user, json.loads(new_reference.json()))
+    except UidInDictError:
+        raise HTTPException(
+            status_code=422,
+        )
+
+
+@async_references_router.post("/bulk", tags=['references'], response_model=List[BulkResult])
+async def bulk_references(
+        request: BulkRequest,
+        current_user: User = Security(get_current_user)):
+    return await run_bulk_async(
+        services.references,
+        current_user,
+        request.operations,
+        NewReference,
+        UpdateReference,
+        to_service=lambda reference: json.loads(reference.json()))
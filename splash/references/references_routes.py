@@ -1,19 +1,23 @@
 import json
 from attr import dataclass
 
-from fastapi import APIRouter,  Security, Query
+from fastapi import APIRouter, Depends, Security, Query, Response
 from typing import List, Optional
 from fastapi.exceptions import HTTPException
 from fastapi import Header
 from pydantic.main import BaseModel
 
-from pydantic.tools import parse_obj_as
-from . import Reference, NewReference, UpdateReference
+from . import Reference, NewReference, PartialReference, PatchReference, UpdateReference
 from ..users import User
 from splash.api.auth import get_current_user
+from splash.api.bulk import BulkRequest, BulkResult, run_bulk
+from splash.api.pagination import CountMode, add_total_count_header, list_response
+from splash.api.etags import etag_header, etag_matches, if_match_etag, not_modified
+from splash.api.projection import fields_query, partial_response
 from .references_service import ReferencesService
-from splash.service.base import UidInDictError
+from splash.service.base import ObjectNotFoundError, UidInDictError
 from splash.service import SplashMetadata
+from splash.service.models import EditElement
 
 references_router = APIRouter()
 
@@ -36,32 +40,72 @@ def set_references_service(references_svc: ReferencesService):
 
 @references_router.get("", tags=["references"], response_model=List[Reference])
 def read_references(
+        response: Response,
         current_user: User = Security(get_current_user),
         page: Optional[int] = Query(1, gt=0),
         page_size: Optional[int] = Query(10, gt=0),
-        search: Optional[str] = Query(None, max_length=50)):
+        search: Optional[str] = Query(None, max_length=50),
+        after: Optional[str] = Query(None, alias="next"),
+        fields: Optional[List[str]] = Depends(fields_query),
+        count: Optional[CountMode] = Query(None)):
     if search is not None:
-        references = services.references.search(current_user, search, page=page, page_size=page_size)
+        references = services.references.search(
+            current_user, search, page=page, page_size=page_size, after=after, fields=fields)
+        if count is not None:
+            add_total_count_header(response, services.references.count_search(current_user, search))
     else:
-        references = services.references.retrieve_multiple(current_user, page=page, page_size=page_size)
-    results = parse_obj_as(List[Reference], list(references))
-    return results
+        references = services.references.retrieve_multiple(
+            current_user, page=page, page_size=page_size, after=after, fields=fields)
+        if count is not None:
+            total = services.references.count(current_user, estimated=count == CountMode.estimated)
+            add_total_count_header(response, total)
+    return list_response(
+        response, services.references, list(references), page_size, Reference, PartialReference, fields
+    )
 
 
 @ references_router.get("/uid/{uid}", tags=['references'])
 def read_reference_by_uid(
         uid: str,
-        current_user: User = Security(get_current_user)):
-
-    reference_dict = services.references.retrieve_one(current_user, uid)
+        response: Response,
+        current_user: User = Security(get_current_user),
+        fields: Optional[List[str]] = Depends(fields_query),
+        if_none_match: Optional[str] = Header(None)):
+    # A projection is a different representation of the document, so only
+    # whole documents are validated against the etag
+    if if_none_match is not None and fields is None:
+        etag = services.references.retrieve_etag(current_user, uid)
+        if etag is not None and etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    reference_dict = services.references.retrieve_one(current_user, uid, fields=fields)
     if reference_dict is None:
         raise HTTPException(
             status_code=404,
             detail="Not found",
         )
+    if fields is not None:
+        return partial_response(reference_dict, response)
+    response.headers["ETag"] = etag_header(reference_dict.splash_md.etag)
     return reference_dict
 
 
+@references_router.get("/uid/{uid}/edits", tags=['references'], response_model=List[EditElement])
+def read_reference_edits(
+        uid: str,
+        current_user: User = Security(get_current_user),
+        page: Optional[int] = Query(1, gt=0),
+        page_size: Optional[int] = Query(10, gt=0)):
+    try:
+        edits = services.references.retrieve_edits(current_user, uid, page, page_size)
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="Not found",
+        )
+    return list(edits)
+
+
 @ references_router.get("/doi/{doi:path}", tags=['references'])
 def read_reference_by_doi(
         doi: str,
@@ -76,18 +120,38 @@ def read_reference_by_doi(
         )
     return reference_list
 
-@ references_router.put("/uid/{uid}", tags=['compounds'], response_model=CreateReferenceResponse)
+
+@references_router.put("/uid/{uid}", tags=['compounds'], response_model=CreateReferenceResponse)
 def replace_reference_by_uid(
         uid: str,
         reference: UpdateReference,
         current_user: User = Security(get_current_user),
-        if_match: Optional[str] = Header(None)):
+        if_match: Optional[str] = Depends(if_match_etag)):
     # It is necessary to convert to json first, then create a dict,
     #  because if we convert straight to dict
     # There are enum types in the dict that won't serialize when we try to save to Mongo
     # https://github.com/samuelcolvin/pydantic/issues/133
-    response = services.references.update(current_user, json.loads(reference.json()), uid=uid, etag=if_match)
-    if uid is None:
+    try:
+        response = services.references.update(current_user, json.loads(reference.json()), uid=uid, etag=if_match)
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=404,
+            detail="Not found",
+        )
+    return response
+
+
+@references_router.patch("/uid/{uid}", tags=['references'], response_model=CreateReferenceResponse)
+def patch_reference_by_uid(
+        uid: str,
+        reference: PatchReference,
+        current_user: User = Security(get_current_user),
+        if_match: Optional[str] = Depends(if_match_etag)):
+    # Only the fields sent by the client are in the patch, a null removes the field
+    try:
+        response = services.references.patch(
+            current_user, json.loads(reference.json(exclude_unset=True)), uid, etag=if_match)
+    except ObjectNotFoundError:
         raise HTTPException(
             status_code=404,
             detail="Not found",
@@ -111,3 +175,17 @@ def create_reference(
             status_code=422,
         )
     return response
+
+
+@references_router.post("/bulk", tags=['references'], response_model=List[BulkResult])
+def bulk_references(
+        request: BulkRequest,
+        current_user: User = Security(get_current_user)):
+    # Bodies go through json for the same reason as in create_reference
+    return run_bulk(
+        services.references,
+        current_user,
+        request.operations,
+        NewReference,
+        UpdateReference,
+        to_service=lambda reference: json.loads(reference.json()))
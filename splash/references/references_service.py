@@ -2,12 +2,39 @@ from pymongo import TEXT
 import pymongo
 from pymongo.collation import Collation, CollationStrength
 from pymongo.operations import IndexModel
-from . import NewReference, Reference
+from . import NewReference, PartialReference, Reference
+from ..service.async_base import AsyncMongoService
 from ..service.base import MongoService
 from ..users import User
 
 
-class ReferencesService(MongoService):
+class ReferencesServiceMixin:
+    """What ReferencesService and AsyncReferencesService add to their base service without talking to Mongo"""
+
+    def retrieve_by_doi(
+        self,
+        current_user: User,
+        doi,
+        page: int = 1,
+        page_size=10,
+    ):
+        return self.retrieve_multiple(
+            current_user,
+            page=page,
+            page_size=page_size,
+            query={"DOI": doi},
+            # ensure that requests are case insensitive
+            collation=Collation(locale='en_US', strength=CollationStrength.SECONDARY)
+        )
+
+    def search(self, current_user: User, search, page: int = 1, page_size=10, after=None, fields=None):
+        query = {"$text": {"$search": search}}
+        return self.retrieve_multiple(
+            current_user, page=page, page_size=page_size, query=query, after=after, fields=fields
+        )
+
+
+class ReferencesService(ReferencesServiceMixin, MongoService):
     def __init__(self, db, collection_name):
         super().__init__(db, collection_name)
 
@@ -25,11 +52,8 @@ class ReferencesService(MongoService):
     def create(self, current_user: User, reference: NewReference):
         return super().create(current_user=current_user, data=reference)
 
-    def retrieve_one(self, current_user: User, uid) -> Reference:
-        reference_dict = super().retrieve_one(current_user, uid)
-        if reference_dict is None:
-            return None
-        return Reference(**reference_dict)
+    def retrieve_one(self, current_user: User, uid, fields=None) -> Reference:
+        return _reference_model(super().retrieve_one(current_user, uid, fields=fields), fields)
 
     def retrieve_multiple(
         self,
@@ -37,33 +61,18 @@ class ReferencesService(MongoService):
         page: int = 1,
         query=None,
         page_size=10,
-        collation=None
+        collation=None,
+        after=None,
+        fields=None,
     ):
-        cursor = super().retrieve_multiple(current_user, page, query, page_size, collation=collation)
-        for reference_dict in cursor:
-            yield Reference(**reference_dict)
-
-    def retrieve_by_doi(
-        self,
-        current_user: User,
-        doi,
-        page: int = 1,
-        page_size=10,
-    ):
-        return self.retrieve_multiple(
-            current_user,
-            page=page,
-            page_size=page_size,
-            query={"DOI": doi},
-            # ensure that requests are case insensitive
-            collation=Collation(locale='en_US', strength=CollationStrength.SECONDARY)
+        cursor = super().retrieve_multiple(
+            current_user, page, query, page_size, collation=collation, after=after, fields=fields
         )
+        for reference_dict in cursor:
+            yield _reference_model(reference_dict, fields)
 
-    def search(self, current_user: User, search, page: int = 1, page_size=10):
-        query = {"$text": {"$search": search}}
-        return self.retrieve_multiple(
-            current_user, page=page, page_size=page_size, query=query
-        )
+    def count_search(self, current_user: User, search) -> int:
+        return self.count(current_user, {"$text": {"$search": search}})
 
     def update(
         self,
@@ -72,12 +81,51 @@ class ReferencesService(MongoService):
         uid,
         etag: str = None,
     ):
-        old_data_dict = self.retrieve_one(current_user, uid)
-        if old_data_dict is None:
-            return None
-        old_data_dict = old_data_dict.dict()
+        return super().update(current_user, data, uid, etag=etag)
 
-        return super().update(current_user, data, old_data_dict["uid"], etag=etag)
+    def patch(self, current_user: User, data: dict, uid, etag: str = None):
+        return super().patch(current_user, data, uid, etag=etag)
 
     def delete(self, current_user: User, uid):
         raise NotImplementedError
+
+
+class AsyncReferencesService(ReferencesServiceMixin, AsyncMongoService):
+    async def create(self, current_user: User, reference: NewReference):
+        return await super().create(current_user=current_user, data=reference)
+
+    async def retrieve_one(self, current_user: User, uid, fields=None) -> Reference:
+        return _reference_model(await super().retrieve_one(current_user, uid, fields=fields), fields)
+
+    async def retrieve_multiple(
+        self,
+        current_user: User,
+        page: int = 1,
+        query=None,
+        page_size=10,
+        collation=None,
+        after=None,
+        fields=None,
+    ):
+        cursor = super().retrieve_multiple(
+            current_user, page, query, page_size, collation=collation, after=after, fields=fields
+        )
+        async for reference_dict in cursor:
+            yield _reference_model(reference_dict, fields)
+
+    async def count_search(self, current_user: User, search) -> int:
+        return await self.count(current_user, {"$text": {"$search": search}})
+
+    async def update(self, current_user: User, data: NewReference, uid, etag: str = None):
+        return await super().update(current_user, data, uid, etag=etag)
+
+    async def delete(self, current_user: User, uid):
+        raise NotImplementedError
+
+
+def _reference_model(reference_dict: dict, fields=None):
+    if reference_dict is None:
+        return None
+    if fields is not None:
+        return PartialReference(**reference_dict)
+    return Reference(**reference_dict)
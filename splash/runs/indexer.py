@@ -0,0 +1,144 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+from .run_summaries import RunSummaries, summary_document
+from .runs_service import RunsService, is_complete, project_run_summary
+
+logger = logging.getLogger("splash.runs_indexer")
+
+
+class CatalogIndexer():
+    """Stores the summaries of new runs in run_summaries ahead of the first listing
+    that asks for them.
+
+    Each pass searches every root catalog for the runs that started after its
+    high-water mark, saved in `checkpoints_name`: the start time up to which every
+    run is stored complete. The mark moves at the end of each pass of a catalog, up
+    to the oldest run that is still open, unless it has been open for over
+    `open_run_limit` seconds. Runs that are stored complete are skipped, so a pass
+    that was interrupted costs one query per batch of runs to catch up on."""
+
+    batch_size = 100
+    open_run_limit = 24 * 60 * 60
+
+    def __init__(self,
+                 runs_service: RunsService,
+                 summaries: RunSummaries,
+                 db,
+                 checkpoints_name: str = "run_index_checkpoints",
+                 workers: int = 4,
+                 interval: float = 60):
+        self.runs_service = runs_service
+        self.summaries = summaries
+        self._checkpoints = db[checkpoints_name]
+        self.workers = workers
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Runs passes every `interval` seconds on a daemon thread until `stop` is called"""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="catalog-indexer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.index_all()
+            except Exception as e:
+                logger.warning("indexing catalogs failed", exc_info=e)
+            self._stopped.wait(self.interval)
+
+    def index_all(self) -> int:
+        """Makes one pass over every root catalog, returns the number of summaries stored"""
+        stored = 0
+        for catalog_name in self.runs_service.list_root_catalogs():
+            if self._stopped.is_set():
+                break
+            try:
+                stored += self.index_catalog(catalog_name)
+            except Exception as e:
+                logger.warning(f"indexing catalog {catalog_name} failed", exc_info=e)
+        return stored
+
+    def index_catalog(self, catalog_name: str) -> int:
+        """Stores the summaries of the runs of `catalog_name` that started after its
+        high-water mark, returns the number stored"""
+        checkpoint = self._checkpoints.find_one({"_id": catalog_name})
+        mark = None if checkpoint is None else checkpoint["time"]
+        query = {} if mark is None else {"time": {"$gt": mark}}
+        runs = self.runs_service.get_catalog(catalog_name).search(query)
+
+        stored = 0
+        done = []
+        held = []
+        batch = []
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="catalog-indexer") as pool:
+            for uid in runs:
+                batch.append(uid)
+                if len(batch) >= self.batch_size:
+                    stored += self._index_batch(pool, catalog_name, runs, batch, done, held)
+                    batch = []
+                    if self._stopped.is_set():
+                        return stored
+            if len(batch) > 0:
+                stored += self._index_batch(pool, catalog_name, runs, batch, done, held)
+
+        # The mark can't pass an open run, it would not be searched for again
+        if len(held) > 0:
+            done = [start_time for start_time in done if start_time < min(held)]
+        if len(done) > 0:
+            # $max leaves a later mark alone
+            self._checkpoints.update_one({"_id": catalog_name}, {"$max": {"time": max(done)}}, upsert=True)
+        return stored
+
+    def _index_batch(self, pool, catalog_name, runs, uids, done, held) -> int:
+        """Stores the summaries of `uids` that are not stored complete yet. Adds the start
+        times of the runs that are done with to `done`, and of open runs to `held`"""
+        existing = self.summaries.get_many(catalog_name, uids)
+        to_index = []
+        for uid in uids:
+            if uid in existing and existing[uid]["complete"]:
+                if existing[uid]["time"] is not None:
+                    done.append(existing[uid]["time"])
+            else:
+                to_index.append(uid)
+        documents = [
+            document for document in pool.map(lambda uid: self._index_run(catalog_name, runs, uid), to_index)
+            if document is not None
+        ]
+        self.summaries.put_many(documents)
+        now = time.time()
+        for document in documents:
+            start_time = document["time"]
+            if start_time is None:
+                # Runs without a start time can neither move the mark nor hold it
+                continue
+            if document["complete"] or now - start_time > self.open_run_limit:
+                done.append(start_time)
+            else:
+                held.append(start_time)
+        return len(documents)
+
+    def _index_run(self, catalog_name, runs, uid):
+        try:
+            run = runs[uid]
+            start = run.metadata['start']
+            data_groups = start.get('data_groups')
+            if data_groups is None:
+                # Nobody can see a run without data groups, there's nothing to wait for
+                return None
+            summary = project_run_summary(uid, run)
+            return summary_document(catalog_name, summary, data_groups, is_complete(run), start.get('time'))
+        except Exception as e:
+            logger.warning(f"can't index run {catalog_name}: {uid}", exc_info=e)
+            return None
@@ -0,0 +1,70 @@
+from typing import Dict, Iterable, List
+
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.operations import IndexModel, ReplaceOne
+
+from . import RunSummary
+
+# Keys of a stored summary that are not part of RunSummary
+_STORAGE_KEYS = ("_id", "catalog", "data_groups", "complete", "time")
+
+
+class RunSummaries():
+    """The summaries of runs as RunsService projects them from databroker, stored
+    by (catalog, uid) along with the data groups that decide who can see them.
+
+    A run with a stop document doesn't change anymore, so its summary is kept for
+    good. Summaries of runs that are still open are replaced every time they are
+    projected again."""
+
+    def __init__(self, db, collection_name: str = "run_summaries"):
+        self._collection = db[collection_name]
+        self._create_indexes()
+
+    def _create_indexes(self):
+        uid_index = IndexModel([("catalog", ASCENDING), ("uid", ASCENDING)], unique=True)
+        data_groups_index = IndexModel([("catalog", ASCENDING), ("data_groups", ASCENDING)])
+        date_index = IndexModel([("catalog", ASCENDING), ("collection_date", DESCENDING)])
+        instrument_index = IndexModel([("catalog", ASCENDING), ("instrument_name", ASCENDING)])
+        text_index = IndexModel(
+            [("experiment_title", TEXT), ("experimenter_name", TEXT), ("sample_name", TEXT), ("instrument_name", TEXT)]
+        )
+        self._collection.create_indexes([uid_index, data_groups_index, date_index, instrument_index, text_index])
+
+    def get_many(self, catalog_name: str, uids: Iterable[str]) -> Dict[str, dict]:
+        """Returns the stored summaries of `uids` in one query, by uid.
+        Runs that have no summary yet are left out"""
+        cursor = self._collection.find({"catalog": catalog_name, "uid": {"$in": list(uids)}}, {"_id": False})
+        return {document["uid"]: document for document in cursor}
+
+    def put(self, catalog_name: str, summary: RunSummary, data_groups: List[str], complete: bool, start_time=None):
+        self._collection.replace_one(
+            {"catalog": catalog_name, "uid": summary.uid},
+            summary_document(catalog_name, summary, data_groups, complete, start_time),
+            upsert=True,
+        )
+
+    def put_many(self, documents: List[dict]):
+        """Stores documents made by `summary_document` with one bulk write"""
+        if len(documents) == 0:
+            return
+        self._collection.bulk_write(
+            [ReplaceOne({"catalog": document["catalog"], "uid": document["uid"]}, document, upsert=True)
+             for document in documents],
+            ordered=False,
+        )
+
+
+def summary_document(catalog_name: str, summary: RunSummary, data_groups: List[str], complete: bool,
+                     start_time=None) -> dict:
+    """`start_time` is the time of the run's start document"""
+    document = summary.dict()
+    document["catalog"] = catalog_name
+    document["data_groups"] = list(data_groups)
+    document["complete"] = complete
+    document["time"] = start_time
+    return document
+
+
+def summary_from_document(document: dict) -> RunSummary:
+    return RunSummary(**{key: value for key, value in document.items() if key not in _STORAGE_KEYS})
@@ -41,6 +41,14 @@ def read_catalogs(
     return catalog_names
 
 
+@runs_router.post("/refresh", tags=["runs"], response_model=List[str])
+def refresh_catalogs(
+        current_user: User = Security(get_current_user)):
+    if current_user.splash_md.admin is not True:
+        raise HTTPException(403, detail="user is not an admin")
+    return services.runs.refresh_catalogs()
+
+
 @runs_router.get("/{catalog_name}", tags=['runs'], response_model=List[RunSummary])
 def read_catalog(
             catalog_name: str = Path(..., title="name of catalog"),
@@ -1,5 +1,7 @@
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import logging
 from pathlib import Path
+import threading
 import time
 
 from typing import Dict, List
@@ -11,8 +13,10 @@ from pydantic.tools import T
 from xarray import Dataset
 
 from . import RunSummary
-from ..users import User
+from .run_summaries import RunSummaries, summary_from_document
+from ..users import TokenUser, User
 from ..service.authorization import TeamBasedChecker, Action, AccessDenied
+from ..service.cache import TTLCache, register_cache
 from ..teams.teams_service import TeamsService
 from ..teams import Team
 
@@ -23,17 +27,42 @@ class TeamRunChecker(TeamBasedChecker):
     def __init__(self):
         super().__init__()
 
-    def can_do(self, user: User, run_data_groups: List[str], action: Action, teams=List[Team], **kwargs):
+    def can_do(self, user: User, run_data_groups: List[str], action: Action, teams=List[Team],
+               team_names: List[str] = None, **kwargs):
         if action == Action.RETRIEVE:
-            # This rule is simple...check if the user
-            # is a member the team that matches the run
-            if not run_data_groups or len(run_data_groups) == 0:
-                return False
-            for team in teams:
-                if team.name in run_data_groups:
-                    return True
+            if team_names is None:
+                team_names = [team.name for team in teams]
+            return self.for_user(user, team_names).can_retrieve(run_data_groups)
         return False
 
+    def for_user(self, user: User, team_names) -> "RunAccess":
+        """Returns the RETRIEVE decisions of `user` with `team_names`, to check
+        every run of a request against"""
+        return RunAccess(user, team_names)
+
+
+class RunAccess():
+    """Which runs one user can retrieve, for the length of one request.
+
+    The rule is simple...the user must be a member of a team that matches one of
+    the run's data groups. Runs of a listing tend to share a handful of data group
+    combinations, so the decision is kept for each combination"""
+
+    def __init__(self, user: User, team_names):
+        self.user_uid = user.uid
+        self.team_names = frozenset(team_names)
+        self._decisions = {}
+
+    def can_retrieve(self, run_data_groups: List[str]) -> bool:
+        if not run_data_groups:
+            return False
+        key = frozenset(run_data_groups)
+        decision = self._decisions.get(key)
+        if decision is None:
+            decision = not self.team_names.isdisjoint(key)
+            self._decisions[key] = decision
+        return decision
+
 
 class CatalogDoesNotExist(Exception):
     pass
@@ -56,36 +85,113 @@ class ThumbDoesNotExist(Exception):
 
 
 class RunsService():
-    def __init__(self, teams_service: TeamsService, checker: TeamRunChecker):
+    # Team names of each user, so that a grid of thumbnails doesn't query the
+    # teams once per image. TeamsService clears it on every write, the ttl
+    # bounds how stale it gets from writes made by other processes
+    membership_cache_size = 1024
+    membership_cache_ttl = 60
+
+    # get_runs projects the summaries of a page on this many threads, and leaves
+    # out the runs that are not done `summary_timeout` seconds after it started
+    summary_workers = 8
+    summary_timeout = 10.0
+
+    # Opened catalogs, caching them saves several orders of magnitude on accessing
+    # for, say, thumbnails. The ttl bounds how long a catalog that was changed
+    # in intake is served as it was, `refresh_catalogs` drops them straight away
+    catalog_cache_size = 64
+    catalog_cache_ttl = 600
+
+    def __init__(self, teams_service: TeamsService, checker: TeamRunChecker, summaries: RunSummaries = None):
         self.teams_service = teams_service
         self.checker = checker
-        self._catalog_cache = {}  # caching names saves several orders of magitude on accessing for, say, thumbnails
+        # When set, summaries are stored there when projected and read from there after
+        self.summaries = summaries
+        self._catalogs = TTLCache(self.catalog_cache_size, self.catalog_cache_ttl)
+        register_cache("runs.catalogs", self._catalogs)
+        # Catalogs being opened, by name, so that concurrent requests open each only once
+        self._opening = {}
+        self._opening_lock = threading.Lock()
+        self._summary_pool = None
+        self._summary_pool_lock = threading.Lock()
+        self.set_membership_cache(TTLCache(self.membership_cache_size, self.membership_cache_ttl))
+
+    def set_membership_cache(self, cache):
+        """Caches the team names of each user in `cache`, or stops caching if it is None.
+        Set the same cache on every teams service that writes to the teams"""
+        self._memberships = cache
+        self.teams_service.set_membership_cache(cache)
+        if cache is not None:
+            register_cache("runs.memberships", cache)
+
+    def _get_user_team_names(self, user: User) -> List[str]:
+        # Users authorized from their token's claims come with their teams
+        if isinstance(user, TokenUser):
+            return user.teams
+        if self._memberships is None:
+            return [team.name for team in self.teams_service.get_user_teams(user, user.uid)]
+        team_names = self._memberships.get(user.uid)
+        if team_names is None:
+            generation = self._memberships.generation
+            team_names = tuple(team.name for team in self.teams_service.get_user_teams(user, user.uid))
+            self._memberships.put(user.uid, team_names, generation)
+        return list(team_names)
 
     def _get_user_teams(self, user: User):
-        user_teams = self.teams_service.get_user_teams(user, user.uid)
-        if not user_teams:
+        team_names = self._get_user_team_names(user)
+        if not team_names:
             if logger.isEnabledFor(logging.INFO):
-                logger.info(f"User {user.name} not a member of any team, can't view runs")
+                logger.info(f"User {user.uid} not a member of any team, can't view runs")
             raise AccessDenied("User not a member of any teams")
-        return list(user_teams)
+        return team_names
+
+    def get_catalog(self, catalog_name):
+        requested_catalog = self._catalogs.get(catalog_name)
+        if requested_catalog is not None:
+            return requested_catalog
+        with self._opening_lock:
+            opening = self._opening.get(catalog_name)
+            if opening is None:
+                opening = Future()
+                self._opening[catalog_name] = opening
+                generation = self._catalogs.generation
+            else:
+                generation = None
+        if generation is None:
+            # Another request is opening it already
+            return opening.result()
+        try:
+            try:
+                requested_catalog = catalog[catalog_name]
+            except KeyError:
+                raise CatalogDoesNotExist(f'Catalog name: {catalog_name} is not a catalog')
+            self._catalogs.put(catalog_name, requested_catalog, generation)
+            opening.set_result(requested_catalog)
+            return requested_catalog
+        except Exception as e:
+            opening.set_exception(e)
+            raise
+        finally:
+            with self._opening_lock:
+                del self._opening[catalog_name]
+
+    def refresh_catalogs(self) -> List[str]:
+        """Reloads the intake configuration and drops the opened catalogs, so that catalogs
+        added or changed in intake are seen without a restart. Returns the catalog names"""
+        catalog.force_reload()
+        self._catalogs.clear()
+        return self.list_root_catalogs()
 
     def _get_run(self, user: User, catalog_name, uid):
         # get the user's teams...if they're not in one, get out quick
-        user_teams = self._get_user_teams(user)
+        access = self.checker.for_user(user, self._get_user_teams(user))
         # print("about to lock")
         # catalog_lock.acquire()
         # print("past lock")
         before = time.perf_counter()
-        requested_catalog = None
         run = None
-        requested_catalog = self._catalog_cache.get(catalog_name)
-        if not requested_catalog:
-            try:
-                requested_catalog = catalog[catalog_name]
-                self._catalog_cache[catalog_name] = requested_catalog
-            except KeyError:
-                raise CatalogDoesNotExist(f'Catalog name: {catalog_name} is not a catalog')
-        
+        requested_catalog = self.get_catalog(catalog_name)
+
         try:
             run = requested_catalog[uid]
         except KeyError:
@@ -95,9 +201,9 @@ class RunsService():
         if run_auth is None:
             raise AccessDenied
 
-        if not self.checker.can_do(user, run_auth, Action.RETRIEVE, teams=user_teams):
+        if not access.can_retrieve(run_auth):
             if logger.isEnabledFor(logging.DEBUG):
-                logger.debug(f"User {user.name} can't retrieve {catalog_name}: {uid}")
+                logger.debug(f"User {user.uid} can't retrieve {catalog_name}: {uid}")
             raise AccessDenied
         return run, requested_catalog
 
@@ -184,15 +290,11 @@ class RunsService():
                  text_query=None,
                  from_query=None,
                  to_query=None) -> List[RunSummary]:
-        if catalog_name not in catalog:
-            raise CatalogDoesNotExist(f'Catalog name: {catalog_name} is not a catalog')
-
-        user_teams = list(self.teams_service.get_user_teams(user, user.uid))
-        teams_list = []
-        for team in user_teams:
-            teams_list.append(team.name)
+        requested_catalog = self.get_catalog(catalog_name)
+        teams_list = self._get_user_team_names(user)
+        access = self.checker.for_user(user, teams_list)
         query = self._build_runs_query(teams_list, text_query, from_query, to_query)
-        runs = catalog[catalog_name].search(
+        runs = requested_catalog.search(
             query,
             skip=skip,
             limit=limit)
@@ -200,28 +302,65 @@ class RunsService():
             logger.info(f'catalog: {catalog_name} has no runs')
             return []
 
+        uids = list(runs)
+        stored = {}
+        if self.summaries is not None:
+            stored = self.summaries.get_many(catalog_name, uids)
+
+        # Projecting a summary reads the run from storage, so the runs of
+        # a page are projected concurrently and collected in their order
+        pool = self._get_summary_pool()
+        futures = {}
+        for uid in uids:
+            document = stored.get(uid)
+            if document is None or not document["complete"]:
+                futures[uid] = pool.submit(self._get_run_summary, user, access, catalog_name, runs, uid)
+        deadline = time.monotonic() + self.summary_timeout
         return_runs = []
-        for uid in runs:
+        for uid in uids:
+            if uid not in futures:
+                if access.can_retrieve(stored[uid]["data_groups"]):
+                    return_runs.append(summary_from_document(stored[uid]))
+                continue
+            future = futures[uid]
             try:
-                run_auth = runs[uid].metadata['start'].get('data_groups')
-                if run_auth is None:
-                    continue
-                if not self.checker.can_do(user, run_auth, Action.RETRIEVE, teams=user_teams):
-                    if logger.isEnabledFor(logging.DEBUG):
-                        logger.debug(f"User {user.name} can't retrieve {catalog_name}: {uid}")
-                    continue
-                dataset, issues = project_summary_dict(runs[uid])
-                if issues and logger.isEnabledFor(logging.DEBUG):
-                    logger.debug(f"projection encountered issues: {str(issues)}")
-                run_summary = run_summary_from_dataset(uid, dataset)
-                return_runs.append(run_summary)
+                run_summary = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                logger.warning(f"skipping run {catalog_name}: {uid}, its summary took over {self.summary_timeout}s")
+                continue
             except Exception as e:
                 if logger.isEnabledFor(logging.DEBUG):
                     logger.debug(f"skipping run: {e.args[0]}")
-
-            # can this user see this run?          
+                continue
+            if run_summary is not None:
+                return_runs.append(run_summary)
         return return_runs
 
+    def _get_run_summary(self, user: User, access: RunAccess, catalog_name, runs, uid):
+        """Returns the summary of run `uid` of the search results `runs`,
+        or None if the user can't see it"""
+        # Each lookup by uid builds a new run, so it is looked up once
+        run = runs[uid]
+        # can this user see this run?
+        run_auth = run.metadata['start'].get('data_groups')
+        if run_auth is None:
+            return None
+        if not access.can_retrieve(run_auth):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"User {user.uid} can't retrieve {catalog_name}: {uid}")
+            return None
+        run_summary = project_run_summary(uid, run)
+        if self.summaries is not None:
+            self.summaries.put(catalog_name, run_summary, run_auth, is_complete(run), run.metadata['start'].get('time'))
+        return run_summary
+
+    def _get_summary_pool(self) -> ThreadPoolExecutor:
+        with self._summary_pool_lock:
+            if self._summary_pool is None:
+                self._summary_pool = ThreadPoolExecutor(self.summary_workers, thread_name_prefix="run-summaries")
+            return self._summary_pool
+
     @staticmethod
     def _build_runs_query(teams=None, text_search=None, from_query=None, to_query=None):
         queries = []
@@ -236,6 +375,18 @@ class RunsService():
         return query
 
     
+def project_run_summary(uid: str, run) -> RunSummary:
+    dataset, issues = project_summary_dict(run)
+    if issues and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"projection encountered issues: {str(issues)}")
+    return run_summary_from_dataset(uid, dataset)
+
+
+def is_complete(run) -> bool:
+    """Whether `run` has a stop document, after which it doesn't change"""
+    return run.metadata.get('stop') is not None
+
+
 def run_summary_from_dataset(uid: str, dataset: Dataset) -> RunSummary:
     run = {}
     run['uid'] = uid
@@ -0,0 +1,378 @@
+from contextlib import asynccontextmanager
+from copy import deepcopy
+
+from pymongo import DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from splash.service.base import (
+    BadPageArgument,
+    MongoServiceMixin,
+    ObjectNotFoundError,
+    VersionedMongoServiceMixin,
+    VersionNotFoundError,
+    _apply_metadata_update,
+    _bulk_create_results,
+    _bulk_outcomes,
+    _count_key,
+    _count_query,
+    _VERSION_PROJECTION,
+    _VERSION_SORT,
+    _archive_conflict,
+    _check_version_argument,
+    _decode_version_token,
+    _is_archive,
+    _projection,
+    _update_request,
+    _version_metadata,
+    _versioned_updates,
+    _write_conflict,
+    validate_base_metadata,
+    validate_versioned_metadata,
+)
+from splash.service.history import content_diff, history_entry, newer_content, rebuild_version, snapshot_above
+from splash.users import User
+
+
+class AsyncMongoService(MongoServiceMixin):
+    """The same service as MongoService, on a Motor database.
+
+    Every method that talks to Mongo is a coroutine, except `retrieve_multiple`
+    which returns a Motor cursor to iterate with `async for`.
+    Indexes are not created here, they are created by the sync service for the
+    same collection, which `setup_services` always builds."""
+
+    # The sync service of the same collection registers its caches without a prefix
+    cache_name_prefix = "async."
+
+    @validate_base_metadata
+    async def create(self, current_user: User, data: dict):
+        self._init_document(current_user, data)
+        await self._collection.insert_one(data)
+        self._invalidate(data["uid"])
+        return {"uid": data["uid"], "splash_md": data["splash_md"]}
+
+    async def bulk_create(self, current_user: User, documents: list) -> list:
+        results, to_insert, positions = self._bulk_create_documents(current_user, documents)
+        write_errors = {}
+        if len(to_insert) > 0:
+            try:
+                await self._collection.insert_many(to_insert, ordered=False)
+            except BulkWriteError as e:
+                write_errors = {error["index"]: error for error in e.details["writeErrors"]}
+            self._invalidate(*[data["uid"] for data in to_insert])
+        return _bulk_create_results(results, to_insert, positions, write_errors)
+
+    async def retrieve_one(self, current_user: User, uid, fields=None) -> dict:
+        if self._documents is None or fields is not None:
+            return await self._collection.find_one({"uid": uid}, _projection(fields, ["uid"]))
+        key = (self._collection_name, uid)
+        document = self._documents.get(key)
+        if document is None:
+            generation = self._documents.generation
+            document = await self._collection.find_one({"uid": uid}, {"_id": False})
+            if document is None:
+                return None
+            self._documents.put(key, document, generation)
+        return deepcopy(document)
+
+    async def retrieve_etag(self, current_user: User, uid) -> str:
+        document = await self._collection.find_one({"uid": uid}, {"_id": False, "splash_md.etag": True})
+        if document is None:
+            return None
+        return document["splash_md"]["etag"]
+
+    async def count(self, current_user: User, query=None, exclude_archived=True, estimated=False) -> int:
+        if estimated and not query:
+            return await self._collection.estimated_document_count()
+        query = _count_query(query, exclude_archived)
+        key = _count_key(query)
+        count = self._counts.get(key)
+        if count is None:
+            generation = self._counts.generation
+            count = await self._collection.count_documents(query)
+            self._counts.put(key, count, generation)
+        return count
+
+    @validate_base_metadata
+    async def update(self, current_user: User, data: dict, uid: str, etag=None):
+        query, pipeline, metadata_update, edit = _update_request(
+            current_user, data, uid, etag, self.edit_record_limit
+        )
+        previous_document = await self._collection.find_one_and_update(
+            query,
+            pipeline,
+            projection={"_id": False, "splash_md": True},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous_document is None:
+            await self._raise_write_conflict(uid, etag)
+        self._invalidate(uid)
+        await self._log_edit(uid, edit)
+        return {"uid": uid, "splash_md": _apply_metadata_update(previous_document["splash_md"], metadata_update)}
+
+    async def bulk_update(self, current_user: User, items: list) -> list:
+        results, requests, pending = self._bulk_update_requests(current_user, items)
+        for index, result in await self._bulk_write_results(requests, pending):
+            results[index] = result
+        return results
+
+    async def bulk_archive_action(self, current_user: User, action: str, items: list) -> list:
+        archive, results, requests, pending = self._bulk_archive_requests(current_user, action, items)
+        for index, result in await self._bulk_write_results(requests, pending, archive=archive):
+            results[index] = result
+        return results
+
+    async def _bulk_write_results(self, requests: list, pending: list, archive=None):
+        if len(requests) == 0:
+            return []
+        write_errors = {}
+        try:
+            await self._collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error for error in e.details["writeErrors"]}
+
+        uids = [uid for _, uid, _, _ in pending]
+        current = {}
+        async for document in self._collection.find(
+            {"uid": {"$in": uids}}, {"_id": False, "uid": True, "splash_md": True}
+        ):
+            current[document["uid"]] = document["splash_md"]
+        self._invalidate(*uids)
+        results, edits = _bulk_outcomes(pending, write_errors, current, archive)
+        if len(edits) > 0:
+            await self._edits.insert_many(edits)
+        return results
+
+    async def _log_edit(self, uid: str, edit: dict):
+        await self._edits.insert_one({"uid": uid, **edit})
+
+    async def retrieve_edits(self, current_user: User, uid: str, page: int = 1, page_size=10):
+        """Returns a cursor over the edits of a document, newest first"""
+        if page <= 0:
+            raise BadPageArgument("Page parameter must greater than 0")
+        if await self._collection.find_one({"uid": uid}, {"_id": True}) is None:
+            raise ObjectNotFoundError()
+        cursor = self._edits.find({"uid": uid}, {"_id": False, "uid": False})
+        return (
+            cursor.sort([("date", DESCENDING), ("_id", DESCENDING)])
+            .skip(page_size * (page - 1))
+            .limit(page_size)
+        )
+
+    async def _raise_write_conflict(self, uid: str, etag):
+        current = await self._collection.find_one({"uid": uid}, {"_id": False, "splash_md": True})
+        raise _write_conflict(etag, current)
+
+    @validate_base_metadata
+    async def patch(self, current_user: User, data: dict, uid: str, etag=None):
+        query, update, edit = self._patch_operators(current_user, data, uid, etag)
+        # The pre-image tells whether the write matched, and the new metadata follows from it
+        previous_document = await self._collection.find_one_and_update(
+            query,
+            update,
+            projection={"_id": False, "splash_md": True},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous_document is None:
+            await self._raise_write_conflict(uid, etag)
+        self._invalidate(uid)
+        await self._log_edit(uid, edit)
+        return {"uid": uid, "splash_md": _apply_metadata_update(previous_document["splash_md"], update)}
+
+    async def archive_action(self, current_user: User, action: str, uid, etag=None):
+        archive = _is_archive(action, "third")
+        query, update, edit = self._archive_operators(current_user, archive, uid, etag)
+        previous_document = await self._collection.find_one_and_update(
+            query,
+            update,
+            projection={"_id": False, "splash_md": True},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous_document is not None:
+            self._invalidate(uid)
+            await self._log_edit(uid, edit)
+            return {"uid": uid, "splash_md": _apply_metadata_update(previous_document["splash_md"], update)}
+
+        current = await self._collection.find_one({"uid": uid}, {"_id": False, "splash_md": True})
+        raise _archive_conflict(archive, etag, current)
+
+    async def delete(self, current_user: User, uid):
+        status = await self._collection.delete_one({"uid": uid})
+        if status.deleted_count == 0:
+            raise ObjectNotFoundError
+        self._invalidate(uid)
+        await self._edits.delete_many({"uid": uid})
+
+
+class AsyncVersionedMongoService(VersionedMongoServiceMixin, AsyncMongoService):
+    def __init__(self, db, collection_name, revisions_collection_name):
+        super().__init__(db, collection_name, revisions_collection_name)
+        self._versions = db[revisions_collection_name]
+
+    @asynccontextmanager
+    async def _history_session(self):
+        if not self.history_transactions:
+            yield None
+            return
+        async with await self._collection.database.client.start_session() as session:
+            async with session.start_transaction():
+                yield session
+
+    @validate_versioned_metadata
+    @validate_base_metadata
+    async def update(self, current_user: User, data: dict, uid: str, etag=None):
+        # See VersionedMongoService.update
+        query, pipeline, metadata_update, edit = _update_request(
+            current_user, data, uid, etag, self.edit_record_limit, versioned=True
+        )
+        async with self._history_session() as session:
+            previous_document = await self._collection.find_one_and_update(
+                query,
+                pipeline,
+                projection={"_id": False},
+                return_document=ReturnDocument.BEFORE,
+                session=session,
+            )
+            if previous_document is None:
+                await self._raise_write_conflict(uid, etag)
+            await self._versions.insert_one(
+                history_entry(previous_document, data, self.history_delta_limit), session=session
+            )
+        self._invalidate(uid)
+        await self._log_edit(uid, edit)
+        return {"uid": uid, "splash_md": _apply_metadata_update(previous_document["splash_md"], metadata_update)}
+
+    async def bulk_update(self, current_user: User, items: list) -> list:
+        results, prepared, positions = self._versioned_bulk_items(items)
+        current = {}
+        async for document in self._collection.find(
+            {"uid": {"$in": [item["uid"] for item in prepared]}}, {"_id": False}
+        ):
+            current[document["uid"]] = document
+        updates = _versioned_updates(prepared, current)
+        written = await super().bulk_update(current_user, updates)
+        for index, result in zip(positions, written):
+            results[index] = result
+        history = self._history_entries_of(updates, written, current)
+        if len(history) > 0:
+            await self._versions.insert_many(history)
+        return results
+
+    @validate_versioned_metadata
+    @validate_base_metadata
+    async def patch(self, current_user: User, data: dict, uid: str, etag=None):
+        query, update, edit = self._patch_operators(current_user, data, uid, etag)
+        update["$inc"] = {"splash_md.version": 1}
+        async with self._history_session() as session:
+            previous_document = await self._collection.find_one_and_update(
+                query,
+                update,
+                projection={"_id": False},
+                return_document=ReturnDocument.BEFORE,
+                session=session,
+            )
+            if previous_document is None:
+                await self._raise_write_conflict(uid, etag)
+            await self._versions.insert_one(
+                history_entry(previous_document, newer_content(previous_document, update), self.history_delta_limit),
+                session=session,
+            )
+        self._invalidate(uid)
+        await self._log_edit(uid, edit)
+        return {
+            "uid": uid,
+            "splash_md": _apply_metadata_update(previous_document["splash_md"], update),
+        }
+
+    @validate_versioned_metadata
+    async def create(self, current_user: User, data: dict):
+        if "splash_md" not in data:
+            data["splash_md"] = {}
+        data["splash_md"]["version"] = 1
+        return await super().create(current_user, data)
+
+    async def retrieve_version(self, current_user: User, uid: str, version):
+        _check_version_argument(version)
+        document = await super().retrieve_one(current_user, uid)
+        if document is not None and document["splash_md"]["version"] == version:
+            return document
+        entries = await self._history_entries(uid, version, snapshot_above(version, self.history_delta_limit))
+        old_document = rebuild_version(version, entries, document)
+        if old_document is None and len(entries) > 0:
+            old_document = rebuild_version(version, await self._history_entries(uid, version), document)
+        if old_document is not None:
+            return old_document
+        # If the document exists nowhere then the object was not found
+        if document is None and await self._versions.find_one({"uid": uid}, {"_id": True}) is None:
+            raise ObjectNotFoundError
+        # If the document does exist somewhere then version was not found
+        raise VersionNotFoundError
+
+    async def diff_versions(self, current_user: User, uid: str, from_version: int, to_version: int) -> dict:
+        _check_version_argument(from_version)
+        _check_version_argument(to_version)
+        key = (uid, from_version, to_version)
+        diff = self._diffs.get(key)
+        if diff is None:
+            documents = await self._versions_by_number(uid, {from_version, to_version})
+            diff = {
+                "uid": uid,
+                "from_version": from_version,
+                "to_version": to_version,
+                "fields": content_diff(documents[from_version], documents[to_version]),
+            }
+            self._diffs.put(key, diff)
+        return deepcopy(diff)
+
+    async def _versions_by_number(self, uid: str, versions: set) -> dict:
+        current = await self._collection.find_one({"uid": uid}, {"_id": False})
+        if current is None:
+            raise ObjectNotFoundError
+        documents = {version: current for version in versions if version == current["splash_md"]["version"]}
+        missing = sorted(versions - set(documents), reverse=True)
+        if len(missing) == 0:
+            return documents
+        query = self._history_query(set(missing))
+        cursor = self._versions.find({"uid": uid, "splash_md.version": query}, {"_id": False})
+        entries = await cursor.sort("splash_md.version", DESCENDING).to_list(None)
+        for version in missing:
+            document = rebuild_version(version, entries, current)
+            if document is None and len(entries) > 0:
+                document = rebuild_version(version, await self._history_entries(uid, version), current)
+            if document is None:
+                raise VersionNotFoundError
+            documents[version] = document
+        return documents
+
+    async def retrieve_versions(self, current_user: User, uid: str, page_size=10, after: str = None) -> list:
+        if page_size <= 0:
+            raise BadPageArgument("Page size must be greater than 0")
+        current = await self._collection.find_one({"uid": uid}, _VERSION_PROJECTION)
+        if current is None:
+            raise ObjectNotFoundError
+        if after is None:
+            versions = [current]
+            below = current["splash_md"]["version"]
+        else:
+            versions = []
+            below = _decode_version_token(after)
+        if len(versions) < page_size:
+            cursor = self._versions.find({"uid": uid, "splash_md.version": {"$lt": below}}, _VERSION_PROJECTION)
+            versions.extend(await cursor.sort(_VERSION_SORT).to_list(page_size - len(versions)))
+        return [_version_metadata(document) for document in versions]
+
+    async def _history_entries(self, uid: str, lowest: int, highest: int = None) -> list:
+        versions = {"$gte": lowest}
+        if highest is not None:
+            versions["$lte"] = highest
+        cursor = self._versions.find({"uid": uid, "splash_md.version": versions}, {"_id": False})
+        return await cursor.sort("splash_md.version", DESCENDING).to_list(None)
+
+    async def get_num_versions(self, current_user: User, uid):
+        document = await super().retrieve_one(current_user, uid, fields=["splash_md.version"])
+        if document is None:
+            raise ObjectNotFoundError
+        return document["splash_md"]["version"]
+
+    async def delete(self, current_user: User, uid):
+        raise NotImplementedError
@@ -3,19 +3,45 @@ import logging
 from typing import Type
 
 from pydantic.main import BaseModel
+from bson import json_util
+from splash.service.cache import TTLCache, register_cache
+from splash.service.history import content_diff, history_entry, newer_content, rebuild_version, snapshot_above
 from splash.service.models import PrivateSplashMetadata, PrivateVersionedSplashMetadata
+from splash.service.pagination import (
+    BadPageToken,
+    decode_page_token,
+    encode_page_token,
+    keyset_query,
+    sort_values,
+    with_uid_tiebreak,
+)
 import uuid
+from contextlib import contextmanager
+from copy import deepcopy
 from datetime import datetime
 from splash.users import User
 from pymongo.collation import Collation, CollationStrength
-from pymongo import DESCENDING, IndexModel
+from pymongo import DESCENDING, IndexModel, ReturnDocument, UpdateOne
 from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
 
 
 ValidationIssue = namedtuple("ValidationIssue", "description, location, exception")
 
 logger = logging.getLogger("splash.service")
 
+# Listings are sorted with this collation unless they pass another one.
+# A sort can only use an index that was created with the same collation
+LIST_COLLATION = Collation("en_US")
+
+
+def collated_sort_index(sort: list) -> IndexModel:
+    """Returns the index that serves listings sorted by `sort` with LIST_COLLATION.
+    It is named apart from the default so that it can be created next to an index
+    on the same keys with the simple collation, until scripts/upgrade_v01.12.py drops that"""
+    keys = with_uid_tiebreak(sort)
+    return IndexModel(keys, name=IndexModel(keys).document["name"] + "_en_US", collation=LIST_COLLATION)
+
 
 def check_for_fields(model: BaseModel, data: dict):
     model_fields = model.__dict__["__fields__"]
@@ -25,25 +51,39 @@ def check_for_fields(model: BaseModel, data: dict):
     return None
 
 
+def check_base_metadata(data: dict):
+    if "uid" in data:
+        raise UidInDictError("Document should not have uid field")
+
+    if "splash_md" not in data:
+        return
+    # The top layer that called this cannot mutate
+    # any of these fields. They should only be mutated by
+    # the service layer that uses this check or a lower one
+    field = check_for_fields(PrivateSplashMetadata, data)
+    if field is not None:
+        raise ImmutableMetadataField(
+            f"Cannot mutate field: `{field}` in `splash_md`"
+        )
+
+
+def check_versioned_metadata(data: dict):
+    if "splash_md" not in data:
+        return
+
+    field = check_for_fields(PrivateVersionedSplashMetadata, data)
+    if field is not None:
+        raise ImmutableMetadataField(
+            f"Cannot mutate field: `{field}` in `splash_md`"
+        )
+
+
 # This is a decorator which ensures that none of fields in SplashMetadata
 # Are being modified. We only want these fields to be modified by MongoService
 # It also ensures that the uid is not being modified
 def validate_base_metadata(func):
     def wrapper(self, current_user: User, data: dict, *args, **kwargs):
-        if "uid" in data:
-            raise UidInDictError("Document should not have uid field")
-
-        if "splash_md" not in data:
-            return func(self, current_user, data, *args, **kwargs)
-            # The top layer that called this cannot mutate
-            # any of these fields. They should only be mutated by
-            # the service layer that uses this decorator or a lower one
-        field = check_for_fields(PrivateSplashMetadata, data)
-        if field is not None:
-            raise ImmutableMetadataField(
-                f"Cannot mutate field: `{field}` in `splash_md`"
-            )
-
+        check_base_metadata(data)
         return func(self, current_user, data, *args, **kwargs)
 
     return wrapper
@@ -53,15 +93,7 @@ def validate_base_metadata(func):
 # are being modified.
 def validate_versioned_metadata(func):
     def wrapper(self, current_user: User, data: dict, *args, **kwargs):
-
-        if "splash_md" not in data:
-            return func(self, current_user, data, *args, **kwargs)
-
-        field = check_for_fields(PrivateVersionedSplashMetadata, data)
-        if field is not None:
-            raise ImmutableMetadataField(
-                f"Cannot mutate field: `{field}` in `splash_md`"
-            )
+        check_versioned_metadata(data)
         return func(self, current_user, data, *args, **kwargs)
 
     return wrapper
@@ -90,22 +122,65 @@ class Service:
         raise NotImplementedError
 
 
-class MongoService:
+class MongoServiceMixin:
+    """The parts of a Mongo service that build documents, queries and results
+    without talking to Mongo. MongoService and AsyncMongoService both inherit
+    them, so that the sync and the Motor services can't drift apart"""
+
+    # KEEP IN MIND THAT SORT ORDER MAY NOT BE CONSISTENT IF YOU HAVE EQUALITY
+    # AMONG ALL OF ITS CLAUSES IN TWO DOCUMENTS.
+    # IF YOU WANT TO MAKE SURE IT STAYS CONSISTENT,
+    # PLACE A UID AT THE END: https://docs.mongodb.com/manual/reference/method/cursor.sort/#sort-consistency
+    # retrieve_multiple appends uid for you when it is missing
+    default_sort = [("splash_md.last_edit", DESCENDING), ("uid", DESCENDING)]
+
+    # Only the latest edits are kept in splash_md.edit_record, the full
+    # history lives in the edit log collection and is read with `retrieve_edits`
+    edit_record_limit = 20
+
+    # Exact counts are cached per query. Writes through this service clear
+    # them straight away, the ttl bounds how stale they get from writes
+    # made by other processes
+    count_cache_size = 256
+    count_cache_ttl = 30
+
+    # Services opt in to caching the documents read by `retrieve_one` by
+    # setting a size. Another cache can be plugged in with `set_document_cache`.
+    # Only writes through this process clear the cache, so it is only safe
+    # when a single server process writes to the collection
+    document_cache_size = 0
+    document_cache_ttl = 60
+
+    # Prefix of the names that the caches are registered under
+    cache_name_prefix = ""
+
     def __init__(self, db, collection_name):
         self._db = db
+        self._collection_name = collection_name
         self._collection = db[collection_name]
-        self._create_indexes()
-
-    def _create_indexes(self):
-        uid_unique_index = IndexModel("uid", unique=True)
-        creator_index = IndexModel("splash_md.creator")
-        sort_index = IndexModel(
-            [("splash_md.last_edit", DESCENDING), ("uid", DESCENDING)]
-        )
-        self._collection.create_indexes([uid_unique_index, creator_index, sort_index])
-
-    @validate_base_metadata
-    def create(self, current_user: User, data: dict):
+        self._edits = db[collection_name + "_edits"]
+        self._counts = TTLCache(self.count_cache_size, self.count_cache_ttl)
+        register_cache(self._cache_name("counts"), self._counts)
+        self._documents = None
+        if self.document_cache_size > 0:
+            self.set_document_cache(TTLCache(self.document_cache_size, self.document_cache_ttl))
+
+    def set_document_cache(self, cache):
+        """Caches the documents read by `retrieve_one` in `cache`, or stops caching if it is None.
+        The cache needs the `get`, `put`, `pop` and `generation` of TTLCache and can be
+        shared between services, the keys include the collection name."""
+        self._documents = cache
+        if cache is not None:
+            register_cache(self._cache_name("documents"), cache)
+
+    def _cache_name(self, kind: str) -> str:
+        return f"{self.cache_name_prefix}{self._collection_name}.{kind}"
+
+    def _prepare_create(self, current_user: User, data: dict):
+        check_base_metadata(data)
+        self._init_document(current_user, data)
+
+    def _init_document(self, current_user: User, data: dict):
         uid = uuid.uuid4()
         data["uid"] = str(uid)
 
@@ -122,13 +197,22 @@ class MongoService:
         data["splash_md"]["edit_record"] = []
         data["splash_md"]["etag"] = str(uuid.uuid4())
 
-        logger.debug(f"create doc in collection {0}, doc: {1}", self._collection, data)
-
-        self._collection.insert_one(data)
-        return {"uid": data["uid"], "splash_md": data["splash_md"]}
-
-    def retrieve_one(self, current_user: User, uid) -> dict:
-        return self._collection.find_one({"uid": uid}, {"_id": False})
+    def _invalidate(self, *uids):
+        """Called after every write with the uids of the documents written"""
+        self._counts.clear()
+        if self._documents is not None:
+            for uid in uids:
+                self._documents.pop((self._collection_name, uid))
+
+    def page_token(self, document, sort=None) -> str:
+        """Returns an opaque token that makes `retrieve_multiple` resume after `document`.
+        `sort` must be the sort the document was listed with"""
+        if sort is None:
+            sort = self.default_sort
+        if isinstance(document, BaseModel):
+            document = document.dict()
+        sort = with_uid_tiebreak(sort)
+        return encode_page_token(sort_values(document, sort))
 
     def retrieve_multiple(
         self,
@@ -136,116 +220,660 @@ class MongoService:
         page: int = 1,
         query=None,
         page_size=10,
-        # KEEP IN MIND THAT SORT ORDER MAY NOT BE CONSISTENT IF YOU HAVE EQUALITY
-        # AMONG ALL OF ITS CLAUSES IN TWO DOCUMENTS.
-        # IF YOU WANT TO MAKE SURE IT STAYS CONSISTENT,
-        # PLACE A UID AT THE END: https://docs.mongodb.com/manual/reference/method/cursor.sort/#sort-consistency
-        sort=[("splash_md.last_edit", DESCENDING), ("uid", DESCENDING)],
+        sort=default_sort,
         exclude_archived=True,
         collation=None,
+        after: str = None,
+        fields=None,
     ):
-        if type(sort) is not list:
-            raise TypeError("`sort` argument must be of type list")
-        if page <= 0:
-            raise BadPageArgument("Page parameter must greater than 0")
-        if collation is None:
-            collation = Collation("en_US")
-        elif type(collation) is not Collation:
-            raise BadCollationArgument("argument `collation` must be of type Collation")
-
-        exclude_archived_query = {
-            "splash_md.archived": {'$ne': True}
-        }
-        # Calculate number of documents to skip
-        skips = page_size * (page - 1)
-
-        if query is None:
-            query = {}
-        elif type(query) is not dict:
-            raise TypeError("`query` argument must be of type dict or None")
-
-        if exclude_archived is True:
-            query = {"$and": [exclude_archived_query, query]}
-
-        cursor = self._collection.find(query, {"_id": False}, collation=collation)
+        """Returns a cursor over one page of documents. Finding doesn't talk to
+        Mongo until the cursor is iterated, so this is shared by the Motor services.
+
+        Pages can be addressed by number with `page`, or by passing the token
+        returned by `page_token` for the last document of the previous page
+        as `after`. Tokens resume from the position in the sort index, so
+        they cost the same at any depth, whereas `page` has to skip over
+        every earlier document.
+
+        If `fields` is a list of field names, only those fields are read,
+        along with the uid and sort keys that `page_token` needs."""
+        query, projection, sort, skips, collation = _list_request(
+            page, query, page_size, sort, exclude_archived, collation, after, fields
+        )
+        cursor = self._collection.find(query, projection, collation=collation)
 
         # Return documents
         return (
             cursor.sort(sort).skip(skips).limit(page_size)
         )
 
+    def retrieve_archived(self, current_user: User, page=1, page_size=10, after=None):
+        return MongoServiceMixin.retrieve_multiple(
+            self,
+            current_user,
+            page=page,
+            page_size=page_size,
+            query={'splash_md.archived': True},
+            exclude_archived=False,
+            after=after,
+        )
+
+    def _patch_operators(self, current_user: User, data: dict, uid: str, etag=None):
+        if not isinstance(data.get("splash_md", {}), dict):
+            raise InvalidPatchError("`splash_md` can only be patched field by field")
+        to_set, to_unset = _merge_patch_operators(data)
+        if len(to_set) == 0 and len(to_unset) == 0:
+            # Otherwise an empty patch would still make a new etag, version and edit
+            raise InvalidPatchError("Patch does not change any field")
+        # remove the microsecond because mongo will truncate past a certain amount of decimal places
+        last_edit = datetime.utcnow().replace(microsecond=0)
+        to_set["splash_md.last_edit"] = last_edit
+        to_set["splash_md.etag"] = str(uuid.uuid4())
+        edit = {"date": last_edit, "user": current_user.uid}
+        update = {
+            "$set": to_set,
+            "$push": {
+                "splash_md.edit_record": {"$each": [edit], "$slice": -self.edit_record_limit}
+            },
+        }
+        if len(to_unset) > 0:
+            update["$unset"] = to_unset
+        query = {"uid": uid}
+        if etag is not None:
+            query["splash_md.etag"] = etag
+        return query, update, edit
+
+    def _archive_operators(self, current_user: User, archive: bool, uid: str, etag=None):
+        query, update, edit = MongoServiceMixin._patch_operators(
+            self, current_user, {"splash_md": {"archived": archive}}, uid, etag=etag
+        )
+        # Documents that were never archived have no `archived` field, or have it set to None
+        query["splash_md.archived"] = {"$ne": True} if archive else True
+        return query, update, edit
+
+    def _bulk_create_documents(self, current_user: User, documents: list):
+        """Validates the documents of a bulk create. Returns the results with the failed
+        documents filled in, the documents to insert and their positions in `documents`"""
+        results = [None] * len(documents)
+        to_insert = []
+        positions = []
+        for index, data in enumerate(documents):
+            try:
+                self._prepare_create(current_user, data)
+            except (UidInDictError, ImmutableMetadataField) as e:
+                results[index] = _bulk_error(None, "validation_error", e.args[0])
+                continue
+            to_insert.append(data)
+            positions.append(index)
+        return results, to_insert, positions
+
+    def _bulk_update_requests(self, current_user: User, items: list):
+        """Validates the items of a bulk update and builds their conditional writes.
+        Returns the results with the failed items filled in, the writes, the
+        (index, uid, new etag, edit) of each write"""
+        results = [None] * len(items)
+        requests = []
+        pending = []
+        seen = set()
+        for index, item in enumerate(items):
+            uid = item["uid"]
+            if uid in seen:
+                results[index] = _bulk_error(uid, "validation_error", "uid appears more than once in the request")
+                continue
+            seen.add(uid)
+            data = dict(item["data"])
+            try:
+                check_base_metadata(data)
+            except (UidInDictError, ImmutableMetadataField) as e:
+                results[index] = _bulk_error(uid, "validation_error", e.args[0])
+                continue
+            query, pipeline, metadata_update, edit = _update_request(
+                current_user, data, uid, item.get("etag"), self.edit_record_limit
+            )
+            requests.append(UpdateOne(query, pipeline))
+            pending.append((index, uid, metadata_update["$set"]["splash_md.etag"], edit))
+        return results, requests, pending
+
+    def _bulk_archive_requests(self, current_user: User, action: str, items: list):
+        """Builds the conditional writes of a bulk archive or restore, as `_bulk_update_requests`"""
+        archive = _is_archive(action, "second")
+        results = [None] * len(items)
+        requests = []
+        pending = []
+        seen = set()
+        for index, item in enumerate(items):
+            uid = item["uid"]
+            if uid in seen:
+                results[index] = _bulk_error(uid, "validation_error", "uid appears more than once in the request")
+                continue
+            seen.add(uid)
+            query, update, edit = self._archive_operators(current_user, archive, uid, item.get("etag"))
+            requests.append(UpdateOne(query, update))
+            pending.append((index, uid, update["$set"]["splash_md.etag"], edit))
+        return archive, results, requests, pending
+
+
+class MongoService(MongoServiceMixin):
+    def __init__(self, db, collection_name):
+        super().__init__(db, collection_name)
+        self._create_indexes()
+
+    def _create_indexes(self):
+        uid_unique_index = IndexModel("uid", unique=True)
+        creator_index = IndexModel("splash_md.creator")
+        sort_index = collated_sort_index(MongoServiceMixin.default_sort)
+        self._collection.create_indexes([uid_unique_index, creator_index, sort_index])
+        edits_index = IndexModel([("uid", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)])
+        self._edits.create_indexes([edits_index])
+
     @validate_base_metadata
-    def update(self, current_user: User, data: dict, uid: str, etag=None):
-        data["uid"] = uid
+    def create(self, current_user: User, data: dict):
+        self._init_document(current_user, data)
 
-        current_document = MongoService.retrieve_one(self, current_user, uid)
-        if current_document is None:
-            raise ObjectNotFoundError()
+        logger.debug(f"create doc in collection {0}, doc: {1}", self._collection, data)
 
-        metadata = current_document["splash_md"]
+        self._collection.insert_one(data)
+        self._invalidate(data["uid"])
+        return {"uid": data["uid"], "splash_md": data["splash_md"]}
 
-        # If the etags don't match
-        if etag is not None and etag != metadata["etag"]:
-            raise EtagMismatchError(
-                f"Etag argument `{etag}` does not match current etag: `{ metadata['etag'] }`",
-                metadata["etag"],
-                metadata,
+    def bulk_create(self, current_user: User, documents: list) -> list:
+        """Creates all of `documents` with a single insert_many.
+
+        Returns one result per document, in order. A result is either what
+        `create` returns or a dict with the uid, an `err` code and a `detail`.
+        A document that fails does not stop the others from being inserted."""
+        results, to_insert, positions = self._bulk_create_documents(current_user, documents)
+        write_errors = {}
+        if len(to_insert) > 0:
+            try:
+                self._collection.insert_many(to_insert, ordered=False)
+            except BulkWriteError as e:
+                write_errors = {error["index"]: error for error in e.details["writeErrors"]}
+            self._invalidate(*[data["uid"] for data in to_insert])
+        return _bulk_create_results(results, to_insert, positions, write_errors)
+
+    def retrieve_one(self, current_user: User, uid, fields=None) -> dict:
+        """Returns the document with `uid`, or None. If `fields` is a list of
+        field names, only those fields and the uid are read"""
+        if self._documents is None or fields is not None:
+            return self._collection.find_one({"uid": uid}, _projection(fields, ["uid"]))
+        key = (self._collection_name, uid)
+        document = self._documents.get(key)
+        if document is None:
+            generation = self._documents.generation
+            document = self._collection.find_one({"uid": uid}, {"_id": False})
+            if document is None:
+                return None
+            self._documents.put(key, document, generation)
+        # Callers are free to modify what they get back
+        return deepcopy(document)
+
+    def retrieve_etag(self, current_user: User, uid) -> str:
+        """Returns the etag of the document with `uid`, or None, reading nothing else"""
+        document = self._collection.find_one({"uid": uid}, {"_id": False, "splash_md.etag": True})
+        if document is None:
+            return None
+        return document["splash_md"]["etag"]
+
+    def count(self, current_user: User, query=None, exclude_archived=True, estimated=False) -> int:
+        """Returns the number of documents that `retrieve_multiple` pages through for `query`.
+
+        Exact counts are cached until the next write through this service.
+        With `estimated`, a count over the whole collection is read from the
+        collection metadata instead, which also counts archived documents.
+        A filtered count is always exact."""
+        if estimated and not query:
+            return self._collection.estimated_document_count()
+        query = _count_query(query, exclude_archived)
+        key = _count_key(query)
+        count = self._counts.get(key)
+        if count is None:
+            generation = self._counts.generation
+            count = self._collection.count_documents(query)
+            self._counts.put(key, count, generation)
+        return count
+
+    @validate_base_metadata
+    def update(self, current_user: User, data: dict, uid: str, etag=None):
+        # The etag is part of the filter, so checking it and replacing the
+        # document is a single atomic compare-and-swap on the server
+        query, pipeline, metadata_update, edit = _update_request(
+            current_user, data, uid, etag, self.edit_record_limit
+        )
+        previous_document = self._collection.find_one_and_update(
+            query,
+            pipeline,
+            projection={"_id": False, "splash_md": True},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous_document is None:
+            self._raise_write_conflict(uid, etag)
+        self._invalidate(uid)
+        self._log_edit(uid, edit)
+        return {"uid": uid, "splash_md": _apply_metadata_update(previous_document["splash_md"], metadata_update)}
+
+    def bulk_update(self, current_user: User, items: list) -> list:
+        """Replaces many documents with a single bulk_write.
+
+        Each item is a dict with the `uid`, the new `data` and optionally the
+        `etag` that the write is conditional on. Returns one result per item,
+        in order, as described in `bulk_create`. Items whose etag does not
+        match also carry the current `etag` and `splash_md`."""
+        results, requests, pending = self._bulk_update_requests(current_user, items)
+        for index, result in self._bulk_write_results(requests, pending):
+            results[index] = result
+        return results
+
+    def bulk_archive_action(self, current_user: User, action: str, items: list) -> list:
+        """Archives or restores many documents with a single bulk_write.
+
+        Each item is a dict with the `uid` and optionally the `etag`.
+        Returns one result per item, in order, as described in `bulk_update`."""
+        archive, results, requests, pending = self._bulk_archive_requests(current_user, action, items)
+        for index, result in self._bulk_write_results(requests, pending, archive=archive):
+            results[index] = result
+        return results
+
+    def _bulk_write_results(self, requests: list, pending: list, archive=None):
+        """Sends conditional writes in one bulk_write and works out which of them applied.
+
+        `pending` holds (index, uid, new etag, edit) for each request. A write
+        that matched nothing looks the same as any other in the bulk result, so
+        one follow-up read fetches the metadata of every document: those
+        carrying the etag we generated were written by us."""
+        if len(requests) == 0:
+            return []
+        write_errors = {}
+        try:
+            self._collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error for error in e.details["writeErrors"]}
+
+        uids = [uid for _, uid, _, _ in pending]
+        current = {
+            document["uid"]: document["splash_md"]
+            for document in self._collection.find(
+                {"uid": {"$in": uids}}, {"_id": False, "uid": True, "splash_md": True}
             )
+        }
+        self._invalidate(*uids)
+        results, edits = _bulk_outcomes(pending, write_errors, current, archive)
+        if len(edits) > 0:
+            self._edits.insert_many(edits)
+        return results
 
-        if "splash_md" not in data:
-            data["splash_md"] = metadata
-        else:
-            # If the top layer is also sending in metadata
-            # then we want to merge it with the metadata already in the
-            # document
-            metadata.update(data["splash_md"])
-            data["splash_md"] = metadata
-        # Update the edit_record array and last edit timestamp
-        # remove the microsecond because mongo will truncate past a certain amount of decimal places
-        data["splash_md"]["last_edit"] = datetime.utcnow().replace(microsecond=0)
-        data["splash_md"]["edit_record"].append(
-            {"date": data["splash_md"]["last_edit"], "user": current_user.uid}
+    def _log_edit(self, uid: str, edit: dict):
+        self._edits.insert_one({"uid": uid, **edit})
+
+    def retrieve_edits(self, current_user: User, uid: str, page: int = 1, page_size=10):
+        """Returns a cursor over the edits of a document, newest first"""
+        if page <= 0:
+            raise BadPageArgument("Page parameter must greater than 0")
+        if self._collection.find_one({"uid": uid}, {"_id": True}) is None:
+            raise ObjectNotFoundError()
+        cursor = self._edits.find({"uid": uid}, {"_id": False, "uid": False})
+        return (
+            cursor.sort([("date", DESCENDING), ("_id", DESCENDING)])
+            .skip(page_size * (page - 1))
+            .limit(page_size)
         )
-        data["splash_md"]["etag"] = str(uuid.uuid4())
 
-        status = self._collection.replace_one({"uid": uid}, data)
-        if status.matched_count == 0:
-            raise ObjectNotFoundError
-        return {"uid": data["uid"], "splash_md": data["splash_md"]}
+    def _raise_write_conflict(self, uid: str, etag):
+        # Only called when a conditional write matched nothing, so this read
+        # stays off the success path. It tells a missing document apart from a stale etag
+        current = self._collection.find_one({"uid": uid}, {"_id": False, "splash_md": True})
+        raise _write_conflict(etag, current)
+
+    @validate_base_metadata
+    def patch(self, current_user: User, data: dict, uid: str, etag=None):
+        """Applies `data` to a document as a JSON merge patch (RFC 7396).
+        Only the fields named in `data` are sent to the database, a field set
+        to None is removed, and nested dicts are merged instead of replaced.
+        Etag handling and the returned value are the same as `update`."""
+        query, update, edit = self._patch_operators(current_user, data, uid, etag)
+        # The pre-image tells whether the write matched, and the new metadata follows from it
+        previous_document = self._collection.find_one_and_update(
+            query,
+            update,
+            projection={"_id": False, "splash_md": True},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous_document is None:
+            self._raise_write_conflict(uid, etag)
+        self._invalidate(uid)
+        self._log_edit(uid, edit)
+        return {"uid": uid, "splash_md": _apply_metadata_update(previous_document["splash_md"], update)}
 
     def archive_action(self, current_user: User, action: str, uid, etag=None):
-        if action not in ("restore", "archive"):
-            raise ValueError(
-                "third positional argument `action` must match the string 'archive' or 'restore'"
-            )
-        stored_doc = MongoService.retrieve_one(self, current_user, uid)
-        if stored_doc is None:
-            raise ObjectNotFoundError()
+        archive = _is_archive(action, "third")
+        query, update, edit = self._archive_operators(current_user, archive, uid, etag)
+        previous_document = self._collection.find_one_and_update(
+            query,
+            update,
+            projection={"_id": False, "splash_md": True},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous_document is not None:
+            self._invalidate(uid)
+            self._log_edit(uid, edit)
+            return {"uid": uid, "splash_md": _apply_metadata_update(previous_document["splash_md"], update)}
 
-        if action == "archive":
-            if "archived" not in stored_doc["splash_md"] or stored_doc["splash_md"][
-                "archived"
-            ] in (False, None):
-                new_doc = stored_doc
-                new_doc["splash_md"] = {"archived": True}
-                new_doc.pop("uid")
-                return MongoService.update(self, current_user, new_doc, uid, etag=etag)
-            raise ArchiveConflictError()
-        if action == "restore":
-            if "archived" in stored_doc["splash_md"] and stored_doc["splash_md"]["archived"] is True:
-                new_doc = stored_doc
-                new_doc["splash_md"] = {"archived": False}
-                new_doc.pop("uid")
-                return MongoService.update(self, current_user, new_doc, uid, etag=etag)
-            raise RestoreConflictError()
-
-    def retrieve_archived(self, current_user: User, page=1, page_size=10):
-        return MongoService.retrieve_multiple(self, current_user, page=page, page_size=page_size, query={'splash_md.archived': True}, exclude_archived=False)
+        current = self._collection.find_one({"uid": uid}, {"_id": False, "splash_md": True})
+        raise _archive_conflict(archive, etag, current)
 
     def delete(self, current_user: User, uid):
         status = self._collection.delete_one({"uid": uid})
         if status.deleted_count == 0:
             raise ObjectNotFoundError
+        self._invalidate(uid)
+        self._edits.delete_many({"uid": uid})
+
+
+def _list_request(page, query, page_size, sort, exclude_archived, collation, after, fields):
+    """Validates the arguments of `retrieve_multiple` and turns them into
+    the query, projection, sort, skip and collation of a find"""
+    if type(sort) is not list:
+        raise TypeError("`sort` argument must be of type list")
+    if page <= 0:
+        raise BadPageArgument("Page parameter must greater than 0")
+    if after is not None and page != 1:
+        raise BadPageArgument("Page parameter cannot be combined with a page token")
+    sort = with_uid_tiebreak(sort)
+    if collation is None:
+        collation = LIST_COLLATION
+    elif type(collation) is not Collation:
+        raise BadCollationArgument("argument `collation` must be of type Collation")
+
+    exclude_archived_query = {
+        "splash_md.archived": {'$ne': True}
+    }
+    # Calculate number of documents to skip
+    skips = page_size * (page - 1)
+
+    if query is None:
+        query = {}
+    elif type(query) is not dict:
+        raise TypeError("`query` argument must be of type dict or None")
+
+    if exclude_archived is True:
+        query = {"$and": [exclude_archived_query, query]}
+
+    if after is not None:
+        query = {"$and": [query, keyset_query(sort, decode_page_token(after, sort))]}
+
+    projection = _projection(fields, [key for key, _ in sort])
+    return query, projection, sort, skips, collation
+
+
+def _count_query(query, exclude_archived: bool) -> dict:
+    if query is None:
+        query = {}
+    elif type(query) is not dict:
+        raise TypeError("`query` argument must be of type dict or None")
+    if exclude_archived is True:
+        query = {"$and": [{"splash_md.archived": {'$ne': True}}, query]}
+    return query
+
+
+def _count_key(query: dict) -> str:
+    return json_util.dumps(query, sort_keys=True)
+
+
+def _update_request(current_user: User, data: dict, uid: str, etag, edit_record_limit: int, versioned=False):
+    """Builds the conditional write of an update.
+    Returns the filter, the update pipeline, the same change to splash_md as
+    update operators and the edit entry. The pipeline replaces the body with
+    `data`, merges its splash_md into the one already in the document and
+    appends the edit to the edit record, keeping only the last
+    `edit_record_limit` edits. With `versioned`, it also increments
+    splash_md.version"""
+    metadata = dict(data.pop("splash_md", {}))
+    # remove the microsecond because mongo will truncate past a certain amount of decimal places
+    metadata["last_edit"] = datetime.utcnow().replace(microsecond=0)
+    metadata["etag"] = str(uuid.uuid4())
+    edit = {"date": metadata["last_edit"], "user": current_user.uid}
+    metadata_update = {
+        "$set": {"splash_md." + key: value for key, value in metadata.items()},
+        "$push": {"splash_md.edit_record": {"$each": [edit], "$slice": -edit_record_limit}},
+    }
+    if versioned:
+        metadata_update["$inc"] = {"splash_md.version": 1}
+    query = {"uid": uid}
+    if etag is not None:
+        query["splash_md.etag"] = etag
+    return query, _replace_pipeline(uid, data, metadata_update), metadata_update, edit
+
+
+def _replace_pipeline(uid: str, data: dict, metadata_update: dict) -> list:
+    """Returns the update pipeline that replaces a document with the body `data`
+    and applies `metadata_update` to its splash_md, in a single write. Fields
+    missing from `data` are dropped. Values are wrapped in $literal so that
+    strings starting with $ are not read as field paths"""
+    new_metadata = {}
+    for operator, fields in metadata_update.items():
+        for path, value in fields.items():
+            field = path.split(".", 1)[1]
+            current = "$" + path
+            if operator == "$set":
+                new_metadata[field] = {"$literal": value}
+            elif operator == "$inc":
+                new_metadata[field] = {"$add": [{"$ifNull": [current, 0]}, value]}
+            elif operator == "$push":
+                pushed = {"$concatArrays": [{"$ifNull": [current, []]}, {"$literal": value["$each"]}]}
+                new_metadata[field] = {"$slice": [pushed, value["$slice"]]} if "$slice" in value else pushed
+    new_root = {key: {"$literal": value} for key, value in data.items() if key != "_id"}
+    new_root.update({
+        "_id": "$_id",
+        "uid": uid,
+        "splash_md": {"$mergeObjects": ["$splash_md", new_metadata]},
+    })
+    return [{"$replaceRoot": {"newRoot": new_root}}]
+
+
+# Metadata of a version, the editor is the user of the last edit record
+_VERSION_PROJECTION = {
+    "_id": False,
+    "uid": True,
+    "splash_md.version": True,
+    "splash_md.last_edit": True,
+    "splash_md.creator": True,
+    "splash_md.edit_record": True,
+}
+_VERSION_SORT = [("splash_md.version", DESCENDING)]
+
+
+def _versioned_updates(items: list, current: dict) -> list:
+    """Returns the items of a versioned bulk update with the next version number of
+    each document, guarded by the etag of the `current` version that was read"""
+    updates = []
+    for item in items:
+        document = current.get(item["uid"])
+        data = dict(item["data"])
+        data["splash_md"] = dict(data.get("splash_md", {}))
+        etag = item.get("etag")
+        if document is not None:
+            data["splash_md"]["version"] = document["splash_md"]["version"] + 1
+            # As in `update`, guard with the etag of the version we just read
+            if etag is None:
+                etag = document["splash_md"]["etag"]
+        updates.append({"uid": item["uid"], "data": data, "etag": etag})
+    return updates
+
+
+def _version_metadata(document: dict) -> dict:
+    metadata = document["splash_md"]
+    edit_record = metadata.get("edit_record") or []
+    return {
+        "uid": document["uid"],
+        "splash_md": {
+            "version": metadata["version"],
+            "last_edit": metadata["last_edit"],
+            "editor": edit_record[-1]["user"] if len(edit_record) > 0 else metadata.get("creator"),
+        },
+    }
+
+
+def _check_version_argument(version):
+    if not isinstance(version, int):
+        raise TypeError("argument `version` must be an integer")
+    if version <= 0:
+        raise ValueError("argument `version` must be more than zero")
+
+
+def _decode_version_token(token: str) -> int:
+    version = decode_page_token(token, _VERSION_SORT)[0]
+    if type(version) is not int:
+        raise BadPageToken("argument `after` does not match the sort order of this listing")
+    return version
+
+
+def _projection(fields, required_fields) -> dict:
+    if fields is None:
+        return {"_id": False}
+    if type(fields) is not list:
+        raise BadProjectionArgument("argument `fields` must be of type list or None")
+    for field in fields:
+        if type(field) is not str or field in ("", "_id") or field.startswith("$"):
+            raise BadProjectionArgument(f"Cannot project field: `{field}`")
+    paths = set(fields) | set(required_fields)
+    projection = {"_id": False}
+    for path in paths:
+        # Mongo rejects a projection that names both a field and one of its subfields
+        if not any(path.startswith(other + ".") for other in paths):
+            projection[path] = True
+    return projection
+
+
+def _merge_patch_operators(patch: dict, prefix: str = ""):
+    """Flattens a JSON merge patch into the dotted paths of a `$set` and an `$unset`"""
+    to_set = {}
+    to_unset = {}
+    for key, value in patch.items():
+        if type(key) is not str or key in ("", "_id") or key.startswith("$") or "." in key:
+            raise InvalidPatchError(f"Cannot patch field: `{prefix}{key}`")
+        path = prefix + key
+        if value is None:
+            to_unset[path] = ""
+        elif isinstance(value, dict):
+            # An empty dict merges nothing into an existing object
+            nested_set, nested_unset = _merge_patch_operators(value, path + ".")
+            to_set.update(nested_set)
+            to_unset.update(nested_unset)
+        else:
+            to_set[path] = value
+    return to_set, to_unset
+
+
+def _apply_metadata_update(metadata: dict, update: dict) -> dict:
+    """Returns a copy of `metadata` with the splash_md paths of a mongo update applied,
+    for when we hold the pre-image of a write and need to report the result"""
+    metadata = deepcopy(metadata)
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            parts = path.split(".")
+            if parts[0] != "splash_md":
+                continue
+            target = metadata
+            for part in parts[1:-1]:
+                target = target.setdefault(part, {})
+            field = parts[-1]
+            if operator == "$set":
+                target[field] = value
+            elif operator == "$unset":
+                target.pop(field, None)
+            elif operator == "$inc":
+                target[field] = target.get(field, 0) + value
+            elif operator == "$push":
+                pushed = target.setdefault(field, []) + value["$each"]
+                target[field] = pushed[value["$slice"]:] if "$slice" in value else pushed
+    return metadata
+
+
+def _bulk_outcomes(pending: list, write_errors: dict, current: dict, archive=None):
+    """Pairs each pending write of a bulk_write with its result, given the write
+    errors and the metadata read back afterwards. Also returns the edit log
+    entries of the writes that applied"""
+    results = []
+    edits = []
+    for position, (index, uid, new_etag, edit) in enumerate(pending):
+        metadata = current.get(uid)
+        if position in write_errors:
+            results.append((index, _write_error(uid, write_errors[position])))
+        elif metadata is None:
+            results.append((index, _bulk_error(uid, "not_found", "object not found")))
+        elif metadata["etag"] == new_etag:
+            results.append((index, {"uid": uid, "splash_md": metadata}))
+            edits.append({"uid": uid, **edit})
+        elif archive is True and metadata.get("archived") is True:
+            results.append((index, _bulk_error(uid, "already_archived", "object is already archived")))
+        elif archive is False and metadata.get("archived") is not True:
+            results.append((index, _bulk_error(uid, "not_archived", "object is not archived")))
+        else:
+            results.append((index, _bulk_error(
+                uid,
+                "etag_mismatch_error",
+                "etag does not match current etag",
+                etag=metadata["etag"],
+                splash_md=metadata,
+            )))
+    return results, edits
+
+
+def _bulk_create_results(results: list, inserted: list, positions: list, write_errors: dict) -> list:
+    """Fills in the results of the documents that a bulk create sent to insert_many"""
+    for position, (index, data) in enumerate(zip(positions, inserted)):
+        if position in write_errors:
+            results[index] = _write_error(data["uid"], write_errors[position])
+        else:
+            results[index] = {"uid": data["uid"], "splash_md": data["splash_md"]}
+    return results
+
+
+def _bulk_error(uid, err: str, detail, **extra) -> dict:
+    return {"uid": uid, "err": err, "detail": detail, **extra}
+
+
+def _write_error(uid, error: dict) -> dict:
+    # 11000 is the server's duplicate key error, e.g. a second team with the same name
+    if error.get("code") == 11000:
+        return _bulk_error(uid, "duplicate_key", error.get("errmsg"))
+    return _bulk_error(uid, "write_error", error.get("errmsg"))
+
+
+def _is_archive(action: str, position: str) -> bool:
+    if action not in ("restore", "archive"):
+        raise ValueError(
+            f"{position} positional argument `action` must match the string 'archive' or 'restore'"
+        )
+    return action == "archive"
+
+
+def _write_conflict(etag, current):
+    """Returns the error of a conditional write that matched nothing, given the
+    document as it is now. It tells a missing document apart from a stale etag"""
+    if current is None:
+        return ObjectNotFoundError()
+    return _etag_mismatch_error(etag, current["splash_md"])
+
+
+def _archive_conflict(archive: bool, etag, current):
+    """Returns the error of an archive action that matched nothing, as `_write_conflict`"""
+    if current is None:
+        return ObjectNotFoundError()
+    archived = current["splash_md"].get("archived") is True
+    if archive and archived:
+        return ArchiveConflictError()
+    if not archive and not archived:
+        return RestoreConflictError()
+    return _etag_mismatch_error(etag, current["splash_md"])
+
+
+def _etag_mismatch_error(etag, metadata: dict):
+    return EtagMismatchError(
+        f"Etag argument `{etag}` does not match current etag: `{ metadata['etag'] }`",
+        metadata["etag"],
+        metadata,
+    )
 
 
 class HistoricMongoService(MongoService):
@@ -259,22 +887,156 @@ class HistoricMongoService(MongoService):
         self._collection.create_indexes([uid_version_unique_index])
 
 
-class VersionedMongoService(MongoService):
+class VersionedMongoServiceMixin(MongoServiceMixin):
+    """The parts of VersionedMongoService that don't talk to Mongo, shared with
+    AsyncVersionedMongoService"""
+
+    # Write each new version and its history entry in one transaction.
+    # Transactions need a replica set or a sharded cluster
+    history_transactions = False
+    # Store the history as deltas, rebuilding a version applies at most this many.
+    # None stores every version whole, see splash.service.history
+    history_delta_limit = None
+    # A version never changes once written, so diffs between versions are only
+    # dropped to bound memory
+    diff_cache_size = 256
+    diff_cache_ttl = 3600
+
     def __init__(self, db, collection_name, revisions_collection_name):
         super().__init__(db, collection_name)
+        self._diffs = TTLCache(self.diff_cache_size, self.diff_cache_ttl)
+        register_cache(self._cache_name("diffs"), self._diffs)
+
+    def _prepare_create(self, current_user: User, data: dict):
+        check_versioned_metadata(data)
+        if "splash_md" not in data:
+            data["splash_md"] = {}
+        data["splash_md"]["version"] = 1
+        super()._prepare_create(current_user, data)
+
+    def _versioned_bulk_items(self, items: list):
+        """Validates the items of a bulk update. Returns the results with the failed
+        items filled in, the items that passed and their positions in `items`"""
+        results = [None] * len(items)
+        prepared = []
+        positions = []
+        for index, item in enumerate(items):
+            try:
+                check_versioned_metadata(item["data"])
+            except ImmutableMetadataField as e:
+                results[index] = _bulk_error(item["uid"], "validation_error", e.args[0])
+                continue
+            prepared.append(item)
+            positions.append(index)
+        return results, prepared, positions
+
+    def _history_entries_of(self, updates: list, results: list, current: dict) -> list:
+        """Returns the history entries of the versions that a bulk update replaced"""
+        return [
+            history_entry(current[result["uid"]], update["data"], self.history_delta_limit)
+            for update, result in zip(updates, results)
+            if "err" not in result
+        ]
+
+    def version_page_token(self, version: dict) -> str:
+        return encode_page_token([version["splash_md"]["version"]])
+
+    def _history_query(self, versions: set) -> dict:
+        """Returns the splash_md.version query of the history entries that rebuilding
+        `versions` needs, none of which is the current version"""
+        missing = sorted(versions)
+        if self.history_delta_limit:
+            # Deltas need every entry up to the first full copy above them
+            return {"$gte": missing[0], "$lte": snapshot_above(missing[-1], self.history_delta_limit)}
+        return {"$in": missing}
+
+
+class VersionedMongoService(VersionedMongoServiceMixin, MongoService):
+    def __init__(self, db, collection_name, revisions_collection_name):
+        super().__init__(db, collection_name, revisions_collection_name)
         self._versions_svc = HistoricMongoService(db, revisions_collection_name)
 
+    @contextmanager
+    def _history_session(self):
+        """Yields the session that a write and its history insert share,
+        or None when `history_transactions` is off"""
+        if not self.history_transactions:
+            yield None
+            return
+        with self._collection.database.client.start_session() as session:
+            with session.start_transaction():
+                yield session
+
     @validate_versioned_metadata
+    @validate_base_metadata
     def update(self, current_user: User, data: dict, uid: str, etag=None):
-        if "splash_md" not in data:
-            data["splash_md"] = {}
-        current_document = super().retrieve_one(current_user, uid)
-        if current_document is None:
-            raise ObjectNotFoundError
-        data["splash_md"]["version"] = current_document["splash_md"]["version"] + 1
-        result = super().update(current_user, data, uid, etag=etag)
-        self._versions_svc._collection.insert_one(current_document)
-        return result
+        # The version is incremented by the write itself, which returns the
+        # version it replaced. That pre-image is exactly what goes into the
+        # history, so concurrent saves can't leave a gap in it
+        query, pipeline, metadata_update, edit = _update_request(
+            current_user, data, uid, etag, self.edit_record_limit, versioned=True
+        )
+        with self._history_session() as session:
+            previous_document = self._collection.find_one_and_update(
+                query,
+                pipeline,
+                projection={"_id": False},
+                return_document=ReturnDocument.BEFORE,
+                session=session,
+            )
+            if previous_document is None:
+                self._raise_write_conflict(uid, etag)
+            self._versions_svc._collection.insert_one(
+                history_entry(previous_document, data, self.history_delta_limit), session=session
+            )
+        self._invalidate(uid)
+        self._log_edit(uid, edit)
+        return {"uid": uid, "splash_md": _apply_metadata_update(previous_document["splash_md"], metadata_update)}
+
+    @validate_versioned_metadata
+    @validate_base_metadata
+    def patch(self, current_user: User, data: dict, uid: str, etag=None):
+        query, update, edit = self._patch_operators(current_user, data, uid, etag)
+        update["$inc"] = {"splash_md.version": 1}
+        # The pre-image is the version that goes into the history
+        with self._history_session() as session:
+            previous_document = self._collection.find_one_and_update(
+                query,
+                update,
+                projection={"_id": False},
+                return_document=ReturnDocument.BEFORE,
+                session=session,
+            )
+            if previous_document is None:
+                self._raise_write_conflict(uid, etag)
+            self._versions_svc._collection.insert_one(
+                history_entry(previous_document, newer_content(previous_document, update), self.history_delta_limit),
+                session=session,
+            )
+        self._invalidate(uid)
+        self._log_edit(uid, edit)
+        return {
+            "uid": uid,
+            "splash_md": _apply_metadata_update(previous_document["splash_md"], update),
+        }
+
+    def bulk_update(self, current_user: User, items: list) -> list:
+        results, prepared, positions = self._versioned_bulk_items(items)
+        # Read every current version in one query, they become the history entries
+        current = {
+            document["uid"]: document
+            for document in self._collection.find(
+                {"uid": {"$in": [item["uid"] for item in prepared]}}, {"_id": False}
+            )
+        }
+        updates = _versioned_updates(prepared, current)
+        written = super().bulk_update(current_user, updates)
+        for index, result in zip(positions, written):
+            results[index] = result
+        history = self._history_entries_of(updates, written, current)
+        if len(history) > 0:
+            self._versions_svc._collection.insert_many(history)
+        return results
 
     @validate_versioned_metadata
     def create(self, current_user: User, data: dict):
@@ -284,22 +1046,22 @@ class VersionedMongoService(MongoService):
         return super().create(current_user, data)
 
     def retrieve_version(self, current_user: User, uid: str, version):
-        if not isinstance(version, int):
-            raise TypeError("argument `version` must be an integer")
-        if version <= 0:
-            raise ValueError("argument `version` must be more than zero")
+        _check_version_argument(version)
 
         document = super().retrieve_one(current_user, uid)
         if document is None or document["splash_md"]["version"] != version:
-            document = self._versions_svc._collection.find_one(
-                {"$and": [{"uid": uid}, {"splash_md.version": version}]}, {"_id": False}
-            )
-            if document is not None:
-                return document
+            # The entries between the version and the first one above it that is stored whole
+            entries = self._history_entries(uid, version, snapshot_above(version, self.history_delta_limit))
+            old_document = rebuild_version(version, entries, document)
+            if old_document is None and len(entries) > 0:
+                # Entries written with a different delta limit can chain further up
+                old_document = rebuild_version(version, self._history_entries(uid, version), document)
+            if old_document is not None:
+                return old_document
             # If the document exists nowhere then the object was not found
             elif (
                 self._versions_svc.retrieve_one(current_user, uid) is None
-                and super().retrieve_one(current_user, uid) is None
+                and document is None
             ):
                 raise ObjectNotFoundError
             # If the document does exist somewhere then version was not found
@@ -308,6 +1070,73 @@ class VersionedMongoService(MongoService):
 
         return document
 
+    def diff_versions(self, current_user: User, uid: str, from_version: int, to_version: int) -> dict:
+        """Returns the field and line level differences between the content of two versions"""
+        _check_version_argument(from_version)
+        _check_version_argument(to_version)
+        key = (uid, from_version, to_version)
+        diff = self._diffs.get(key)
+        if diff is None:
+            documents = self._versions_by_number(uid, {from_version, to_version})
+            diff = {
+                "uid": uid,
+                "from_version": from_version,
+                "to_version": to_version,
+                "fields": content_diff(documents[from_version], documents[to_version]),
+            }
+            self._diffs.put(key, diff)
+        return deepcopy(diff)
+
+    def _versions_by_number(self, uid: str, versions: set) -> dict:
+        """Reads several versions of a document, the older ones with one history query"""
+        current = self._collection.find_one({"uid": uid}, {"_id": False})
+        if current is None:
+            raise ObjectNotFoundError
+        documents = {version: current for version in versions if version == current["splash_md"]["version"]}
+        missing = sorted(versions - set(documents), reverse=True)
+        if len(missing) == 0:
+            return documents
+        query = self._history_query(set(missing))
+        cursor = self._versions_svc._collection.find({"uid": uid, "splash_md.version": query}, {"_id": False})
+        entries = list(cursor.sort("splash_md.version", DESCENDING))
+        for version in missing:
+            document = rebuild_version(version, entries, current)
+            if document is None and len(entries) > 0:
+                document = rebuild_version(version, self._history_entries(uid, version), current)
+            if document is None:
+                raise VersionNotFoundError
+            documents[version] = document
+        return documents
+
+    def retrieve_versions(self, current_user: User, uid: str, page_size=10, after: str = None) -> list:
+        """Returns the version, last edit and editor of a document's versions, newest first,
+        without reading their bodies. Pass the `version_page_token` of the last version
+        of a page as `after` to get the next one"""
+        if page_size <= 0:
+            raise BadPageArgument("Page size must be greater than 0")
+        current = self._collection.find_one({"uid": uid}, _VERSION_PROJECTION)
+        if current is None:
+            raise ObjectNotFoundError
+        if after is None:
+            versions = [current]
+            below = current["splash_md"]["version"]
+        else:
+            versions = []
+            below = _decode_version_token(after)
+        if len(versions) < page_size:
+            cursor = self._versions_svc._collection.find(
+                {"uid": uid, "splash_md.version": {"$lt": below}}, _VERSION_PROJECTION
+            )
+            versions.extend(cursor.sort(_VERSION_SORT).limit(page_size - len(versions)))
+        return [_version_metadata(document) for document in versions]
+
+    def _history_entries(self, uid: str, lowest: int, highest: int = None) -> list:
+        versions = {"$gte": lowest}
+        if highest is not None:
+            versions["$lte"] = highest
+        cursor = self._versions_svc._collection.find({"uid": uid, "splash_md.version": versions}, {"_id": False})
+        return list(cursor.sort("splash_md.version", DESCENDING))
+
     def get_num_versions(self, current_user: User, uid):
         document = super().retrieve_one(current_user, uid)
         if document is None:
@@ -352,3 +1181,11 @@ class RestoreConflictError(Exception):
 
 class BadCollationArgument(Exception):
     pass
+
+
+class InvalidPatchError(ValueError):
+    pass
+
+
+class BadProjectionArgument(Exception):
+    pass
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+import threading
+import time
+
+# Every cache that should show up in `cache_stats`, by name
+_registry = {}
+
+
+class TTLCache:
+    """A thread safe LRU cache whose entries also expire `ttl` seconds after they were stored.
+
+    Every invalidation bumps `generation`. A reader that looks the value up in
+    the database notes the generation first and passes it to `put`, which drops
+    the value if anything was invalidated in the meantime, so a read that raced
+    with a write can't put stale data back in the cache."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            stored, value = entry
+            if self._clock() - stored >= self.ttl:
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation: int = None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else None,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def register_cache(name: str, cache):
+    _registry[name] = cache
+
+
+def cache_stats() -> dict:
+    """Hit and miss counts of every registered cache, by name"""
+    return {name: cache.stats() for name, cache in _registry.items()}
@@ -0,0 +1,55 @@
+import time
+
+from pymongo import UpdateOne
+
+from .cache import TTLCache, register_cache
+
+
+class ClaimsVersion:
+    """A counter per user that goes up with every write to the user, and to every
+    team that they are or were a member of.
+
+    Access tokens can carry the admin flag and team names of their user, stamped
+    with the version of that user they were issued at. A token whose version is still
+    the current one can be trusted without reading the user, any other token falls back
+    to reading it. Versions are cached for `ttl` seconds, so a write made through another
+    server process takes at most that long to be seen."""
+
+    cache_size = 4096
+
+    def __init__(self, db, collection_name: str = "authz", ttl: float = 5, clock=time.monotonic):
+        self._db = db
+        self._collection = db[collection_name]
+        self._cache = TTLCache(self.cache_size, ttl, clock)
+        register_cache(f"{collection_name}.versions", self._cache)
+
+    def cached(self, uid: str):
+        """Returns the version of the user with `uid` if it is cached, or None without reading it"""
+        return self._cache.get(uid)
+
+    def current(self, uid: str) -> int:
+        version = self._cache.get(uid)
+        if version is None:
+            generation = self._cache.generation
+            document = self._collection.find_one({"_id": uid})
+            version = 0 if document is None else document["version"]
+            self._cache.put(uid, version, generation)
+        return version
+
+    def bump(self, *uids):
+        """Makes the claims issued so far to the users with `uids` stale"""
+        uids = set(uids)
+        if len(uids) == 0:
+            return
+        self._collection.bulk_write(
+            [UpdateOne({"_id": uid}, {"$inc": {"version": 1}}, upsert=True) for uid in uids], ordered=False
+        )
+        for uid in uids:
+            self._cache.pop(uid)
+
+    def bump_members(self, teams_collection_name: str, *team_uids):
+        """Bumps the users that are members of the teams with `team_uids` now"""
+        teams = self._db[teams_collection_name].find(
+            {"uid": {"$in": list(team_uids)}}, {"_id": False, "member_uids": True}
+        )
+        self.bump(*[member for team in teams for member in team.get("member_uids", [])])
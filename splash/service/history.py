@@ -0,0 +1,178 @@
+from copy import deepcopy
+from difflib import SequenceMatcher, unified_diff
+
+# Versioned services can store most history entries as deltas instead of full copies.
+#
+# A delta entry holds the splash_md of its version and the changes that turn
+# the next version's content back into its own, so any version is rebuilt by
+# starting from a full copy above it (an entry stored whole, or the current
+# document) and undoing the deltas on the way down. With a `delta_limit` of N,
+# every (N+1)th version is stored whole, which caps the deltas applied at N.
+#
+# Entries of either kind can be mixed in one collection, so the limit can be
+# changed, or deltas turned on, at any time.
+
+DELTA_KEY = "splash_delta"
+
+# Keys that are not part of a version's content
+_RESERVED_KEYS = ("_id", "uid", "splash_md", DELTA_KEY)
+
+
+def is_snapshot(version: int, delta_limit) -> bool:
+    return not delta_limit or version % (delta_limit + 1) == 0
+
+
+def snapshot_above(version: int, delta_limit) -> int:
+    """The first version at or above `version` that is stored whole"""
+    if not delta_limit:
+        return version
+    interval = delta_limit + 1
+    return -(-version // interval) * interval
+
+
+def history_entry(previous: dict, newer_content: dict, delta_limit) -> dict:
+    """Returns what goes into the history for `previous`, the version that was just
+    replaced by a version with the content `newer_content`"""
+    if is_snapshot(previous["splash_md"]["version"], delta_limit):
+        return deepcopy(previous)
+    return {
+        "uid": previous["uid"],
+        "splash_md": deepcopy(previous["splash_md"]),
+        DELTA_KEY: content_delta(previous, newer_content),
+    }
+
+
+def content_delta(older: dict, newer: dict) -> dict:
+    """Returns the changes that turn the content of `newer` into that of `older`.
+
+    Strings that are long enough to be worth it are stored as a line diff,
+    any other changed field is stored whole."""
+    delta = {}
+    removed = []
+    for key, value in older.items():
+        if key in _RESERVED_KEYS:
+            continue
+        if key not in newer:
+            delta[key] = {"set": deepcopy(value)}
+        elif newer[key] != value:
+            delta[key] = _field_delta(value, newer[key])
+    for key in newer:
+        if key not in _RESERVED_KEYS and key not in older:
+            removed.append(key)
+    return {"fields": delta, "removed": removed}
+
+
+def apply_delta(newer: dict, entry: dict) -> dict:
+    """Rebuilds the version stored as the delta `entry` from the next version up"""
+    delta = entry[DELTA_KEY]
+    document = {key: deepcopy(value) for key, value in newer.items() if key not in _RESERVED_KEYS}
+    for key in delta["removed"]:
+        document.pop(key, None)
+    for key, change in delta["fields"].items():
+        if "set" in change:
+            document[key] = deepcopy(change["set"])
+        else:
+            document[key] = _apply_lines(newer[key], change["lines"])
+    document["uid"] = entry["uid"]
+    document["splash_md"] = deepcopy(entry["splash_md"])
+    return document
+
+
+def rebuild_version(version: int, entries: list, current: dict):
+    """Rebuilds `version` from history `entries` sorted by descending version, starting
+    from the first entry stored whole or from `current`, the document as it is now.
+    Returns None when the entries don't reach down to `version`"""
+    document = None
+    if len(entries) > 0 and current is not None:
+        if current["splash_md"]["version"] == entries[0]["splash_md"]["version"] + 1:
+            document = current
+    for entry in entries:
+        entry_version = entry["splash_md"]["version"]
+        if DELTA_KEY not in entry:
+            document = entry
+        elif document is not None and document["splash_md"]["version"] == entry_version + 1:
+            document = apply_delta(document, entry)
+        else:
+            # A gap in the chain, nothing below it can be rebuilt from above
+            document = None
+        if entry_version == version:
+            break
+    if document is None or document["splash_md"]["version"] != version:
+        return None
+    return document
+
+
+def newer_content(previous: dict, update: dict) -> dict:
+    """Returns the content that a patch's `$set` and `$unset` leave in `previous`"""
+    document = {key: deepcopy(value) for key, value in previous.items() if key not in _RESERVED_KEYS}
+    for operator, fields in update.items():
+        if operator not in ("$set", "$unset"):
+            continue
+        for path, value in fields.items():
+            parts = path.split(".")
+            if parts[0] == "splash_md":
+                continue
+            target = document
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            if operator == "$set":
+                target[parts[-1]] = deepcopy(value)
+            else:
+                target.pop(parts[-1], None)
+    return document
+
+
+def content_diff(older: dict, newer: dict) -> list:
+    """Returns the fields whose content differs between two versions, for people to read.
+    Changed strings that span several lines come with a unified diff of their lines
+    instead of both values"""
+    changes = []
+    keys = [key for key in older if key not in _RESERVED_KEYS]
+    keys += [key for key in newer if key not in _RESERVED_KEYS and key not in older]
+    for key in keys:
+        if key not in newer:
+            changes.append({"field": key, "change": "removed", "old": older[key]})
+        elif key not in older:
+            changes.append({"field": key, "change": "added", "new": newer[key]})
+        elif older[key] != newer[key]:
+            old, new = older[key], newer[key]
+            if isinstance(old, str) and isinstance(new, str) and ("\n" in old or "\n" in new):
+                lines = list(unified_diff(old.splitlines(), new.splitlines(), lineterm=""))
+                # Drop the ---/+++ file header
+                changes.append({"field": key, "change": "changed", "lines": lines[2:]})
+            else:
+                changes.append({"field": key, "change": "changed", "old": old, "new": new})
+    return changes
+
+
+def _field_delta(older, newer) -> dict:
+    if isinstance(older, str) and isinstance(newer, str) and len(older) > 256:
+        lines = _diff_lines(older, newer)
+        if sum(len(text) for _, _, text in lines) < len(older) // 2:
+            return {"lines": lines}
+    return {"set": deepcopy(older)}
+
+
+def _diff_lines(older: str, newer: str) -> list:
+    """Returns [start, end, text] edits that turn the lines of `newer` into `older`,
+    each replacing the lines `start` to `end` of `newer` with `text`"""
+    older_lines = older.splitlines(keepends=True)
+    newer_lines = newer.splitlines(keepends=True)
+    matcher = SequenceMatcher(None, newer_lines, older_lines, autojunk=False)
+    return [
+        [i1, i2, "".join(older_lines[j1:j2])]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def _apply_lines(newer: str, lines: list) -> str:
+    newer_lines = newer.splitlines(keepends=True)
+    pieces = []
+    position = 0
+    for start, end, text in lines:
+        pieces.extend(newer_lines[position:start])
+        pieces.append(text)
+        position = end
+    pieces.extend(newer_lines[position:])
+    return "".join(pieces)
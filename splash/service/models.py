@@ -1,10 +1,30 @@
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import Any, List, Optional, Type
+from pydantic import BaseModel, create_model
 from datetime import datetime
 
 from pydantic.main import Extra
 
 
+def reject_null(cls, value):
+    # In a merge patch null removes a field, which is only
+    # allowed for fields that are optional on the stored document
+    if value is None:
+        raise ValueError("field cannot be removed")
+    return value
+
+
+def partial_model(model: Type[BaseModel]) -> Type[BaseModel]:
+    """Builds a copy of `model`, and of the models nested in it, where every field is
+    optional. Used to validate documents that were read with a projection"""
+    fields = {}
+    for name, field in model.__fields__.items():
+        field_type = field.outer_type_
+        if isinstance(field_type, type) and issubclass(field_type, BaseModel):
+            field_type = partial_model(field_type)
+        fields[name] = (Optional[field_type], None)
+    return create_model("Partial" + model.__name__, __config__=model.__config__, **fields)
+
+
 class EditElement(BaseModel):
     date: datetime
     user: str
@@ -46,3 +66,30 @@ class CreatedVersionedDocument(BaseModel):
     uid: str
     splash_md: VersionedSplashMetadata
 
+
+class VersionMetadata(BaseModel):
+    version: int
+    last_edit: datetime
+    editor: Optional[str]
+
+
+class VersionElement(BaseModel):
+    uid: str
+    splash_md: VersionMetadata
+
+
+class FieldDiff(BaseModel):
+    field: str
+    # added, removed or changed
+    change: str
+    old: Optional[Any]
+    new: Optional[Any]
+    # Unified diff of the lines of a changed multi-line string, in place of old and new
+    lines: Optional[List[str]]
+
+
+class VersionDiff(BaseModel):
+    uid: str
+    from_version: int
+    to_version: int
+    fields: List[FieldDiff]
@@ -0,0 +1,77 @@
+import base64
+import binascii
+from typing import List, Tuple
+
+from bson import json_util
+from bson.json_util import JSONOptions
+from pymongo import ASCENDING
+
+# Mongo stores naive utc datetimes, so the values we resume from must be naive too
+_JSON_OPTIONS = JSONOptions(tz_aware=False)
+
+
+class BadPageToken(Exception):
+    pass
+
+
+def with_uid_tiebreak(sort: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    """Keyset pagination needs a total order, so uid is appended to sorts that
+    do not already end in a unique field."""
+    if any(key == "uid" for key, _ in sort):
+        return sort
+    direction = sort[-1][1] if len(sort) > 0 else ASCENDING
+    return sort + [("uid", direction)]
+
+
+def sort_values(document: dict, sort: List[Tuple[str, int]]) -> list:
+    values = []
+    for key, _ in sort:
+        value = document
+        for part in key.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        values.append(value)
+    return values
+
+
+def encode_page_token(values: list) -> str:
+    raw = json_util.dumps(values, json_options=_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_page_token(token: str, sort: List[Tuple[str, int]]) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(token.encode("ascii"))
+        values = json_util.loads(raw.decode("utf-8"), json_options=_JSON_OPTIONS)
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise BadPageToken("argument `after` is not a valid page token") from None
+    if type(values) is not list or len(values) != len(sort):
+        raise BadPageToken("argument `after` does not match the sort order of this listing")
+    return values
+
+
+def keyset_query(sort: List[Tuple[str, int]], values: list) -> dict:
+    """Build a query matching every document that sorts after `values`.
+
+    For a sort on (a, b, c) this is:
+    a > va OR (a == va AND b > vb) OR (a == va AND b == vb AND c > vc)
+    with `>` flipped to `<` for descending keys.
+
+    Mongo sorts null and missing values before every other value, but `$gt`
+    and `$lt` only match values of the same type. So nulls are handled
+    explicitly: after a null come all the values that are not null, and
+    a descending key reaches the nulls after every other value."""
+    clauses = []
+    for position, (key, direction) in enumerate(sort):
+        clause = {prev_key: values[i] for i, (prev_key, _) in enumerate(sort[:position])}
+        value = values[position]
+        if direction == ASCENDING:
+            clause[key] = {"$ne": None} if value is None else {"$gt": value}
+        elif value is None:
+            # Nothing sorts below null
+            continue
+        else:
+            clause["$or"] = [{key: {"$lt": value}}, {key: None}]
+        clauses.append(clause)
+    if len(clauses) == 0:
+        return {"$expr": False}
+    return {"$or": clauses}
@@ -1,7 +1,7 @@
-from splash.service.models import CreatedDocument
-from typing import Dict, List
+from splash.service.models import CreatedDocument, partial_model, reject_null
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel, Extra
+from pydantic import BaseModel, Extra, validator
 
 
 class NewTeam(BaseModel):
@@ -12,5 +12,18 @@ class NewTeam(BaseModel):
         extra = Extra.forbid
 
 
+class PatchTeam(BaseModel):
+    name: Optional[str]
+    members: Optional[Dict[str, Optional[List[str]]]]  # uid, role. A null role list removes the member
+
+    _not_null = validator("name", "members", pre=True, allow_reuse=True)(reject_null)
+
+    class Config:
+        extra = Extra.forbid
+
+
 class Team(NewTeam, CreatedDocument):
     pass
+
+
+PartialTeam = partial_model(Team)
@@ -0,0 +1,120 @@
+from typing import List, Optional
+
+from attr import dataclass
+from fastapi import APIRouter, Depends, Header, Query, Response, Security
+from fastapi.exceptions import HTTPException
+
+from splash.api.auth import get_current_user
+from splash.api.bulk import BulkRequest, BulkResult, run_bulk_async
+from splash.api.pagination import CountMode, add_total_count_header, list_response
+from splash.api.etags import etag_header, etag_matches, if_match_etag, not_modified
+from splash.api.projection import fields_query, partial_response
+from splash.service.base import ObjectNotFoundError
+from splash.service.models import EditElement
+from ..users import User
+from . import NewTeam, PartialTeam, PatchTeam, Team
+from .teams_routes import CreateTeamResponse
+from .teams_service import AsyncTeamsService
+
+# Same routes as teams_routes, served from the event loop by AsyncTeamsService
+async_teams_router = APIRouter()
+
+
+@dataclass
+class Services():
+    teams: AsyncTeamsService
+
+
+services = Services(None)
+
+
+def set_async_teams_service(svc: AsyncTeamsService):
+    services.teams = svc
+
+
+@async_teams_router.get("", tags=["teams"], response_model=List[Team])
+async def read_teams(
+            response: Response,
+            page: int = 1,
+            page_size: int = 100,
+            after: Optional[str] = Query(None, alias="next"),
+            fields: Optional[List[str]] = Depends(fields_query),
+            count: Optional[CountMode] = Query(None),
+            current_user: User = Security(get_current_user)):
+    if count is not None:
+        total = await services.teams.count(current_user, estimated=count == CountMode.estimated)
+        add_total_count_header(response, total)
+    teams = services.teams.retrieve_multiple(
+        current_user, page=page, page_size=page_size, after=after, fields=fields)
+    results = [team async for team in teams]
+    return list_response(response, services.teams, results, page_size, Team, PartialTeam, fields)
+
+
+@async_teams_router.get("/{uid}", tags=['teams'], response_model=Team)
+async def read_team(
+            uid: str,
+            response: Response,
+            current_user: User = Security(get_current_user),
+            fields: Optional[List[str]] = Depends(fields_query),
+            if_none_match: Optional[str] = Header(None)):
+    # A projection is a different representation of the document, so only
+    # whole documents are validated against the etag
+    if if_none_match is not None and fields is None:
+        etag = await services.teams.retrieve_etag(current_user, uid)
+        if etag is not None and etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    team = await services.teams.retrieve_one(current_user, uid, fields=fields)
+    if fields is not None:
+        return partial_response(team, response)
+    if team is not None:
+        response.headers["ETag"] = etag_header(team["splash_md"]["etag"])
+    return team
+
+
+@async_teams_router.get("/{uid}/edits", tags=['teams'], response_model=List[EditElement])
+async def read_team_edits(
+            uid: str,
+            page: int = 1,
+            page_size: int = 10,
+            current_user: User = Security(get_current_user)):
+    try:
+        edits = await services.teams.retrieve_edits(current_user, uid, page, page_size)
+    except ObjectNotFoundError:
+        raise HTTPException(404)
+    return [edit async for edit in edits]
+
+
+@async_teams_router.post("", tags=['teams'], response_model=CreateTeamResponse)
+async def create_team(
+                team: NewTeam,
+                current_user: User = Security(get_current_user)):
+    return await services.teams.create(current_user, team)
+
+
+@async_teams_router.post("/bulk", tags=['teams'], response_model=List[BulkResult])
+async def bulk_teams(
+                request: BulkRequest,
+                current_user: User = Security(get_current_user)):
+    return await run_bulk_async(services.teams, current_user, request.operations, NewTeam, NewTeam)
+
+
+@async_teams_router.put("/{uid}", tags=['teams'], response_model=CreateTeamResponse)
+async def update_team(uid: str,
+                      team: NewTeam,
+                      current_user: User = Security(get_current_user),
+                      if_match: Optional[str] = Depends(if_match_etag)):
+    try:
+        return await services.teams.update(current_user, team, uid, etag=if_match)
+    except ObjectNotFoundError:
+        raise HTTPException(404)
+
+
+@async_teams_router.patch("/{uid}", tags=['teams'], response_model=CreateTeamResponse)
+async def patch_team(uid: str,
+                     team: PatchTeam,
+                     current_user: User = Security(get_current_user),
+                     if_match: Optional[str] = Depends(if_match_etag)):
+    try:
+        return await services.teams.patch(current_user, team, uid, etag=if_match)
+    except ObjectNotFoundError:
+        raise HTTPException(404)
@@ -1,17 +1,21 @@
 from typing import List, Optional
 
 from attr import dataclass
-from fastapi import APIRouter, Security
+from fastapi import APIRouter, Depends, Query, Response, Security
 from fastapi.exceptions import HTTPException
 from fastapi import Header
 from pydantic import BaseModel
-from pydantic.tools import parse_obj_as
 from splash.api.auth import get_current_user
+from splash.api.bulk import BulkRequest, BulkResult, run_bulk
+from splash.api.pagination import CountMode, add_total_count_header, list_response
+from splash.api.etags import etag_header, etag_matches, if_match_etag, not_modified
+from splash.api.projection import fields_query, partial_response
 from splash.service import SplashMetadata
+from splash.service.models import EditElement
 from splash.service.base import ObjectNotFoundError
 
 from ..users import User
-from . import NewTeam, Team
+from . import NewTeam, PartialTeam, PatchTeam, Team
 from .teams_service import TeamsService
 
 teams_router = APIRouter()
@@ -36,21 +40,55 @@ class CreateTeamResponse(BaseModel):
 
 @teams_router.get("", tags=["teams"], response_model=List[Team])
 def read_teams(
+            response: Response,
             page: int = 1,
             page_size: int = 100,
+            after: Optional[str] = Query(None, alias="next"),
+            fields: Optional[List[str]] = Depends(fields_query),
+            count: Optional[CountMode] = Query(None),
             current_user: User = Security(get_current_user)):
-    results = services.teams.retrieve_multiple(current_user, page=page, page_size=page_size)
-    return parse_obj_as(List[Team], list(results))
+    if count is not None:
+        total = services.teams.count(current_user, estimated=count == CountMode.estimated)
+        add_total_count_header(response, total)
+    results = list(services.teams.retrieve_multiple(
+        current_user, page=page, page_size=page_size, after=after, fields=fields))
+    return list_response(response, services.teams, results, page_size, Team, PartialTeam, fields)
 
 
 @teams_router.get("/{uid}", tags=['teams'], response_model=Team)
 def read_team(
             uid: str,
-            current_user: User = Security(get_current_user)):
-    team = services.teams.retrieve_one(current_user, uid)
+            response: Response,
+            current_user: User = Security(get_current_user),
+            fields: Optional[List[str]] = Depends(fields_query),
+            if_none_match: Optional[str] = Header(None)):
+    # A projection is a different representation of the document, so only
+    # whole documents are validated against the etag
+    if if_none_match is not None and fields is None:
+        etag = services.teams.retrieve_etag(current_user, uid)
+        if etag is not None and etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    team = services.teams.retrieve_one(current_user, uid, fields=fields)
+    if fields is not None:
+        return partial_response(team, response)
+    if team is not None:
+        response.headers["ETag"] = etag_header(team["splash_md"]["etag"])
     return team
 
 
+@teams_router.get("/{uid}/edits", tags=['teams'], response_model=List[EditElement])
+def read_team_edits(
+            uid: str,
+            page: int = 1,
+            page_size: int = 10,
+            current_user: User = Security(get_current_user)):
+    try:
+        edits = services.teams.retrieve_edits(current_user, uid, page, page_size)
+    except ObjectNotFoundError:
+        raise HTTPException(404)
+    return list(edits)
+
+
 @teams_router.post("", tags=['teams'], response_model=CreateTeamResponse)
 def create_team(
                 team: NewTeam,
@@ -59,13 +97,32 @@ def create_team(
     return response
 
 
+@teams_router.post("/bulk", tags=['teams'], response_model=List[BulkResult])
+def bulk_teams(
+                request: BulkRequest,
+                current_user: User = Security(get_current_user)):
+    return run_bulk(services.teams, current_user, request.operations, NewTeam, NewTeam)
+
+
 @teams_router.put("/{uid}", tags=['teams'], response_model=CreateTeamResponse)
 def update_team(uid: str,
                 team: NewTeam,
                 current_user: User = Security(get_current_user),
-                if_match: Optional[str] = Header(None)):
+                if_match: Optional[str] = Depends(if_match_etag)):
     try:
         response = services.teams.update(current_user, team, uid, etag=if_match)
     except ObjectNotFoundError:
         raise HTTPException(404)
     return response
+
+
+@teams_router.patch("/{uid}", tags=['teams'], response_model=CreateTeamResponse)
+def patch_team(uid: str,
+               team: PatchTeam,
+               current_user: User = Security(get_current_user),
+               if_match: Optional[str] = Depends(if_match_etag)):
+    try:
+        response = services.teams.patch(current_user, team, uid, etag=if_match)
+    except ObjectNotFoundError:
+        raise HTTPException(404)
+    return response
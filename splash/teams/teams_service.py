@@ -1,52 +1,243 @@
-from typing import Dict, List
+from typing import List
 
 from pymongo import ASCENDING, DESCENDING
-from pymongo.operations import IndexModel
+from pymongo.operations import UpdateOne
 
-from . import NewTeam, Team
+from . import NewTeam, PartialTeam, PatchTeam, Team
 from ..users import User
-from ..service.base import MongoService
+from ..service.async_base import AsyncMongoService
+from ..service.base import MongoService, collated_sort_index
 
 
-class TeamsService(MongoService):
+class TeamsServiceMixin:
+    """What TeamsService and AsyncTeamsService add to their base service without talking to Mongo"""
 
+    default_sort = [("name", ASCENDING), ("splash_md.last_edit", DESCENDING)]
+
+    _claims_version = None
+    _memberships = None
+
+    def set_claims_version(self, claims_version):
+        """Bumps the members of the teams written in `claims_version`, so that access
+        tokens issued to them before stop being trusted for their team names"""
+        self._claims_version = claims_version
+
+    def set_membership_cache(self, cache):
+        """Clears `cache`, the teams of each user cached by RunsService, on every write.
+        A write can add or remove any number of members, so it is cleared whole"""
+        self._memberships = cache
+
+    def _invalidate(self, *uids):
+        super()._invalidate(*uids)
+        if self._memberships is not None:
+            self._memberships.clear()
+        if self._claims_version is not None:
+            self._claims_version.bump_members(self._collection_name, *uids)
+
+    def _bump_removed_members(self, members: list):
+        """Bumps the users that a write removed from a team, which `_invalidate`
+        no longer finds among its members"""
+        if self._claims_version is not None:
+            self._claims_version.bump(*members)
+
+    def _patch_operators(self, current_user: User, data: dict, uid: str, etag=None):
+        query, update, edit = super()._patch_operators(current_user, data, uid, etag)
+        _pull_removed_members(update, data)
+        return query, update, edit
+
+
+class TeamsService(TeamsServiceMixin, MongoService):
     def __init__(self, db, collection_name):
         super().__init__(db, collection_name)
 
     def _create_indexes(self):
         self._collection.create_index("name", unique=True)
-        sort_index = IndexModel([("name", ASCENDING), ("splash_md.last_edit", DESCENDING)])
+        # Multikey, serves get_user_teams
+        self._collection.create_index("member_uids")
+        sort_index = collated_sort_index(self.default_sort)
         self._collection.create_indexes([sort_index])
         super()._create_indexes()
 
     def create(self, current_user: User, team: NewTeam) -> str:
-        return super().create(current_user, team.dict())
+        return super().create(current_user, _with_member_uids(team.dict()))
 
-    def retrieve_one(self, current_user: User, uid: str) -> Team:
-        team = super().retrieve_one(current_user, uid)
-        return team
+    def bulk_create(self, current_user: User, teams: List[NewTeam]) -> list:
+        return super().bulk_create(current_user, [_with_member_uids(team.dict()) for team in teams])
+
+    def retrieve_one(self, current_user: User, uid: str, fields=None) -> Team:
+        team = super().retrieve_one(current_user, uid, fields=fields)
+        return _without_member_uids(team)
 
     def retrieve_multiple(self,
                           current_user: User,
                           page: int = 1,
                           query=None,
                           page_size=10,
-                          sort=[("name", ASCENDING), ("splash_md.last_edit", DESCENDING)]):
-        cursor = super().retrieve_multiple(current_user, page, query, page_size, sort)
+                          sort=TeamsServiceMixin.default_sort,
+                          after=None,
+                          fields=None):
+        cursor = super().retrieve_multiple(current_user, page, query, page_size, sort, after=after, fields=fields)
+        model = Team if fields is None else PartialTeam
         for team_dict in cursor:
-            yield Team(**team_dict)
+            yield model(**_without_member_uids(team_dict))
 
     def update(self, current_user: User, data: Team, uid: str, etag: str = None):
-        return super().update(current_user, data.dict(), uid, etag)
+        previous_members = self._members_of([uid])
+        result = super().update(current_user, _with_member_uids(data.dict()), uid, etag)
+        self._bump_removed_members(previous_members)
+        return result
+
+    def bulk_update(self, current_user: User, items: list) -> list:
+        previous_members = self._members_of([item["uid"] for item in items])
+        results = super().bulk_update(
+            current_user, [{**item, "data": _with_member_uids(item["data"].dict())} for item in items]
+        )
+        self._bump_removed_members(previous_members)
+        return results
+
+    def _members_of(self, uids: list) -> list:
+        """Reads the members of the teams with `uids` before a write that can replace them.
+        A member added by another write in between is only bumped by that write, so a
+        replace without an etag can leave them trusted until their token expires"""
+        if self._claims_version is None:
+            return []
+        teams = self._collection.find({"uid": {"$in": uids}}, {"_id": False, "member_uids": True})
+        return [member for team in teams for member in team.get("member_uids", [])]
+
+    def patch(self, current_user: User, data: PatchTeam, uid: str, etag: str = None):
+        patch = data.dict(exclude_unset=True)
+        result = super().patch(current_user, patch, uid, etag)
+        self._bump_removed_members(_removed_members(patch))
+        added = _added_members(patch)
+        if len(added) > 0:
+            self._add_member_uids(uid, added)
+        return result
+
+    def _add_member_uids(self, uid: str, added: list):
+        """Adds the members that a patch added to member_uids. Each one is only added
+        while it is still in members, so a later write that removed it is not undone"""
+        self._collection.bulk_write(_add_member_uid_requests(uid, added), ordered=False)
+        self._invalidate(uid)
 
     def delete(self, current_user: User, uid):
         raise NotImplementedError
 
     def get_user_teams(self, request_user: User, uid: str):
-        # find teams that contain the member by uid
-        query = {
-            "members." + uid: {"$exists": True}
-        }
-        teams = self.retrieve_multiple(request_user, page=1, query=query)
-        for team in teams:
-            yield team
+        """Yields every team that the user with `uid` is a member of, with only their uid and name"""
+        cursor = self._collection.find(_user_teams_query(uid), _USER_TEAMS_PROJECTION)
+        for team in cursor.sort("name", ASCENDING):
+            yield PartialTeam(**team)
+
+
+class AsyncTeamsService(TeamsServiceMixin, AsyncMongoService):
+    async def create(self, current_user: User, team: NewTeam) -> str:
+        return await super().create(current_user, _with_member_uids(team.dict()))
+
+    async def bulk_create(self, current_user: User, teams: List[NewTeam]) -> list:
+        return await super().bulk_create(current_user, [_with_member_uids(team.dict()) for team in teams])
+
+    async def retrieve_one(self, current_user: User, uid: str, fields=None) -> Team:
+        team = await super().retrieve_one(current_user, uid, fields=fields)
+        return _without_member_uids(team)
+
+    async def retrieve_multiple(self,
+                                current_user: User,
+                                page: int = 1,
+                                query=None,
+                                page_size=10,
+                                sort=TeamsServiceMixin.default_sort,
+                                after=None,
+                                fields=None):
+        cursor = super().retrieve_multiple(current_user, page, query, page_size, sort, after=after, fields=fields)
+        model = Team if fields is None else PartialTeam
+        async for team_dict in cursor:
+            yield model(**_without_member_uids(team_dict))
+
+    async def update(self, current_user: User, data: Team, uid: str, etag: str = None):
+        previous_members = await self._members_of([uid])
+        result = await super().update(current_user, _with_member_uids(data.dict()), uid, etag)
+        self._bump_removed_members(previous_members)
+        return result
+
+    async def bulk_update(self, current_user: User, items: list) -> list:
+        previous_members = await self._members_of([item["uid"] for item in items])
+        results = await super().bulk_update(
+            current_user, [{**item, "data": _with_member_uids(item["data"].dict())} for item in items]
+        )
+        self._bump_removed_members(previous_members)
+        return results
+
+    async def _members_of(self, uids: list) -> list:
+        """Same as TeamsService._members_of"""
+        if self._claims_version is None:
+            return []
+        members = []
+        async for team in self._collection.find({"uid": {"$in": uids}}, {"_id": False, "member_uids": True}):
+            members.extend(team.get("member_uids", []))
+        return members
+
+    async def patch(self, current_user: User, data: PatchTeam, uid: str, etag: str = None):
+        patch = data.dict(exclude_unset=True)
+        result = await super().patch(current_user, patch, uid, etag)
+        self._bump_removed_members(_removed_members(patch))
+        added = _added_members(patch)
+        if len(added) > 0:
+            await self._add_member_uids(uid, added)
+        return result
+
+    async def _add_member_uids(self, uid: str, added: list):
+        await self._collection.bulk_write(_add_member_uid_requests(uid, added), ordered=False)
+        self._invalidate(uid)
+
+    async def get_user_teams(self, request_user: User, uid: str):
+        """Same as TeamsService.get_user_teams"""
+        cursor = self._collection.find(_user_teams_query(uid), _USER_TEAMS_PROJECTION)
+        async for team in cursor.sort("name", ASCENDING):
+            yield PartialTeam(**team)
+
+
+# Teams store the uids of their members in member_uids as well as in the keys of
+# members, as only the array can be indexed. It is not part of the Team model
+def _with_member_uids(team: dict) -> dict:
+    team["member_uids"] = list(team.get("members") or {})
+    return team
+
+
+# get_user_teams reads every team of a user unpaged, so it only reads what identifies them.
+# The membership caches and token claims only need the names
+_USER_TEAMS_PROJECTION = {"_id": False, "uid": True, "name": True}
+
+
+def _user_teams_query(uid: str) -> dict:
+    # Served by the member_uids index
+    return {"member_uids": uid, "splash_md.archived": {"$ne": True}}
+
+
+def _without_member_uids(team):
+    if team is not None:
+        team.pop("member_uids", None)
+    return team
+
+
+# Mongo can't $pull from and $addToSet to the same array in one write. Removed
+# members are pulled by the patch itself, so that nobody who was removed keeps
+# access after the membership caches are cleared. Added members follow right after
+def _pull_removed_members(update: dict, patch: dict):
+    removed = _removed_members(patch)
+    if len(removed) > 0:
+        update["$pull"] = {"member_uids": {"$in": removed}}
+
+
+def _removed_members(patch: dict) -> list:
+    return [member for member, roles in (patch.get("members") or {}).items() if roles is None]
+
+
+def _added_members(patch: dict) -> list:
+    return [member for member, roles in (patch.get("members") or {}).items() if roles is not None]
+
+
+def _add_member_uid_requests(uid: str, added: list) -> list:
+    return [
+        UpdateOne({"uid": uid, f"members.{member}": {"$exists": True}}, {"$addToSet": {"member_uids": member}})
+        for member in added
+    ]
@@ -1,11 +1,13 @@
 from .fixtures.add import (
     mongodb,
     splash_client,
+    async_splash_client,
     token_header,
     api_url_root,
     users,
     teams_service,
     mock_collation_prop,
+    mock_merge_objects,
     test_user1,
     # fresh_mongodb,
 )
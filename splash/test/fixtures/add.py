@@ -1,23 +1,31 @@
+import importlib
 import os
 
 from fastapi.testclient import TestClient
 import mongomock
-from mongomock import collection
+from mongomock import aggregate, collection
+from mongomock_motor import AsyncMongoMockClient
 import pytest
 
+from splash.pages.pages_async_routes import set_async_pages_service
 from splash.pages.pages_routes import set_pages_service
-from splash.pages.pages_service import PagesService
+from splash.pages.pages_service import AsyncPagesService, PagesService
+from splash.references.references_async_routes import set_async_references_service
 from splash.references.references_routes import set_references_service
-from splash.references.references_service import ReferencesService
+from splash.references.references_service import AsyncReferencesService, ReferencesService
 from splash.users import NewUser, User
+from splash.users.users_async_routes import set_async_users_service
 from splash.users.users_routes import set_users_service
-from splash.users.users_service import UsersService
+from splash.users.users_service import AsyncUsersService, UsersService
 from splash.runs.runs_routes import set_runs_service
 from splash.runs.runs_service import RunsService, TeamRunChecker
 from splash.teams import NewTeam
+from splash.teams.teams_async_routes import set_async_teams_service
 from splash.teams.teams_routes import set_teams_service
-from splash.teams.teams_service import TeamsService
+from splash.teams.teams_service import AsyncTeamsService, TeamsService
+from splash.api import main
 from splash.api.auth import create_access_token, set_services as set_auth_services
+from splash.api.config import ConfigStore
 
 
 from splash.api.main import app
@@ -27,7 +35,10 @@ os.environ["GOOGLE_CLIENT_ID"] = "Gollum"
 os.environ["GOOGLE_CLIENT_SECRET"] = "the_one_ring"
 
 
-db = mongomock.MongoClient().db
+mongo_client = mongomock.MongoClient()
+db = mongo_client.db
+# The async services read and write the same mock database as the sync ones
+async_db = AsyncMongoMockClient(mock_mongo_client=mongo_client).db
 users_svc = UsersService(db, "users")
 pages_svc = PagesService(db, "pages", "pages_old")
 references_svc = ReferencesService(db, "references")
@@ -39,6 +50,10 @@ set_references_service(references_svc)
 set_runs_service(runs_svc)
 set_teams_service(teams_svc)
 set_users_service(users_svc)
+set_async_pages_service(AsyncPagesService(async_db, "pages", "pages_old"))
+set_async_references_service(AsyncReferencesService(async_db, "references"))
+set_async_teams_service(AsyncTeamsService(async_db, "teams"))
+set_async_users_service(AsyncUsersService(async_db, "users"))
 
 
 def collationMock(self, collation):
@@ -51,6 +66,25 @@ def mock_collation_prop(monkeypatch):
     monkeypatch.setattr(collection.Cursor, "collation", collationMock)
 
 
+_parse_expression = aggregate._Parser.parse
+
+
+def parseMergeObjectsMock(self, expression):
+    # mongomock does not implement $mergeObjects, which updates use to merge splash_md
+    if isinstance(expression, dict) and list(expression) == ["$mergeObjects"]:
+        merged = {}
+        for value in self.parse_many(expression["$mergeObjects"]):
+            if value is not None:
+                merged.update(value)
+        return merged
+    return _parse_expression(self, expression)
+
+
+@pytest.fixture(scope="function", autouse=True)
+def mock_merge_objects(monkeypatch):
+    monkeypatch.setattr(aggregate._Parser, "parse", parseMergeObjectsMock)
+
+
 @pytest.fixture
 def mongodb():
     return db
@@ -109,6 +143,16 @@ def splash_client(mongodb, test_user1, monkeypatch):
     return client
 
 
+@pytest.fixture
+def async_splash_client(splash_client, monkeypatch):
+    # The routers are picked when splash.api.main is imported, so it is
+    # imported again with ASYNC_ROUTES, and once more to put the sync ones back
+    monkeypatch.setattr(ConfigStore, "ASYNC_ROUTES", True)
+    yield TestClient(importlib.reload(main).app)
+    monkeypatch.undo()
+    importlib.reload(main)
+
+
 @pytest.fixture
 def token_header():
     token = create_access_token(token_info1)
@@ -82,6 +82,9 @@ class Catalog(dict):
     # def __init__(self) -> None:
     #     return super().__init__()
 
+    def force_reload(self):
+        pass
+
     def search(self, query, skip=0, limit=None):
         data_groups_filter = query["$and"][0]["data_groups"]
         data_groups = data_groups_filter.get("$in")
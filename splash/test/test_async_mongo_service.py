@@ -0,0 +1,97 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+import pytest
+
+from splash.service.async_base import AsyncMongoService, AsyncVersionedMongoService
+from splash.service.base import (
+    ArchiveConflictError,
+    EtagMismatchError,
+    ImmutableMetadataField,
+    ObjectNotFoundError,
+    VersionNotFoundError,
+)
+from splash.users import User
+
+
+@pytest.fixture
+def request_user():
+    return User(
+        splash_md={
+            "creator": "NONE",
+            "create_date": "2020-01-7T13:40:53",
+            "last_edit": "2020-01-7T13:40:53",
+            "edit_record": [],
+            "etag": "170abbfa-5ce9-49ba-8072-69edb6c263a7",
+        },
+        uid="foobar",
+        given_name="ford",
+        family_name="prefect",
+        email="ford@beetleguice.planet",
+    )
+
+
+@pytest.fixture
+def async_db():
+    return AsyncMongoMockClient().db
+
+
+def test_async_crud(async_db, request_user: User):
+    async def run():
+        service = AsyncMongoService(async_db, "elves")
+        with pytest.raises(ImmutableMetadataField):
+            await service.create(request_user, {"name": "Legolas", "splash_md": {"etag": "foo"}})
+
+        response = await service.create(request_user, {"name": "Legolas"})
+        uid = response["uid"]
+        document = await service.retrieve_one(request_user, uid)
+        assert document["name"] == "Legolas"
+        assert document["splash_md"]["creator"] == "foobar"
+
+        updated = await service.update(request_user, {"name": "Thranduil"}, uid, etag=response["splash_md"]["etag"])
+        assert updated["splash_md"]["etag"] != response["splash_md"]["etag"]
+        with pytest.raises(EtagMismatchError):
+            await service.update(request_user, {"name": "Elrond"}, uid, etag=response["splash_md"]["etag"])
+        with pytest.raises(ObjectNotFoundError):
+            await service.update(request_user, {"name": "Elrond"}, "does_not_exist")
+
+        await service.patch(request_user, {"home": "Mirkwood"}, uid)
+        document = await service.retrieve_one(request_user, uid)
+        assert document["name"] == "Thranduil"
+        assert document["home"] == "Mirkwood"
+        edits = [edit async for edit in await service.retrieve_edits(request_user, uid)]
+        assert len(edits) == 2
+
+        await service.archive_action(request_user, "archive", uid)
+        with pytest.raises(ArchiveConflictError):
+            await service.archive_action(request_user, "archive", uid)
+        assert [doc async for doc in service.retrieve_multiple(request_user)] == []
+        assert len([doc async for doc in service.retrieve_archived(request_user)]) == 1
+
+    asyncio.run(run())
+
+
+def test_async_versioned(async_db, request_user: User):
+    async def run():
+        service = AsyncVersionedMongoService(async_db, "elves", "elves_old")
+        response = await service.create(request_user, {"name": "Celebrimbor"})
+        uid = response["uid"]
+        assert response["splash_md"]["version"] == 1
+
+        await service.update(request_user, {"name": "Celebrimbor", "Occupation": "Ringmaker"}, uid)
+        await service.patch(request_user, {"Occupation": "Smith"}, uid)
+        assert await service.get_num_versions(request_user, uid) == 3
+        assert "Occupation" not in await service.retrieve_version(request_user, uid, 1)
+        assert (await service.retrieve_version(request_user, uid, 2))["Occupation"] == "Ringmaker"
+        assert (await service.retrieve_version(request_user, uid, 3))["Occupation"] == "Smith"
+        with pytest.raises(VersionNotFoundError):
+            await service.retrieve_version(request_user, uid, 4)
+        with pytest.raises(ObjectNotFoundError):
+            await service.retrieve_version(request_user, "does_not_exist", 1)
+
+        results = await service.bulk_update(
+            request_user, [{"uid": uid, "data": {"name": "Annatar"}, "etag": "foo"}]
+        )
+        assert results[0]["err"] == "etag_mismatch_error"
+
+    asyncio.run(run())
@@ -0,0 +1,154 @@
+import copy
+
+from .testing_utils import equal_dicts, generic_test_api_crud, generic_test_etag_functionality
+
+# The same requests as the sync route tests, served by the async routers on Motor.
+# async_splash_client shares the mock database with splash_client
+
+
+def test_async_crud(api_url_root, async_splash_client, token_header):
+    generic_test_api_crud(copy.deepcopy(new_page), api_url_root + "/pages", async_splash_client, token_header)
+    generic_test_api_crud(copy.deepcopy(new_team), api_url_root + "/teams", async_splash_client, token_header)
+    generic_test_api_crud(copy.deepcopy(new_user), api_url_root + "/users", async_splash_client, token_header)
+
+
+def test_async_etag_functionality(api_url_root, async_splash_client, token_header):
+    generic_test_etag_functionality(
+        copy.deepcopy(new_page), api_url_root + "/pages", async_splash_client, token_header
+    )
+    generic_test_etag_functionality(
+        copy.deepcopy(new_user), api_url_root + "/users", async_splash_client, token_header
+    )
+
+
+def test_async_list_pages(api_url_root, async_splash_client, token_header):
+    url = api_url_root + "/pages"
+    for title in ["Huorn", "Ent", "Mallorn"]:
+        post_resp = async_splash_client.post(
+            url, json={**new_page, "title": title, "page_type": "async_trees"}, headers=token_header
+        )
+        assert post_resp.status_code == 200, f"{post_resp.status_code}: response is {post_resp.content}"
+
+    response = async_splash_client.get(url + "/page_type/async_trees?page_size=2&count=exact", headers=token_header)
+    assert response.status_code == 200, f"{response.status_code}: response is {response.content}"
+    assert [page["title"] for page in response.json()] == ["Ent", "Huorn"]
+    assert response.headers["X-Total-Count"] == "3"
+    # Whole pages are validated against the Page model
+    assert all(page["references"] == new_page["references"] for page in response.json())
+    assert all(page["splash_md"]["version"] == 1 for page in response.json())
+
+    response = async_splash_client.get(
+        url + "/page_type/async_trees?page_size=2&next=" + response.headers["X-Next-Page-Token"],
+        headers=token_header,
+    )
+    assert [page["title"] for page in response.json()] == ["Mallorn"]
+    assert "X-Next-Page-Token" not in response.headers
+
+    response = async_splash_client.get(url + "/page_type/async_trees?fields=title", headers=token_header)
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+    assert all("documentation" not in page and "references" not in page for page in response.json())
+
+
+def test_async_archived_pages(api_url_root, async_splash_client, token_header):
+    url = api_url_root + "/pages"
+    doc = {**new_page, "title": "Athelas", "page_type": "async_herbs"}
+    uid = async_splash_client.post(url, json=doc, headers=token_header).json()["uid"]
+
+    patch_resp = async_splash_client.patch(url + "/" + uid, json={"archive_action": "archive"}, headers=token_header)
+    assert patch_resp.status_code == 200, f"{patch_resp.status_code}: response is {patch_resp.content}"
+    patch_resp2 = async_splash_client.patch(url + "/" + uid, json={"archive_action": "archive"}, headers=token_header)
+    assert patch_resp2.status_code == 409
+    assert patch_resp2.json() == {"err": "already_archived"}
+
+    archived = [page for page in async_splash_client.get(url + "/archived", headers=token_header).json()
+                if page["uid"] == uid]
+    assert len(archived) == 1
+    equal_dicts(archived[0], doc, ignore_keys=["uid", "splash_md"])
+    assert archived[0]["splash_md"] == patch_resp.json()["splash_md"]
+
+    response = async_splash_client.get(url + "/page_type/async_herbs", headers=token_header)
+    assert response.json() == []
+
+    # The sync route tests expect to archive the only archived page
+    patch_resp = async_splash_client.patch(url + "/" + uid, json={"archive_action": "restore"}, headers=token_header)
+    assert patch_resp.status_code == 200
+    assert len(async_splash_client.get(url + "/page_type/async_herbs", headers=token_header).json()) == 1
+
+
+def test_async_patch_page(api_url_root, async_splash_client, splash_client, token_header):
+    url = api_url_root + "/pages"
+    uid = async_splash_client.post(url, json=new_page, headers=token_header).json()["uid"]
+
+    patch_resp = async_splash_client.patch(url + "/" + uid, json={"title": "Niphredil"}, headers=token_header)
+    assert patch_resp.status_code == 200, f"{patch_resp.status_code}: response is {patch_resp.content}"
+    assert patch_resp.json()["splash_md"]["version"] == 2
+    patch_resp = async_splash_client.patch(url + "/" + uid, json={}, headers=token_header)
+    assert patch_resp.status_code == 422
+
+    # Both routers read the same documents and history
+    for client in [async_splash_client, splash_client]:
+        assert client.get(url + "/" + uid, headers=token_header).json()["title"] == "Niphredil"
+        assert client.get(url + "/" + uid + "?version=1", headers=token_header).json()["title"] == new_page["title"]
+        versions = client.get(url + "/" + uid + "/versions", headers=token_header).json()
+        assert [version["splash_md"]["version"] for version in versions] == [2, 1]
+
+
+def test_async_references(api_url_root, async_splash_client, token_header):
+    url = api_url_root + "/references"
+    post_resp = async_splash_client.post(url, json=new_reference, headers=token_header)
+    assert post_resp.status_code == 200, f"{post_resp.status_code}: response is {post_resp.content}"
+    uid = post_resp.json()["uid"]
+
+    response = async_splash_client.get(url + "/uid/" + uid, headers=token_header)
+    assert response.status_code == 200
+    assert response.json()["title"] == new_reference["title"]
+    response = async_splash_client.get(url + "?page_size=100", headers=token_header)
+    assert uid in [reference["uid"] for reference in response.json()]
+
+    patch_resp = async_splash_client.patch(url + "/uid/" + uid, json={"title": "Red Book"}, headers=token_header)
+    assert patch_resp.status_code == 200
+    assert async_splash_client.get(url + "/uid/" + uid, headers=token_header).json()["title"] == "Red Book"
+
+
+def test_async_list_teams(api_url_root, async_splash_client, token_header):
+    url = api_url_root + "/teams"
+    post_resp = async_splash_client.post(url, json={**new_team, "name": "async_fellowship"}, headers=token_header)
+    assert post_resp.status_code == 200, f"{post_resp.status_code}: response is {post_resp.content}"
+
+    teams = async_splash_client.get(url, headers=token_header).json()
+    team = next(team for team in teams if team["uid"] == post_resp.json()["uid"])
+    # member_uids is only stored to be indexed
+    assert "member_uids" not in team
+    assert team["members"] == new_team["members"]
+
+
+new_page = {
+    "title": "Elanor",
+    "page_type": "async_flowers",
+    "documentation": "A small golden flower",
+    "references": [{"uid": "ffff-ffff-fffff-fffff", "in_text": False}],
+}
+
+new_team = {
+    "name": "async_team",
+    "members": {
+        "frodo": ["member", "leader"],
+        "sam": ["member"],
+    },
+}
+
+new_user = {
+    "given_name": "peregrin",
+    "family_name": "took",
+    "email": "pippin@shire.me",
+    "authenticators": [
+        {"issuer": "accounts.google.com", "subject": "fool_of_a_took", "email": "pippin@shire.me"}
+    ],
+}
+
+new_reference = {
+    "type": "book",
+    "title": "There and Back Again",
+    "author": [{"given": "Bilbo", "family": "Baggins"}],
+}
@@ -0,0 +1,52 @@
+from splash.service.cache import TTLCache, cache_stats, register_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_and_lru():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    clock.now = 10
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+
+def test_generation():
+    cache = TTLCache()
+    generation = cache.generation
+    cache.pop("a")
+    # A value read before the invalidation is dropped
+    cache.put("a", 1, generation)
+    assert cache.get("a") is None
+    cache.put("a", 1, cache.generation)
+    assert cache.get("a") == 1
+    cache.clear()
+    assert cache.get("a") is None
+
+
+def test_stats():
+    cache = TTLCache()
+    register_cache("test.stats", cache)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+    stats = cache_stats()["test.stats"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["size"] == 1
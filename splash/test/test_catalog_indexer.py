@@ -0,0 +1,48 @@
+import time
+
+from splash.runs.indexer import CatalogIndexer
+from splash.runs.run_summaries import RunSummaries
+from splash.runs.runs_service import RunsService, TeamRunChecker
+
+from .runs_definitions import Catalog, MockRun
+
+
+class TimedCatalog(dict):
+    def search(self, query, skip=0, limit=None):
+        since = query.get("time", {}).get("$gt")
+        return {uid: run for uid, run in self.items() if since is None or run.metadata['start']['time'] > since}
+
+
+def timed_run(start_time, complete):
+    run = MockRun(['same_team'])
+    run.metadata['start']['time'] = start_time
+    run.metadata['stop'] = {'num_events': {}} if complete else None
+    return run
+
+
+def test_index_catalogs(monkeypatch, mongodb, teams_service):
+    now = time.time()
+    beamtime = TimedCatalog({
+        "first": timed_run(now - 300, True),
+        "open": timed_run(now - 200, False),
+        "last": timed_run(now - 100, True),
+    })
+    monkeypatch.setattr('splash.runs.runs_service.catalog', Catalog({"beamtime": beamtime}))
+    monkeypatch.setattr('splash.runs.runs_service.project_summary_dict', lambda run: ({}, []))
+    mongodb.run_summaries.delete_many({})
+    mongodb.run_index_checkpoints.delete_many({})
+    summaries = RunSummaries(mongodb, "run_summaries")
+    indexer = CatalogIndexer(RunsService(teams_service, TeamRunChecker(), summaries), summaries, mongodb)
+
+    assert indexer.index_all() == 3
+    # The open run holds the mark back
+    assert mongodb.run_index_checkpoints.find_one({"_id": "beamtime"})["time"] == now - 300
+
+    beamtime["open"].metadata['stop'] = {'num_events': {}}
+    assert indexer.index_all() == 1, 'the last run is stored complete already'
+    assert summaries.get_many("beamtime", ["open"])["open"]["complete"] is True
+    assert mongodb.run_index_checkpoints.find_one({"_id": "beamtime"})["time"] == now - 100
+
+    beamtime["new"] = timed_run(now - 50, True)
+    assert indexer.index_all() == 1
+    assert indexer.index_all() == 0
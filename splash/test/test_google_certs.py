@@ -0,0 +1,79 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import threading
+import time
+
+import pytest
+
+from splash.api.google_certs import CachingRequest
+
+
+class CertsHandler(BaseHTTPRequestHandler):
+    # Stands in for Google's certs endpoint
+    requests = 0
+    cache_control = "public, max-age=600, must-revalidate, no-transform"
+
+    def do_GET(self):
+        CertsHandler.requests += 1
+        body = json.dumps({"key1": f"cert {CertsHandler.requests}"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Cache-Control", self.cache_control)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def certs_url():
+    CertsHandler.requests = 0
+    server = HTTPServer(("127.0.0.1", 0), CertsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/certs"
+    server.shutdown()
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_certs_cached_for_max_age(certs_url):
+    clock = Clock()
+    request = CachingRequest(refresh_ahead=60, clock=clock)
+    assert json.loads(request(certs_url).data) == {"key1": "cert 1"}
+    clock.now = 500
+    assert json.loads(request(certs_url).data) == {"key1": "cert 1"}
+    assert CertsHandler.requests == 1
+
+    # Close to expiring, the cached certs are returned while new ones are fetched
+    clock.now = 580
+    assert json.loads(request(certs_url).data) == {"key1": "cert 1"}
+    wait_for(lambda: request.fetches == 2)
+    assert json.loads(request(certs_url).data) == {"key1": "cert 2"}
+
+    # Expired certs are fetched before returning
+    clock.now = 2000
+    assert json.loads(request(certs_url).data) == {"key1": "cert 3"}
+    assert CertsHandler.requests == 3
+
+
+def test_uncacheable_certs(certs_url, monkeypatch):
+    monkeypatch.setattr(CertsHandler, "cache_control", "no-store")
+    request = CachingRequest()
+    request(certs_url)
+    request(certs_url)
+    assert CertsHandler.requests == 2
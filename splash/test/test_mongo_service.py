@@ -1,13 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import threading
+from splash.service.cache import TTLCache
 from splash.service.models import PrivateSplashMetadata
+from splash.service.pagination import with_uid_tiebreak
+from splash.pages.pages_service import PagesService
+from splash.teams.teams_service import TeamsService
 from splash.test.testing_utils import equal_dicts
 from splash.users import User
+from splash.users.users_service import UsersService
 import pytest
 from splash.service.base import (
     ArchiveConflictError,
+    BadPageArgument,
+    BadPageToken,
+    BadProjectionArgument,
     EtagMismatchError,
+    LIST_COLLATION,
     MongoService,
     ImmutableMetadataField,
+    InvalidPatchError,
     ObjectNotFoundError,
     RestoreConflictError,
 )
@@ -153,6 +165,117 @@ def test_retrieve_multiple_errors(
         mongo_service.retrieve_multiple(request_user_1, sort=None)
 
 
+def test_page_token(mongo_service: MongoService, request_user_1: User):
+    # the auto tick is smaller than a second, so several documents share a
+    # last_edit and only the uid tiebreak keeps the pages apart
+    with freeze_time(mock_times[0], tz_offset=-4, auto_tick_seconds=0.4):
+        for elf in [celebrimbor, legolas, galadriel, elrond, celebrimbor_2, celebrimbor_3]:
+            mongo_service.create(request_user_1, deepcopy(elf))
+
+    all_elves = list(mongo_service.retrieve_multiple(request_user_1, page_size=10))
+    assert len(all_elves) == 6
+
+    paged_elves = []
+    after = None
+    while True:
+        elves = list(mongo_service.retrieve_multiple(request_user_1, page_size=4, after=after))
+        paged_elves.extend(elves)
+        if len(elves) < 4:
+            break
+        after = mongo_service.page_token(elves[-1])
+
+    assert [elf["uid"] for elf in paged_elves] == [elf["uid"] for elf in all_elves]
+
+    by_name = [("name", 1)]
+    first_page = list(mongo_service.retrieve_multiple(request_user_1, page_size=3, sort=by_name))
+    after = mongo_service.page_token(first_page[-1], sort=by_name)
+    second_page = list(mongo_service.retrieve_multiple(request_user_1, page_size=3, sort=by_name, after=after))
+    assert [elf["name"] for elf in first_page + second_page] == [
+        "Celebrimbor", "Celebrimbor", "Celebrimbor", "Elrond", "Galadriel", "Legolas"
+    ]
+
+
+def test_page_token_null_sort_values(mongo_service: MongoService, request_user_1: User):
+    # Missing values sort before every other value, and a token can resume from one
+    for elf in [celebrimbor, {"Occupation": "Smith"}, legolas, {"Occupation": "Scout"}, galadriel]:
+        mongo_service.create(request_user_1, deepcopy(elf))
+
+    for by_name in [[("name", 1)], [("name", -1)]]:
+        all_elves = list(mongo_service.retrieve_multiple(request_user_1, page_size=10, sort=by_name))
+        paged_elves = []
+        after = None
+        while True:
+            elves = list(mongo_service.retrieve_multiple(request_user_1, page_size=2, sort=by_name, after=after))
+            paged_elves.extend(elves)
+            if len(elves) < 2:
+                break
+            after = mongo_service.page_token(elves[-1], sort=by_name)
+        assert [elf["uid"] for elf in paged_elves] == [elf["uid"] for elf in all_elves]
+        assert len(paged_elves) == 5
+
+
+def test_sort_indexes_collation(monkeypatch):
+    # A sort only uses an index with the same collation, which mongomock does not keep
+    created = {}
+
+    def create_indexes(self, indexes, *args, **kwargs):
+        for index in indexes:
+            created.setdefault(self.name, []).append(index.document)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "create_indexes", create_indexes)
+    db = mongomock.MongoClient().db
+    services = [
+        MongoService(db, "elves"),
+        PagesService(db, "pages", "pages_old"),
+        TeamsService(db, "teams"),
+        UsersService(db, "users"),
+    ]
+    for service in services:
+        for sort in [MongoService.default_sort, service.default_sort]:
+            keys = with_uid_tiebreak(sort)
+            index = next(index for index in created[service._collection_name] if list(index["key"].items()) == keys)
+            assert index["collation"] == LIST_COLLATION.document
+
+
+def test_page_token_errors(mongo_service: MongoService, request_user_1: User):
+    response = mongo_service.create(request_user_1, deepcopy(celebrimbor))
+    document = mongo_service.retrieve_one(request_user_1, response["uid"])
+    after = mongo_service.page_token(document)
+
+    with pytest.raises(BadPageToken):
+        mongo_service.retrieve_multiple(request_user_1, after="not a token")
+    with pytest.raises(BadPageToken):
+        mongo_service.retrieve_multiple(request_user_1, after=after, sort=[("name", 1), ("Occupation", 1)])
+    with pytest.raises(BadPageArgument):
+        mongo_service.retrieve_multiple(request_user_1, page=2, after=after)
+
+
+def test_projection(mongo_service: MongoService, request_user_1: User):
+    with freeze_time(mock_times[0], tz_offset=-4, auto_tick_seconds=15):
+        for elf in [celebrimbor, legolas, galadriel]:
+            mongo_service.create(request_user_1, deepcopy(elf))
+
+    elves = list(mongo_service.retrieve_multiple(request_user_1, fields=["name"]))
+    assert len(elves) == 3
+    for elf in elves:
+        # uid and the sort keys are always read so that page tokens can be built
+        assert set(elf.keys()) == {"uid", "name", "splash_md"}
+        assert set(elf["splash_md"].keys()) == {"last_edit"}
+    assert [elf["name"] for elf in elves] == ["Galadriel", "Legolas", "Celebrimbor"]
+
+    after = mongo_service.page_token(elves[0])
+    elves = list(mongo_service.retrieve_multiple(request_user_1, fields=["name", "splash_md"], after=after))
+    assert [elf["name"] for elf in elves] == ["Legolas", "Celebrimbor"]
+    assert "etag" in elves[0]["splash_md"]
+
+    elf = mongo_service.retrieve_one(request_user_1, elves[0]["uid"], fields=["Occupation"])
+    assert elf == {"uid": elves[0]["uid"], "Occupation": legolas["Occupation"]}
+
+    for bad_fields in ["name", ["$where"], ["_id"], [""]]:
+        with pytest.raises(BadProjectionArgument):
+            mongo_service.retrieve_one(request_user_1, elves[0]["uid"], fields=bad_fields)
+
+
 def test_edits(mongo_service: MongoService, request_user_1: User, request_user_2: User):
     with freeze_time(mock_times[0], tz_offset=-4, as_arg=True) as frozen_datetime:
         response = mongo_service.create(
@@ -201,6 +324,32 @@ def test_edits(mongo_service: MongoService, request_user_1: User, request_user_2
         assert edit_record[1]["user"] == request_user_2.uid
 
 
+def test_edit_log(mongo_service: MongoService, request_user_1: User, request_user_2: User, monkeypatch):
+    monkeypatch.setattr(mongo_service, "edit_record_limit", 2)
+    with freeze_time(mock_times[0], tz_offset=-4, auto_tick_seconds=15):
+        response = mongo_service.create(request_user_1, deepcopy(celebrimbor))
+        uid = response["uid"]
+        mongo_service.update(request_user_1, deepcopy(celebrimbor_2), uid)
+        mongo_service.patch(request_user_2, {"Occupation": "Smith"}, uid)
+        mongo_service.archive_action(request_user_1, "archive", uid)
+
+    document = mongo_service.retrieve_one(request_user_1, uid)
+    edit_record = document["splash_md"]["edit_record"]
+    # only the tail is kept inline
+    assert [edit["user"] for edit in edit_record] == [request_user_2.uid, request_user_1.uid]
+
+    edits = list(mongo_service.retrieve_edits(request_user_1, uid))
+    assert [edit["user"] for edit in edits] == [request_user_1.uid, request_user_2.uid, request_user_1.uid]
+    assert edits[0] == edit_record[-1]
+    assert edits[0]["date"] > edits[1]["date"] > edits[2]["date"]
+
+    second_page = list(mongo_service.retrieve_edits(request_user_1, uid, page=2, page_size=2))
+    assert second_page == edits[2:]
+
+    with pytest.raises(ObjectNotFoundError):
+        list(mongo_service.retrieve_edits(request_user_1, "uid_does_not_exist"))
+
+
 def test_edit_ordering(mongo_service: MongoService, request_user_1: User, monkeypatch):
     with freeze_time(mock_times[0], tz_offset=-4, auto_tick_seconds=15):
         response = mongo_service.create(
@@ -316,6 +465,151 @@ def test_etag_functionality(mongo_service: MongoService, request_user_1: User):
     assert doc_2 == document_2
 
 
+def test_update_replaces_in_one_write(mongo_service: MongoService, request_user_1: User, monkeypatch):
+    response = mongo_service.create(request_user_1, {"name": "Elrond", "home": "Rivendell", "ring": "Vilya"})
+    uid = response["uid"]
+
+    def no_second_write(*args, **kwargs):
+        raise AssertionError("an update must be a single write")
+
+    monkeypatch.setattr(mongo_service._collection, "update_one", no_second_write)
+    monkeypatch.setattr(mongo_service._collection, "update_many", no_second_write)
+    # Values are stored as they are, not read as field paths or expressions
+    updated = mongo_service.update(
+        request_user_1, {"name": "$ring", "home": {"$literal": "Grey Havens"}}, uid, etag=response["splash_md"]["etag"]
+    )
+    document = mongo_service.retrieve_one(request_user_1, uid)
+    assert document["name"] == "$ring"
+    assert document["home"] == {"$literal": "Grey Havens"}
+    # Fields missing from the new body are gone
+    assert "ring" not in document
+    assert document["splash_md"] == updated["splash_md"]
+    assert document["splash_md"]["creator"] == response["splash_md"]["creator"]
+    assert len(document["splash_md"]["edit_record"]) == 1
+
+    results = mongo_service.bulk_update(request_user_1, [{"uid": uid, "data": {"name": "Elrond"}}])
+    document = mongo_service.retrieve_one(request_user_1, uid)
+    assert document == {"uid": uid, "name": "Elrond", "splash_md": results[0]["splash_md"]}
+    assert len(document["splash_md"]["edit_record"]) == 2
+
+
+@pytest.fixture
+def atomic_writes(mongo_service: MongoService, monkeypatch):
+    # mongomock runs find_one_and_update as a find followed by an update, which
+    # the server does atomically. Serialize them so that the concurrency tests
+    # exercise the service and not the thread safety of mongomock
+    lock = threading.Lock()
+    find_one_and_update = mongo_service._collection.find_one_and_update
+
+    def atomic_find_one_and_update(*args, **kwargs):
+        with lock:
+            return find_one_and_update(*args, **kwargs)
+
+    monkeypatch.setattr(mongo_service._collection, "find_one_and_update", atomic_find_one_and_update)
+
+
+@pytest.mark.usefixtures("atomic_writes")
+def test_concurrent_updates_with_same_etag(mongo_service: MongoService, request_user_1: User):
+    response = mongo_service.create(request_user_1, deepcopy(celebrimbor))
+    uid = response["uid"]
+    etag = response["splash_md"]["etag"]
+    num_writers = 16
+    start = threading.Barrier(num_writers)
+
+    def write(writer):
+        start.wait()
+        try:
+            mongo_service.update(request_user_1, {"name": "Celebrimbor", "writer": writer}, uid, etag=etag)
+            return True
+        except EtagMismatchError:
+            return False
+
+    with ThreadPoolExecutor(max_workers=num_writers) as executor:
+        results = list(executor.map(write, range(num_writers)))
+
+    # Every writer raced with the same etag, so exactly one of them may win
+    assert results.count(True) == 1
+    document = mongo_service.retrieve_one(request_user_1, uid)
+    assert document["writer"] == results.index(True)
+    assert len(document["splash_md"]["edit_record"]) == 1
+
+
+@pytest.mark.usefixtures("atomic_writes")
+def test_concurrent_updates_do_not_lose_edits(mongo_service: MongoService, request_user_1: User):
+    response = mongo_service.create(request_user_1, {"count": 0})
+    uid = response["uid"]
+    num_writers = 8
+    writes_per_writer = 5
+
+    def write(writer):
+        written = 0
+        while written < writes_per_writer:
+            document = mongo_service.retrieve_one(request_user_1, uid)
+            try:
+                mongo_service.update(
+                    request_user_1,
+                    {"count": document["count"] + 1},
+                    uid,
+                    etag=document["splash_md"]["etag"],
+                )
+                written += 1
+            except EtagMismatchError:
+                continue
+
+    with ThreadPoolExecutor(max_workers=num_writers) as executor:
+        list(executor.map(write, range(num_writers)))
+
+    document = mongo_service.retrieve_one(request_user_1, uid)
+    assert document["count"] == num_writers * writes_per_writer
+    edits = list(mongo_service.retrieve_edits(request_user_1, uid, page_size=100))
+    assert len(edits) == num_writers * writes_per_writer
+
+
+def test_patch(mongo_service: MongoService, request_user_1: User, request_user_2: User):
+    with freeze_time(mock_times[0], tz_offset=-4, as_arg=True) as frozen_datetime:
+        response = mongo_service.create(
+            request_user_1,
+            {"name": "Celebrimbor", "Occupation": "Ringmaker", "rings": {"elves": 3, "dwarves": 7}},
+        )
+        uid = response["uid"]
+        frozen_datetime.move_to(mock_times[1])
+        patch_resp = mongo_service.patch(
+            request_user_2,
+            {"Occupation": None, "title": "Lord of Eregion", "rings": {"men": 9, "dwarves": None}},
+            uid,
+            etag=response["splash_md"]["etag"],
+        )
+
+        document = mongo_service.retrieve_one(request_user_1, uid)
+        equal_dicts(
+            document,
+            {"name": "Celebrimbor", "title": "Lord of Eregion", "rings": {"elves": 3, "men": 9}},
+            ignore_keys,
+        )
+        metadata = document["splash_md"]
+        assert metadata == patch_resp["splash_md"]
+        assert metadata["create_date"] == mock_times[0]
+        assert metadata["last_edit"] == mock_times[1]
+        assert metadata["etag"] != response["splash_md"]["etag"]
+        assert metadata["edit_record"] == [{"date": mock_times[1], "user": request_user_2.uid}]
+
+    with pytest.raises(EtagMismatchError):
+        mongo_service.patch(request_user_1, {"name": "Annatar"}, uid, etag=response["splash_md"]["etag"])
+    assert mongo_service.retrieve_one(request_user_1, uid) == document
+
+    with pytest.raises(ObjectNotFoundError):
+        mongo_service.patch(request_user_1, {"name": "Annatar"}, "uid_does_not_exist")
+
+    for bad_patch in [{"$where": 1}, {"rings.elves": 4}, {"_id": 1}, {}, {"rings": {}}]:
+        with pytest.raises(InvalidPatchError):
+            mongo_service.patch(request_user_1, bad_patch, uid)
+
+    for field in immutable_fields:
+        with pytest.raises(ImmutableMetadataField):
+            mongo_service.patch(request_user_1, {"splash_md": {field: None}}, uid)
+    assert mongo_service.retrieve_one(request_user_1, uid) == document
+
+
 # This is to make sure that documents that have None as the value work
 # The same as docs that don't have any 'archived' key
 archived_status_none = {
@@ -486,3 +780,141 @@ def test_archive_and_restore_etag(mongo_service: MongoService, request_user_1: U
         mongo_service.archive_action(request_user_1, 'restore', response["uid"], etag="bad_etag")
 
     mongo_service.archive_action(request_user_1, 'restore', response["uid"], etag=response['splash_md']['etag'])
+
+
+def test_bulk_create(mongo_service: MongoService, request_user_1: User):
+    mongo_service._collection.create_index("name", unique=True)
+    results = mongo_service.bulk_create(
+        request_user_1,
+        [
+            {"name": "Ford"},
+            {"name": "Arthur", "uid": "foobar"},
+            {"name": "Ford"},
+            {"name": "Trillian", "splash_md": {"etag": "foo"}},
+            {"name": "Zaphod"},
+        ],
+    )
+    assert len(results) == 5
+    assert results[0]["splash_md"]["creator"] == "foobar"
+    assert results[1]["err"] == "validation_error"
+    assert results[2]["err"] == "duplicate_key"
+    assert results[3]["err"] == "validation_error"
+    assert "err" not in results[4]
+    assert mongo_service.retrieve_one(request_user_1, results[4]["uid"])["name"] == "Zaphod"
+    assert mongo_service._collection.count_documents({}) == 2
+
+
+def test_bulk_update(mongo_service: MongoService, request_user_1: User, request_user_2: User):
+    first = mongo_service.create(request_user_1, {"name": "Ford"})
+    second = mongo_service.create(request_user_1, {"name": "Arthur"})
+    third = mongo_service.create(request_user_1, {"name": "Zaphod"})
+
+    results = mongo_service.bulk_update(
+        request_user_2,
+        [
+            {"uid": first["uid"], "data": {"name": "Ford Prefect"}, "etag": first["splash_md"]["etag"]},
+            {"uid": second["uid"], "data": {"name": "Arthur Dent"}, "etag": "foo"},
+            {"uid": "does_not_exist", "data": {"name": "Marvin"}},
+            {"uid": third["uid"], "data": {"name": "Zaphod Beeblebrox"}},
+            {"uid": third["uid"], "data": {"name": "Zaphod"}},
+            {"uid": first["uid"], "data": {"name": "Ford", "splash_md": {"creator": "me"}}},
+        ],
+    )
+    assert results[0]["splash_md"]["etag"] != first["splash_md"]["etag"]
+    assert results[0]["splash_md"]["edit_record"][-1]["user"] == "barfoo"
+    assert results[1]["err"] == "etag_mismatch_error"
+    assert results[1]["etag"] == second["splash_md"]["etag"]
+    assert results[2]["err"] == "not_found"
+    assert "err" not in results[3]
+    assert results[4]["err"] == "validation_error"
+    assert results[5]["err"] == "validation_error"
+
+    assert mongo_service.retrieve_one(request_user_1, first["uid"])["name"] == "Ford Prefect"
+    assert mongo_service.retrieve_one(request_user_1, second["uid"])["name"] == "Arthur"
+    assert mongo_service.retrieve_one(request_user_1, third["uid"])["name"] == "Zaphod Beeblebrox"
+    assert len(list(mongo_service.retrieve_edits(request_user_1, first["uid"]))) == 1
+    assert len(list(mongo_service.retrieve_edits(request_user_1, second["uid"]))) == 0
+
+
+def test_bulk_archive_action(mongo_service: MongoService, request_user_1: User):
+    first = mongo_service.create(request_user_1, {"name": "Ford"})
+    second = mongo_service.create(request_user_1, {"name": "Arthur"})
+    mongo_service.archive_action(request_user_1, "archive", second["uid"])
+
+    results = mongo_service.bulk_archive_action(
+        request_user_1,
+        "archive",
+        [{"uid": first["uid"]}, {"uid": second["uid"]}, {"uid": "does_not_exist"}],
+    )
+    assert results[0]["splash_md"]["archived"] is True
+    assert results[1]["err"] == "already_archived"
+    assert results[2]["err"] == "not_found"
+
+    results = mongo_service.bulk_archive_action(
+        request_user_1,
+        "restore",
+        [{"uid": first["uid"], "etag": "foo"}, {"uid": second["uid"]}],
+    )
+    assert results[0]["err"] == "etag_mismatch_error"
+    assert results[1]["splash_md"]["archived"] is False
+
+    with pytest.raises(ValueError):
+        mongo_service.bulk_archive_action(request_user_1, "foo", [{"uid": first["uid"]}])
+
+
+def test_count(mongo_service: MongoService, request_user_1: User, monkeypatch):
+    first = mongo_service.create(request_user_1, {"name": "Ford", "planet": "Betelgeuse"})
+    mongo_service.create(request_user_1, {"name": "Arthur", "planet": "Earth"})
+    assert mongo_service.count(request_user_1) == 2
+    assert mongo_service.count(request_user_1, {"planet": "Earth"}) == 1
+    assert mongo_service.count(request_user_1, estimated=True) == 2
+
+    # Cached counts are served without a query
+    calls = []
+    count_documents = mongo_service._collection.count_documents
+    monkeypatch.setattr(
+        mongo_service._collection, "count_documents", lambda query: calls.append(query) or count_documents(query)
+    )
+    assert mongo_service.count(request_user_1, {"planet": "Earth"}) == 1
+    assert len(calls) == 0
+
+    # Writes through the service invalidate them
+    mongo_service.create(request_user_1, {"name": "Trillian", "planet": "Earth"})
+    assert mongo_service.count(request_user_1, {"planet": "Earth"}) == 2
+    mongo_service.archive_action(request_user_1, "archive", first["uid"])
+    assert mongo_service.count(request_user_1) == 2
+    assert mongo_service.count(request_user_1, exclude_archived=False) == 3
+    mongo_service.update(request_user_1, {"name": "Trillian", "planet": "Earth"}, first["uid"])
+    assert mongo_service.count(request_user_1, {"planet": "Earth"}) == 2
+    assert len(calls) == 4
+
+
+def test_document_cache(mongo_service: MongoService, request_user_1: User, monkeypatch):
+    # Off unless configured, it is only safe with a single server process
+    assert mongo_service._documents is None
+    assert PagesService(mongomock.MongoClient().db, "pages", "pages_old")._documents is None
+    cache = TTLCache()
+    mongo_service.set_document_cache(cache)
+    uid = mongo_service.create(request_user_1, {"name": "Ford"})["uid"]
+    document = mongo_service.retrieve_one(request_user_1, uid)
+    assert document["name"] == "Ford"
+    # Changing what we got back does not change the cache
+    document["name"] = "Arthur"
+    assert mongo_service.retrieve_one(request_user_1, uid)["name"] == "Ford"
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+    mongo_service.update(request_user_1, {"name": "Ford Prefect"}, uid)
+    assert mongo_service.retrieve_one(request_user_1, uid)["name"] == "Ford Prefect"
+    mongo_service.archive_action(request_user_1, "archive", uid)
+    assert mongo_service.retrieve_one(request_user_1, uid)["splash_md"]["archived"] is True
+    mongo_service.patch(request_user_1, {"planet": "Betelgeuse"}, uid)
+    assert mongo_service.retrieve_one(request_user_1, uid)["planet"] == "Betelgeuse"
+    assert cache.misses == 4
+
+    # Projections are read from the database
+    assert mongo_service.retrieve_one(request_user_1, uid, fields=["name"]) == {"uid": uid, "name": "Ford Prefect"}
+    assert cache.hits + cache.misses == 5
+
+    mongo_service.delete(request_user_1, uid)
+    assert mongo_service.retrieve_one(request_user_1, uid) is None
@@ -426,3 +426,293 @@ empty_string_title = {
                     removal and reduce fouling during nanofiltration/reverse osmosis",
     "references": [],
 }
+
+
+def test_next_page_token(api_url_root, splash_client, token_header):
+    url = api_url_root + "/pages"
+    for title in ["Ent", "Eagle", "Warg"]:
+        post_resp = splash_client.post(
+            url,
+            json={
+                "title": title,
+                "page_type": "paged_animals",
+                "documentation": "Hello",
+                "references": [],
+            },
+            headers=token_header,
+        )
+        assert post_resp.status_code == 200
+
+    response = splash_client.get(
+        url + "/page_type/paged_animals?page_size=2", headers=token_header
+    )
+    assert response.status_code == 200
+    assert [page["title"] for page in response.json()] == ["Eagle", "Ent"]
+    token = response.headers["X-Next-Page-Token"]
+
+    response = splash_client.get(
+        url + "/page_type/paged_animals?page_size=2&next=" + token, headers=token_header
+    )
+    assert response.status_code == 200
+    assert [page["title"] for page in response.json()] == ["Warg"]
+    assert "X-Next-Page-Token" not in response.headers
+
+    response = splash_client.get(url + "?next=garbage", headers=token_header)
+    assert (
+        response.status_code == 422
+    ), f"{response.status_code}: response is {response.content}"
+
+
+def test_patch_page(api_url_root, splash_client, token_header):
+    url = api_url_root + "/pages"
+    doc = {
+        "title": "Nightingale",
+        "page_type": "birds",
+        "documentation": "A bird that sings at night",
+        "references": [],
+    }
+    post_resp = splash_client.post(url, json=copy.deepcopy(doc), headers=token_header)
+    uid = post_resp.json()["uid"]
+
+    patch_resp = splash_client.patch(
+        url + "/" + uid,
+        json={"title": "Common nightingale"},
+        headers={"If-Match": post_resp.json()["splash_md"]["etag"], **token_header},
+    )
+    assert patch_resp.status_code == 200, f"response is {patch_resp.content}"
+    get_resp = splash_client.get(url + "/" + uid, headers=token_header)
+    equal_dicts(get_resp.json(), {**doc, "title": "Common nightingale"}, ignore_keys=["uid", "splash_md"])
+    assert get_resp.json()["splash_md"]["version"] == 2
+    assert patch_resp.json()["splash_md"] == get_resp.json()["splash_md"]
+
+    patch_resp = splash_client.patch(
+        url + "/" + uid,
+        json={"title": "Thrush nightingale"},
+        headers={"If-Match": post_resp.json()["splash_md"]["etag"], **token_header},
+    )
+    assert patch_resp.status_code == 412
+
+    patch_resp = splash_client.patch(url + "/" + uid, json={"title": None}, headers=token_header)
+    assert patch_resp.status_code == 422
+    patch_resp = splash_client.patch(url + "/" + uid, json={"colour": "brown"}, headers=token_header)
+    assert patch_resp.status_code == 422
+    patch_resp = splash_client.patch(url + "/" + uid, json={}, headers=token_header)
+    assert patch_resp.status_code == 422
+    assert splash_client.get(url + "/" + uid, headers=token_header).json()["splash_md"]["version"] == 2
+    patch_resp = splash_client.patch(url + "/does_not_exist", json={"title": "Lark"}, headers=token_header)
+    assert patch_resp.status_code == 404
+
+
+def test_fields_projection(api_url_root, splash_client, token_header):
+    url = api_url_root + "/pages"
+    post_resp = splash_client.post(
+        url,
+        json={
+            "title": "Oliphaunt",
+            "page_type": "projected_animals",
+            "documentation": "A very long description of a very large animal",
+            "references": [],
+        },
+        headers=token_header,
+    )
+    uid = post_resp.json()["uid"]
+
+    response = splash_client.get(
+        url + "/page_type/projected_animals?fields=title,page_type", headers=token_header
+    )
+    assert response.status_code == 200, f"response is {response.content}"
+    pages = response.json()
+    assert len(pages) == 1
+    assert pages[0]["title"] == "Oliphaunt"
+    assert pages[0]["uid"] == uid
+    assert "documentation" not in pages[0]
+    assert "references" not in pages[0]
+
+    response = splash_client.get(url + "/" + uid + "?fields=documentation", headers=token_header)
+    assert response.status_code == 200
+    assert response.json() == {
+        "uid": uid,
+        "documentation": "A very long description of a very large animal",
+    }
+
+    response = splash_client.get(url + "/" + uid + "?fields=$where", headers=token_header)
+    assert response.status_code == 422
+
+
+def test_bulk_pages(api_url_root, splash_client, token_header):
+    url = api_url_root + "/pages/bulk"
+    doc = {
+        "title": "Nightingale",
+        "page_type": "birds",
+        "documentation": "A bird that sings at night",
+        "references": [],
+    }
+    bulk_resp = splash_client.post(
+        url,
+        json={"operations": [
+            {"op": "create", "data": doc},
+            {"op": "create", "data": {**doc, "title": ""}},
+            {"op": "update", "data": doc},
+        ]},
+        headers=token_header,
+    )
+    assert bulk_resp.status_code == 200, f"response is {bulk_resp.content}"
+    results = bulk_resp.json()
+    assert results[0]["err"] is None
+    assert results[0]["splash_md"]["version"] == 1
+    assert results[1]["err"] == "validation_error"
+    assert results[2]["err"] == "validation_error"
+    uid = results[0]["uid"]
+    etag = results[0]["splash_md"]["etag"]
+
+    bulk_resp = splash_client.post(
+        url,
+        json={"operations": [
+            {"op": "update", "uid": uid, "etag": etag, "data": {**doc, "title": "Common nightingale"}},
+            {"op": "archive", "uid": "does_not_exist"},
+        ]},
+        headers=token_header,
+    )
+    results = bulk_resp.json()
+    assert results[0]["splash_md"]["version"] == 2
+    assert results[1]["err"] == "not_found"
+
+    bulk_resp = splash_client.post(
+        url,
+        json={"operations": [{"op": "archive", "uid": uid, "etag": etag}]},
+        headers=token_header,
+    )
+    assert bulk_resp.json()[0]["err"] == "etag_mismatch_error"
+    assert bulk_resp.json()[0]["etag"] == results[0]["splash_md"]["etag"]
+
+    get_resp = splash_client.get(api_url_root + "/pages/" + uid, headers=token_header)
+    assert get_resp.json()["title"] == "Common nightingale"
+
+    bulk_resp = splash_client.post(url, json={"operations": []}, headers=token_header)
+    assert bulk_resp.status_code == 422
+
+
+def test_total_count(api_url_root, splash_client, token_header):
+    url = api_url_root + "/pages"
+    doc = {
+        "title": "Blackbird",
+        "page_type": "thrushes",
+        "documentation": "A common thrush",
+        "references": [],
+    }
+    splash_client.post(url, json=copy.deepcopy(doc), headers=token_header)
+    response = splash_client.get(url + "/page_type/thrushes", headers=token_header)
+    assert "X-Total-Count" not in response.headers
+    response = splash_client.get(url + "/page_type/thrushes?count=exact", headers=token_header)
+    assert response.headers["X-Total-Count"] == "1"
+
+    splash_client.post(url, json={**doc, "title": "Song thrush"}, headers=token_header)
+    response = splash_client.get(url + "/page_type/thrushes?count=exact", headers=token_header)
+    assert response.headers["X-Total-Count"] == "2"
+
+    response = splash_client.get(url + "?count=estimated", headers=token_header)
+    assert int(response.headers["X-Total-Count"]) >= 2
+    response = splash_client.get(url + "?count=foo", headers=token_header)
+    assert response.status_code == 422
+
+
+def test_conditional_get(api_url_root, splash_client, token_header):
+    url = api_url_root + "/pages"
+    doc = {
+        "title": "Wren",
+        "page_type": "songbirds",
+        "documentation": "A small brown bird",
+        "references": [],
+    }
+    uid = splash_client.post(url, json=doc, headers=token_header).json()["uid"]
+    response = splash_client.get(url + "/" + uid, headers=token_header)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag == '"' + response.json()["splash_md"]["etag"] + '"'
+
+    response = splash_client.get(url + "/" + uid, headers={**token_header, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    response = splash_client.get(url + "/" + uid, headers={**token_header, "If-None-Match": '"foo", W/' + etag})
+    assert response.status_code == 304
+
+    # The ETag header can be sent back as it is in If-Match
+    response = splash_client.put(
+        url + "/" + uid, json={**doc, "title": "Wren!"}, headers={**token_header, "If-Match": etag})
+    assert response.status_code == 200
+    response = splash_client.get(url + "/" + uid, headers={**token_header, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "Wren!"
+    assert response.headers["ETag"] != etag
+
+    response = splash_client.get(url + "/foo", headers={**token_header, "If-None-Match": etag})
+    assert response.status_code == 404
+
+
+def test_page_versions(api_url_root, splash_client, token_header):
+    url = api_url_root + "/pages"
+    doc = {
+        "title": "Robin",
+        "page_type": "songbirds",
+        "documentation": "Version 1",
+        "references": [],
+    }
+    uid = splash_client.post(url, json=doc, headers=token_header).json()["uid"]
+    for version in range(2, 6):
+        splash_client.put(url + "/" + uid, json={**doc, "documentation": f"Version {version}"}, headers=token_header)
+
+    response = splash_client.get(url + "/" + uid + "/versions?page_size=3", headers=token_header)
+    assert response.status_code == 200
+    versions = response.json()
+    assert [version["splash_md"]["version"] for version in versions] == [5, 4, 3]
+    assert all(set(version["splash_md"]) == {"version", "last_edit", "editor"} for version in versions)
+    assert "documentation" not in versions[0]
+
+    token = response.headers["X-Next-Page-Token"]
+    response = splash_client.get(url + "/" + uid + "/versions?page_size=3&next=" + token, headers=token_header)
+    assert [version["splash_md"]["version"] for version in response.json()] == [2, 1]
+    assert "X-Next-Page-Token" not in response.headers
+
+    response = splash_client.get(url + "/" + uid + "/versions?next=foo", headers=token_header)
+    assert response.status_code == 422
+    response = splash_client.get(url + "/foo/versions", headers=token_header)
+    assert response.status_code == 404
+
+
+def test_page_diff(api_url_root, splash_client, token_header):
+    url = api_url_root + "/pages"
+    doc = {
+        "title": "Starling",
+        "page_type": "songbirds",
+        "documentation": "Line one\nLine two\nLine three",
+        "references": [],
+    }
+    uid = splash_client.post(url, json=doc, headers=token_header).json()["uid"]
+    splash_client.put(
+        url + "/" + uid,
+        json={**doc, "title": "Common starling", "documentation": "Line one\nLine 2\nLine three"},
+        headers=token_header,
+    )
+
+    response = splash_client.get(url + "/" + uid + "/diff?from=1&to=2", headers=token_header)
+    assert response.status_code == 200
+    diff = response.json()
+    assert diff["from_version"] == 1 and diff["to_version"] == 2
+    fields = {field["field"]: field for field in diff["fields"]}
+    assert set(fields) == {"title", "documentation"}
+    assert fields["title"] == {"field": "title", "change": "changed", "old": "Starling", "new": "Common starling"}
+    assert "-Line two" in fields["documentation"]["lines"]
+    assert "+Line 2" in fields["documentation"]["lines"]
+    assert "old" not in fields["documentation"]
+
+    # The same diff again comes from the cache
+    assert splash_client.get(url + "/" + uid + "/diff?from=1&to=2", headers=token_header).json() == diff
+    response = splash_client.get(url + "/" + uid + "/diff?from=2&to=2", headers=token_header)
+    assert response.json()["fields"] == []
+
+    response = splash_client.get(url + "/" + uid + "/diff?from=1&to=3", headers=token_header)
+    assert response.status_code == 404
+    response = splash_client.get(url + "/foo/diff?from=1&to=2", headers=token_header)
+    assert response.status_code == 404
+    response = splash_client.get(url + "/" + uid + "/diff?from=0&to=2", headers=token_header)
+    assert response.status_code == 422
@@ -158,6 +158,43 @@ def test_etag_functionality(
     assert get_resp3.json() == get_resp2.json()
 
 
+def test_patch_reference(api_url_root, splash_client, token_header):
+    url_path = api_url_root + "/references"
+    post_resp = create_resource(api_url_root, splash_client, token_header, reference_3)
+    uid = post_resp.json()["uid"]
+
+    patch_resp = splash_client.patch(url_path + "/uid/" + uid, json={"title": "Mithril"}, headers=token_header)
+    assert patch_resp.status_code == 200, f"{patch_resp.status_code}: response is {patch_resp.content}"
+    get_resp = splash_client.get(url_path + "/uid/" + uid, headers=token_header)
+    assert get_resp.json()["title"] == "Mithril"
+
+    # The body can neither set the uid nor the metadata kept by the service, and must change something
+    for bad_patch in [{"uid": "test"}, {"splash_md": {"etag": "abc"}}, {"splash_md": {"creator": "Sauron"}}, {}]:
+        patch_resp = splash_client.patch(url_path + "/uid/" + uid, json=bad_patch, headers=token_header)
+        assert patch_resp.status_code == 422, f"{patch_resp.status_code}: response is {patch_resp.content}"
+    assert splash_client.get(url_path + "/uid/" + uid, headers=token_header).json() == get_resp.json()
+
+
+def test_replace_missing_reference(api_url_root, splash_client, token_header):
+    url_path = api_url_root + "/references"
+    response = splash_client.put(url_path + "/uid/does_not_exist", json=copy.deepcopy(reference_4), headers=token_header)
+    assert response.status_code == 404, f"{response.status_code}: response is {response.content}"
+
+
+def test_fields_projection(api_url_root, splash_client, token_header):
+    url_path = api_url_root + "/references"
+    uid = create_resource(api_url_root, splash_client, token_header, reference_3).json()["uid"]
+
+    response = splash_client.get(url_path + "/uid/" + uid + "?fields=title", headers=token_header)
+    assert response.status_code == 200, f"{response.status_code}: response is {response.content}"
+    assert response.json() == {"uid": uid, "title": reference_3["title"]}
+    # A projection is a different representation, so it carries no etag
+    assert "ETag" not in response.headers
+
+    response = splash_client.get(url_path + "/uid/" + uid, headers=token_header)
+    assert response.headers["ETag"] == f'"{response.json()["splash_md"]["etag"]}"'
+
+
 def test_retrieve_by_DOI(api_url_root, splash_client, token_header):
     url_path = api_url_root + "/references"
     post_resp1 = create_resource(api_url_root, splash_client, token_header, reference_5)
@@ -75,6 +75,15 @@ def test_list_runs_catalog_doesnt_exist(api_url_root, splash_client: TestClient,
     response_data = json.loads(response.content)
     assert response_data['detail'] == 'Catalog name: does_not_exist is not a catalog'
 
+
+def test_refresh_catalogs(api_url_root, splash_client: TestClient, leader_token, token_header, monkeypatch):
+    monkeypatch.setattr('splash.runs.runs_service.catalog', root_catalog)
+    response = splash_client.post(api_url_root + "/runs/refresh", headers=leader_token)
+    assert response.status_code == 403
+    response = splash_client.post(api_url_root + "/runs/refresh", headers=token_header)
+    assert response.status_code == 200
+    assert response.json() == list(root_catalog.keys())
+
 #  temporarily removed until support is re-introduced
 # def test_get_image_bad_frame(api_url_root, splash_client: TestClient, leader_token, teams_service):
 #     response = splash_client.get(api_url_root + "/runs/root_catalog/same_team_1/image?frame=blah",
@@ -1,12 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import time
 
 import pytest
 
-from splash.runs.runs_service import RunsService, TeamRunChecker
-from splash.service.authorization import AccessDenied
+from splash.runs.run_summaries import RunSummaries
+from splash.runs.runs_service import CatalogDoesNotExist, RunsService, TeamRunChecker
+from splash.service.authorization import AccessDenied, Action
+from splash.teams import PatchTeam
 
 
-from .runs_definitions import root_catalog
+from .runs_definitions import Catalog, root_catalog
 
 
 @pytest.mark.usefixtures("splash_client", "users", "teams_service")
@@ -21,6 +25,22 @@ def test_get_runs_auth(monkeypatch, teams_service, users):
     assert len(runs) == 1, 'one run available to use who is a member of other_team'
 
 
+def test_membership_cache(monkeypatch, teams_service, users):
+    runs_service = RunsService(teams_service, TeamRunChecker())
+    monkeypatch.setattr('splash.runs.runs_service.catalog', root_catalog)
+    cache = runs_service._memberships
+    runs_service.get_runs(users['leader'], "root_catalog")
+    runs_service.get_runs(users['leader'], "root_catalog")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # A team write clears the cache, the new member sees the team's runs straight away
+    team = next(teams_service.get_user_teams(users['other_team'], users['other_team'].uid))
+    teams_service.patch(users['leader'], PatchTeam(members={users['leader'].uid: ["guest"]}), team.uid)
+    assert len(cache) == 0
+    runs = runs_service.get_runs(users['leader'], "root_catalog")
+    assert len(runs) == 3
+
+
 def test_thumb_auth(monkeypatch, teams_service, users, tmpdir):
     checker = TeamRunChecker()
     runs_service = RunsService(teams_service, checker)
@@ -50,7 +70,6 @@ def test_thumb_auth(monkeypatch, teams_service, users, tmpdir):
 #         slice_meta_data = runs_service.get_slice_metadata(users['leader'], "root_catalog", 'other_team_1', 0)
 
 
-
 # def test_slice_image_auth(monkeypatch, teams_service, users):
 #     checker = TeamRunChecker()
 #     runs_service = RunsService(teams_service, checker)
@@ -60,3 +79,77 @@ def test_thumb_auth(monkeypatch, teams_service, users, tmpdir):
 #     assert image_array is not None, 'retrieved slice image for run user has access to'
 #     with pytest.raises(AccessDenied):
 #         image_array = runs_service.get_slice_image(users['leader'], "root_catalog", 'other_team_1', 'image_data', 0, raw_bytes=True)
+
+
+def test_run_access(users):
+    access = TeamRunChecker().for_user(users['leader'], ["same_team", "other_team"])
+    assert access.can_retrieve(["same_team", "nobody"])
+    assert access.can_retrieve(["nobody", "same_team"])
+    assert not access.can_retrieve(["nobody"])
+    assert not access.can_retrieve([])
+    # Data groups are compared as sets, one decision per combination
+    assert len(access._decisions) == 2
+    assert TeamRunChecker().can_do(users['leader'], ["other_team"], Action.RETRIEVE, team_names=["other_team"])
+
+
+def test_get_runs_timeout(monkeypatch, teams_service, users):
+    runs_service = RunsService(teams_service, TeamRunChecker())
+    runs_service.summary_timeout = 0.5
+    monkeypatch.setattr('splash.runs.runs_service.catalog', root_catalog)
+    slow_run = root_catalog['root_catalog']['same_team_1']
+
+    def projection(run):
+        if run is slow_run:
+            time.sleep(2)
+        return {"sample_name": "cloudy water"}, []
+
+    monkeypatch.setattr('splash.runs.runs_service.project_summary_dict', projection)
+    runs = runs_service.get_runs(users['leader'], "root_catalog")
+    assert [run.uid for run in runs] == ['same_team_2'], 'the slow run is left out of the page'
+
+
+def test_stored_summaries(monkeypatch, mongodb, teams_service, users):
+    summaries = RunSummaries(mongodb, "run_summaries")
+    mongodb.run_summaries.delete_many({})
+    runs_service = RunsService(teams_service, TeamRunChecker(), summaries)
+    monkeypatch.setattr('splash.runs.runs_service.catalog', root_catalog)
+    runs = runs_service.get_runs(users['leader'], "root_catalog")
+    assert len(runs) == 2
+    stored = summaries.get_many("root_catalog", ['same_team_1', 'same_team_2', 'other_team_1'])
+    assert sorted(stored) == ['same_team_1', 'same_team_2']
+    assert stored['same_team_1']['data_groups'] == ['same_team']
+    assert stored['same_team_1']['complete'] is False
+
+    # Complete runs are read back from the store, open runs are projected again
+    mongodb.run_summaries.update_one({"uid": 'same_team_1'}, {"$set": {"complete": True}})
+
+    def projection(run):
+        raise ValueError("projected again")
+
+    monkeypatch.setattr('splash.runs.runs_service.project_summary_dict', projection)
+    runs = runs_service.get_runs(users['leader'], "root_catalog")
+    assert [run.uid for run in runs] == ['same_team_1']
+    assert runs[0].data_groups is None
+
+
+def test_catalog_cache(monkeypatch, teams_service):
+    opened = []
+
+    class SlowCatalog(Catalog):
+        def __getitem__(self, name):
+            opened.append(name)
+            time.sleep(0.2)
+            return super().__getitem__(name)
+
+    monkeypatch.setattr('splash.runs.runs_service.catalog', SlowCatalog(root_catalog))
+    runs_service = RunsService(teams_service, TeamRunChecker())
+    with ThreadPoolExecutor(8) as pool:
+        catalogs = list(pool.map(lambda _: runs_service.get_catalog("root_catalog"), range(8)))
+    assert opened == ["root_catalog"], 'concurrent requests open the catalog once'
+    assert all(requested is root_catalog["root_catalog"] for requested in catalogs)
+
+    with pytest.raises(CatalogDoesNotExist):
+        runs_service.get_catalog("does_not_exist")
+    runs_service.refresh_catalogs()
+    runs_service.get_catalog("root_catalog")
+    assert opened == ["root_catalog", "does_not_exist", "root_catalog"]
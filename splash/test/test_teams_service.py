@@ -1,6 +1,6 @@
 import pytest
 from splash.teams.teams_service import TeamsService
-from splash.teams import NewTeam
+from splash.teams import NewTeam, PatchTeam
 from splash.users import User
 from freezegun import freeze_time
 
@@ -25,6 +25,7 @@ def request_user():
 @pytest.fixture
 def teams_service(mongodb, request_user):
     teams_service = TeamsService(mongodb, "teams")
+    mongodb.teams.delete_many({})
     with freeze_time("2020-02-9T13:40:53", tz_offset=-4, auto_tick_seconds=15):
         teams_service.create(
             request_user,
@@ -64,3 +65,40 @@ def test_get_user_teams(teams_service: TeamsService, request_user):
     assert len(teams) == 2
     assert teams[0].name == "banesto"
     assert teams[1].name == "motorola"
+    # Only what identifies the teams is read
+    assert teams[0].members is None
+
+    # Every team is returned, there is no page size
+    for number in range(12):
+        teams_service.create(request_user, NewTeam(name=f"team_{number:02}", members={"shared_user": ["domestique"]}))
+    teams = list(teams_service.get_user_teams(request_user, "shared_user"))
+    assert len(teams) == 14
+
+
+def test_member_uids(teams_service: TeamsService, request_user, mongodb, monkeypatch):
+    banesto = next(teams_service.get_user_teams(request_user, "indurain"))
+    assert "member_uids" not in teams_service.retrieve_one(request_user, banesto.uid)
+    stored = mongodb.teams.find_one({"uid": banesto.uid})
+    assert sorted(stored["member_uids"]) == ["delgado", "indurain", "shared_user"]
+
+    # A patch can add and remove members at once. Removed members are gone
+    # from member_uids by the time the membership caches are cleared
+    member_uids_at_invalidate = []
+
+    def invalidate(*uids):
+        member_uids_at_invalidate.append(mongodb.teams.find_one({"uid": banesto.uid})["member_uids"])
+
+    with monkeypatch.context() as patched:
+        patched.setattr(teams_service, "_invalidate", invalidate)
+        teams_service.patch(
+            request_user, PatchTeam(members={"indurain": None, "olano": ["domestique"]}), banesto.uid
+        )
+    assert "indurain" not in member_uids_at_invalidate[0]
+    assert "olano" in member_uids_at_invalidate[-1]
+    assert list(teams_service.get_user_teams(request_user, "indurain")) == []
+    teams = list(teams_service.get_user_teams(request_user, "olano"))
+    assert len(teams) == 1 and teams[0].name == "banesto"
+
+    teams_service.update(request_user, NewTeam(name="banesto", members={"delgado": ["legend"]}), banesto.uid)
+    assert list(teams_service.get_user_teams(request_user, "olano")) == []
+    assert [team.name for team in teams_service.get_user_teams(request_user, "shared_user")] == ["motorola"]
@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 
 from .testing_utils import generic_test_api_crud, generic_test_etag_functionality
@@ -28,3 +30,58 @@ new_user = {
         }
     ],
 }
+
+
+def test_token_claims(api_url_root, splash_client, mongodb, teams_service, users, monkeypatch):
+    from splash.api import auth
+    from splash.api.auth import authorization_claims, create_access_token
+    from splash.service.claims import ClaimsVersion
+    from splash.teams import NewTeam, PatchTeam
+    from splash.users import TokenUser
+
+    claims_version = ClaimsVersion(mongodb, "authz_test")
+    monkeypatch.setattr(auth.services, "teams", teams_service)
+    monkeypatch.setattr(auth.services, "claims", claims_version)
+    monkeypatch.setattr(teams_service, "_claims_version", claims_version)
+    leader = users["leader"]
+    claims = authorization_claims(leader)
+    assert claims == {"admin": False, "teams": ["same_team"], "v": 0}
+    token = create_access_token({"sub": leader.uid, "scopes": ["splash"], "authz": claims})
+    header = {"Authorization": f"Bearer {token}"}
+
+    user = asyncio.run(auth.user_from_claims(leader.uid, claims))
+    assert isinstance(user, TokenUser)
+    assert user.teams == ["same_team"] and user.splash_md.admin is False
+
+    def no_reads(uid):
+        raise AssertionError("the user was read")
+
+    monkeypatch.setattr(auth.services.users, "insecure_get_user", no_reads)
+    response = splash_client.get(api_url_root + "/users/" + leader.uid, headers=header)
+    assert response.status_code == 200
+
+    # Versions are kept per user, so writes to other users and their teams leave the claims alone
+    claims_version.bump(users["other_team"].uid)
+    other_team = next(teams_service.get_user_teams(leader, users["other_team"].uid))
+    teams_service.patch(leader, PatchTeam(name="another_team"), other_team.uid)
+    response = splash_client.get(api_url_root + "/users/" + leader.uid, headers=header)
+    assert response.status_code == 200
+
+    # Removing the user from a team makes their claims stale, they are not trusted anymore
+    same_team = next(teams_service.get_user_teams(leader, leader.uid))
+    teams_service.patch(leader, PatchTeam(members={leader.uid: None}), same_team.uid)
+    assert asyncio.run(auth.user_from_claims(leader.uid, claims)) is None
+    monkeypatch.delattr(auth.services.users, "insecure_get_user")
+    response = splash_client.get(api_url_root + "/users/" + leader.uid, headers=header)
+    assert response.status_code == 200
+
+    # So does adding them back, a replace that drops them and a write to the user
+    assert authorization_claims(leader) == {"admin": False, "teams": [], "v": 1}
+    teams_service.update(leader, NewTeam(name="same_team", members={leader.uid: ["leader"]}), same_team.uid)
+    claims = authorization_claims(leader)
+    assert claims == {"admin": False, "teams": ["same_team"], "v": 2}
+    teams_service.update(leader, NewTeam(name="same_team", members={}), same_team.uid)
+    assert asyncio.run(auth.user_from_claims(leader.uid, claims)) is None
+    claims = authorization_claims(leader)
+    claims_version.bump(leader.uid)
+    assert asyncio.run(auth.user_from_claims(leader.uid, claims)) is None
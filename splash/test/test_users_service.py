@@ -120,3 +120,19 @@ def test_regular_no_admin_prop_cannot_edit(users_service: UsersService, regular_
         users_service.delete(regular_user_no_admin_prop, uid)
 
     return
+
+
+def test_user_cache(users_service: UsersService, admin_user):
+    uid = users_service.create(admin_user, NewUser(given_name="Gothmog", family_name="Balrog"))["uid"]
+    user = users_service.insecure_get_user(uid)
+    assert user.given_name == "Gothmog"
+    assert users_service.insecure_get_user(uid) is user
+    assert users_service._users.hits == 1
+
+    # Writes through the service drop the cached user
+    users_service.update(admin_user, NewUser(given_name="Gothmog", family_name="Lord of Balrogs"), uid)
+    assert users_service.insecure_get_user(uid).family_name == "Lord of Balrogs"
+    assert users_service.insecure_get_user("does not exist") is None
+
+    users_service.set_user_cache(None)
+    assert users_service.insecure_get_user(uid) is not users_service.insecure_get_user(uid)
@@ -6,6 +6,7 @@ from splash.service.base import (
     VersionedMongoService,
     ObjectNotFoundError,
     ImmutableMetadataField,
+    UidInDictError,
 )
 import mongomock
 
@@ -131,6 +132,32 @@ def test_conflict_resolution(versioned_service: VersionedMongoService, request_u
     assert result is None
 
 
+def test_update_checks_base_metadata(versioned_service: VersionedMongoService, request_user: User):
+    uid = versioned_service.create(request_user, {"name": "Elrond"})["uid"]
+    document = versioned_service.retrieve_one(request_user, uid)
+    with pytest.raises(UidInDictError):
+        versioned_service.update(request_user, {"name": "Elrond", "uid": "Rivendell"}, uid)
+    for field in ["creator", "etag", "edit_record", "create_date"]:
+        with pytest.raises(ImmutableMetadataField):
+            versioned_service.update(request_user, {"name": "Elrond", "splash_md": {field: "Sauron"}}, uid)
+    assert versioned_service.retrieve_one(request_user, uid) == document
+    assert versioned_service._versions_svc._collection.count_documents({"uid": uid}) == 0
+
+
+def test_update_history(versioned_service: VersionedMongoService, request_user: User):
+    versioned_service.edit_record_limit = 2
+    uid = versioned_service.create(request_user, {"name": "Elrond"})["uid"]
+    previous = versioned_service.retrieve_one(request_user, uid)
+    for version in range(2, 5):
+        response = versioned_service.update(request_user, {"name": f"Elrond {version}"}, uid)
+        # The version that was replaced goes into the history as it was
+        assert versioned_service.retrieve_version(request_user, uid, version - 1) == previous
+        previous = versioned_service.retrieve_one(request_user, uid)
+        assert previous["splash_md"] == response["splash_md"]
+        assert previous["splash_md"]["version"] == version
+        assert len(previous["splash_md"]["edit_record"]) == min(version - 1, 2)
+    assert versioned_service._versions_svc._collection.count_documents({"uid": uid}) == 3
+
 
 def test_retrieve_version(versioned_service: VersionedMongoService, request_user: User):
     create_resp = versioned_service.create(
@@ -208,3 +235,94 @@ def test_get_num_versions(versioned_service: VersionedMongoService, request_user
 
     with pytest.raises(ObjectNotFoundError):
         versioned_service.get_num_versions(request_user, "this_uid_does_not_exist")
+
+
+def test_versioned_patch(versioned_service: VersionedMongoService, request_user: User):
+    create_resp = versioned_service.create(
+        request_user, {"name": "Sauron", "Occupation": "Industrialist", "alias": "Annatar"}
+    )
+    uid = create_resp["uid"]
+
+    with pytest.raises(ImmutableMetadataField, match="Cannot mutate field: `version` in `splash_md`"):
+        versioned_service.patch(request_user, {"splash_md": {"version": 5}}, uid)
+
+    with pytest.raises(EtagMismatchError):
+        versioned_service.patch(request_user, {"Occupation": "Dark Lord"}, uid, etag="wrong_etag")
+    assert versioned_service._versions_svc.retrieve_one(request_user, uid) is None
+
+    patch_resp = versioned_service.patch(
+        request_user, {"Occupation": "Dark Lord", "alias": None}, uid, etag=create_resp["splash_md"]["etag"]
+    )
+    document_2 = versioned_service.retrieve_one(request_user, uid)
+    assert document_2["splash_md"]["version"] == 2
+    assert document_2["Occupation"] == "Dark Lord"
+    assert "alias" not in document_2
+    assert patch_resp["splash_md"] == document_2["splash_md"]
+
+    document_1 = versioned_service.retrieve_version(request_user, uid, 1)
+    assert document_1["Occupation"] == "Industrialist"
+    assert document_1["alias"] == "Annatar"
+    assert document_1["splash_md"] == create_resp["splash_md"]
+
+    with pytest.raises(ObjectNotFoundError):
+        versioned_service.patch(request_user, {"name": "Legolas"}, "Does not exist")
+
+
+def test_versioned_bulk(versioned_service: VersionedMongoService, request_user: User):
+    results = versioned_service.bulk_create(
+        request_user,
+        [{"name": "Celebrimbor"}, {"name": "Galadriel", "splash_md": {"version": 3}}],
+    )
+    assert results[0]["splash_md"]["version"] == 1
+    assert results[1]["err"] == "validation_error"
+    uid = results[0]["uid"]
+
+    results = versioned_service.bulk_update(
+        request_user,
+        [
+            {"uid": uid, "data": {"name": "Celebrimbor", "Occupation": "Ringmaker"}},
+            {"uid": "does_not_exist", "data": {"name": "Elrond"}},
+        ],
+    )
+    assert results[0]["splash_md"]["version"] == 2
+    assert results[1]["err"] == "not_found"
+    assert versioned_service.retrieve_version(request_user, uid, 1)["name"] == "Celebrimbor"
+    assert "Occupation" not in versioned_service.retrieve_version(request_user, uid, 1)
+    assert versioned_service.retrieve_version(request_user, uid, 2)["Occupation"] == "Ringmaker"
+
+    results = versioned_service.bulk_update(
+        request_user, [{"uid": uid, "data": {"name": "Annatar"}, "etag": "foo"}]
+    )
+    assert results[0]["err"] == "etag_mismatch_error"
+    assert versioned_service.get_num_versions(request_user, uid) == 2
+
+
+def test_delta_history(versioned_service: VersionedMongoService, request_user: User):
+    versioned_service.history_delta_limit = 2
+    lines = [f"Line {n} of the history of Gondolin\n" for n in range(100)]
+    uid = versioned_service.create(request_user, {"name": "Turgon", "history": "".join(lines)})["uid"]
+    expected = [versioned_service.retrieve_one(request_user, uid)]
+    for version in range(2, 9):
+        lines[version] = f"Line {version} was edited\n"
+        if version % 2 == 0:
+            versioned_service.update(request_user, {"name": "Turgon", "history": "".join(lines)}, uid)
+        else:
+            versioned_service.patch(request_user, {"history": "".join(lines), "city": f"Gondolin {version}"}, uid)
+        expected.append(versioned_service.retrieve_one(request_user, uid))
+
+    history = {
+        entry["splash_md"]["version"]: entry
+        for entry in versioned_service._versions_svc._collection.find({"uid": uid})
+    }
+    # Every third version is stored whole, the others as deltas
+    assert sorted(version for version, entry in history.items() if "splash_delta" not in entry) == [3, 6]
+    assert "history" not in history[4]
+    for version in range(1, 9):
+        assert versioned_service.retrieve_version(request_user, uid, version) == expected[version - 1]
+
+    # Entries written with another limit can still be read
+    versioned_service.history_delta_limit = 5
+    for version in range(1, 9):
+        assert versioned_service.retrieve_version(request_user, uid, version) == expected[version - 1]
+    with pytest.raises(VersionNotFoundError):
+        versioned_service.retrieve_version(request_user, uid, 9)
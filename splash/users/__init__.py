@@ -1,7 +1,7 @@
 from typing import List, Optional
 
-from pydantic import BaseModel, Extra
-from splash.service.models import CreatedDocument, SplashMetadata
+from pydantic import BaseModel, Extra, validator
+from splash.service.models import CreatedDocument, SplashMetadata, partial_model, reject_null
 
 
 class AuthenticatorModel(BaseModel):
@@ -28,6 +28,19 @@ class NewUser(BaseModel):
         extra = Extra.forbid
 
 
+class PatchUser(BaseModel):
+    splash_md: Optional[NewUserSplashMd]
+    given_name: Optional[str]
+    family_name: Optional[str]
+    email: Optional[str]
+    authenticators: Optional[List[AuthenticatorModel]]
+
+    _not_null = validator("splash_md", "given_name", "family_name", pre=True, allow_reuse=True)(reject_null)
+
+    class Config:
+        extra = Extra.forbid
+
+
 class UserSplashMd(SplashMetadata):
     admin: Optional[bool] = None
 
@@ -35,3 +48,12 @@ class UserSplashMd(SplashMetadata):
 class User(NewUser, CreatedDocument):
     disabled: Optional[bool] = None
     splash_md: UserSplashMd
+
+
+PartialUser = partial_model(User)
+
+
+class TokenUser(User):
+    """A user authorized from the claims in their access token, without reading
+    them from the database. Only `uid`, `splash_md.admin` and `teams` are set"""
+    teams: List[str] = []
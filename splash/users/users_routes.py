@@ -1,15 +1,21 @@
 from fastapi.param_functions import Header
 from attr import dataclass
-from fastapi import APIRouter, Security
+from fastapi import APIRouter, Depends, Query, Response, Security
 from fastapi.exceptions import HTTPException
 # from fastapi.security import OpenIdConnect
 from pydantic import BaseModel
 from typing import List, Optional
 
-from . import User, NewUser, UserSplashMd
+from . import User, NewUser, PartialUser, PatchUser, UserSplashMd
 from .users_service import UsersService
 
 from splash.api.auth import get_current_user
+from splash.api.bulk import BulkRequest, BulkResult, run_bulk
+from splash.service.base import ObjectNotFoundError
+from splash.service.models import EditElement
+from splash.api.pagination import CountMode, add_total_count_header, list_response
+from splash.api.etags import etag_header, etag_matches, if_match_etag, not_modified
+from splash.api.projection import fields_query, partial_response
 
 
 users_router = APIRouter()
@@ -33,35 +39,95 @@ class CreateUserResponse(BaseModel):
 
 @users_router.get("", tags=["users"], response_model=List[User])
 def read_users(
-            current_user: User = Security(get_current_user)):
-    results = services.users.retrieve_multiple(current_user)
-    return list(results)
+            response: Response,
+            current_user: User = Security(get_current_user),
+            page: Optional[int] = Query(1, gt=0),
+            page_size: Optional[int] = Query(10, gt=0),
+            after: Optional[str] = Query(None, alias="next"),
+            fields: Optional[List[str]] = Depends(fields_query),
+            count: Optional[CountMode] = Query(None)):
+    if count is not None:
+        total = services.users.count(current_user, estimated=count == CountMode.estimated)
+        add_total_count_header(response, total)
+    results = list(services.users.retrieve_multiple(
+        current_user, page=page, page_size=page_size, after=after, fields=fields))
+    return list_response(response, services.users, results, page_size, User, PartialUser, fields)
 
 
 @users_router.get("/{uid}", tags=['users'], response_model=User)
 def read_user(
             uid: str,
-            current_user: User = Security(get_current_user)):
-    user = services.users.retrieve_one(current_user, uid)
+            response: Response,
+            current_user: User = Security(get_current_user),
+            fields: Optional[List[str]] = Depends(fields_query),
+            if_none_match: Optional[str] = Header(None)):
+    # A projection is a different representation of the document, so only
+    # whole documents are validated against the etag
+    if if_none_match is not None and fields is None:
+        etag = services.users.retrieve_etag(current_user, uid)
+        if etag is not None and etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    user = services.users.retrieve_one(current_user, uid, fields=fields)
     if user is None:
         raise HTTPException(
                 status_code=404,
                 detail="object not found",
             )
+    if fields is not None:
+        return partial_response(user, response)
+    response.headers["ETag"] = etag_header(user.splash_md.etag)
     return user
 
 
+@users_router.get("/{uid}/edits", tags=['users'], response_model=List[EditElement])
+def read_user_edits(
+            uid: str,
+            current_user: User = Security(get_current_user),
+            page: Optional[int] = Query(1, gt=0),
+            page_size: Optional[int] = Query(10, gt=0)):
+    try:
+        edits = services.users.retrieve_edits(current_user, uid, page, page_size)
+    except ObjectNotFoundError:
+        raise HTTPException(
+                status_code=404,
+                detail="object not found",
+            )
+    return list(edits)
+
+
 @users_router.put("/{uid}", tags=['users'], response_model=CreateUserResponse)
 def replace_user(
         uid: str,
         user: NewUser,
         current_user: User = Security(get_current_user),
-        if_match: Optional[str] = Header(None)):
+        if_match: Optional[str] = Depends(if_match_etag)):
     return services.users.update(current_user, user, uid, etag=if_match)
 
 
+@users_router.patch("/{uid}", tags=['users'], response_model=CreateUserResponse)
+def patch_user(
+        uid: str,
+        user: PatchUser,
+        current_user: User = Security(get_current_user),
+        if_match: Optional[str] = Depends(if_match_etag)):
+    try:
+        return services.users.patch(current_user, user, uid, etag=if_match)
+    except ObjectNotFoundError:
+        raise HTTPException(
+                status_code=404,
+                detail="object not found",
+            )
+
+
 @users_router.post("", tags=['users'], response_model=CreateUserResponse)
 def create_user(
                 user: NewUser,
                 current_user: User = Security(get_current_user)):
     return services.users.create(current_user, user)
+
+
+@users_router.post("/bulk", tags=['users'], response_model=List[BulkResult])
+def bulk_users(
+                request: BulkRequest,
+                current_user: User = Security(get_current_user)):
+    return run_bulk(services.users, current_user, request.operations, NewUser, NewUser)
@@ -1,8 +1,12 @@
+from typing import List
+
 from pymongo import ASCENDING, DESCENDING, TEXT
 from pymongo.operations import IndexModel
-from ..users import NewUser, User
-from ..service.base import MongoService
+from ..users import NewUser, PartialUser, PatchUser, User
+from ..service.async_base import AsyncMongoService
+from ..service.base import MongoService, collated_sort_index
 from ..service.authorization import authorize_admin_action
+from ..service.cache import TTLCache, register_cache
 
 
 class MultipleUsersAuthenticatorException(Exception):
@@ -13,15 +17,51 @@ class UserNotFoundException(Exception):
     pass
 
 
-class UsersService(MongoService):
+class UsersServiceMixin:
+    """What UsersService and AsyncUsersService add to their base service without talking to Mongo"""
+
+    default_sort = [("family_name", ASCENDING), ("splash_md.last_edit", DESCENDING)]
+
+    # Users resolved by `insecure_get_user` for every authenticated request.
+    # Writes through this service drop the user straight away, the short ttl
+    # bounds how stale a user gets from writes made by other processes
+    user_cache_size = 1024
+    user_cache_ttl = 30
+
+    _claims_version = None
+
     def __init__(self, db, collection_name):
         super().__init__(db, collection_name)
-
+        self.set_user_cache(TTLCache(self.user_cache_size, self.user_cache_ttl))
+
+    def set_user_cache(self, cache):
+        """Caches the users returned by `insecure_get_user` in `cache`, or stops caching
+        if it is None. Share one cache between the sync and async services so that
+        writes through either invalidate it"""
+        self._users = cache
+        if cache is not None:
+            register_cache(self._cache_name("resolved"), cache)
+
+    def set_claims_version(self, claims_version):
+        """Bumps the users written in `claims_version`, so that access tokens
+        issued to them before stop being trusted for the admin flag"""
+        self._claims_version = claims_version
+
+    def _invalidate(self, *uids):
+        super()._invalidate(*uids)
+        if self._users is not None:
+            for uid in uids:
+                self._users.pop(uid)
+        if self._claims_version is not None:
+            self._claims_version.bump(*uids)
+
+
+class UsersService(UsersServiceMixin, MongoService):
     def _create_indexes(self):
         text_index = IndexModel(
             [("given_name", TEXT), ("family_name", TEXT), ("email", TEXT)]
         )
-        sort_index = IndexModel([("family_name", ASCENDING), ("splash_md.last_edit", DESCENDING)])
+        sort_index = collated_sort_index(self.default_sort)
         self._collection.create_indexes([text_index, sort_index])
         super()._create_indexes()
 
@@ -29,10 +69,16 @@ class UsersService(MongoService):
     def create(self, current_user: User, new_user: NewUser) -> dict:
         return super().create(current_user, new_user.dict())
 
-    def retrieve_one(self, current_user: User, uid: str) -> User:
-        user_dict = super().retrieve_one(current_user, uid)
+    @authorize_admin_action
+    def bulk_create(self, current_user: User, new_users: List[NewUser]) -> list:
+        return super().bulk_create(current_user, [new_user.dict() for new_user in new_users])
+
+    def retrieve_one(self, current_user: User, uid: str, fields=None) -> User:
+        user_dict = super().retrieve_one(current_user, uid, fields=fields)
         if user_dict is None:
             return None
+        if fields is not None:
+            return PartialUser(**user_dict)
         return User(**user_dict)
 
     def retrieve_multiple(
@@ -41,16 +87,31 @@ class UsersService(MongoService):
         page: int = 1,
         query=None,
         page_size=10,
-        sort=[("family_name", ASCENDING), ("splash_md.last_edit", DESCENDING)],
+        sort=UsersServiceMixin.default_sort,
+        after=None,
+        fields=None,
     ):
-        cursor = super().retrieve_multiple(current_user, page, query, page_size, sort)
+        cursor = super().retrieve_multiple(current_user, page, query, page_size, sort, after=after, fields=fields)
+        model = User if fields is None else PartialUser
         for user_dict in cursor:
-            yield User(**user_dict)
+            yield model(**user_dict)
 
     @authorize_admin_action
     def update(self, current_user: User, new_user: NewUser, uid: str, etag: str = None):
         return super().update(current_user, new_user.dict(), uid, etag=etag)
 
+    @authorize_admin_action
+    def bulk_update(self, current_user: User, items: list) -> list:
+        return super().bulk_update(current_user, [{**item, "data": item["data"].dict()} for item in items])
+
+    @authorize_admin_action
+    def bulk_archive_action(self, current_user: User, action: str, items: list) -> list:
+        return super().bulk_archive_action(current_user, action, items)
+
+    @authorize_admin_action
+    def patch(self, current_user: User, data: PatchUser, uid: str, etag: str = None):
+        return super().patch(current_user, data.dict(exclude_unset=True), uid, etag=etag)
+
     @authorize_admin_action
     def delete(self, current_user: User, uid):
         raise NotImplementedError
@@ -87,7 +148,83 @@ class UsersService(MongoService):
 
         Returns
         -------
-        dict
-            user info
+        User
+            user info, shared with other callers through the user cache,
+            so it must not be modified
         """
-        return self.retrieve_one(None, uid)
+        if self._users is None:
+            return self.retrieve_one(None, uid)
+        user = self._users.get(uid)
+        if user is None:
+            generation = self._users.generation
+            user = self.retrieve_one(None, uid)
+            if user is None:
+                return None
+            self._users.put(uid, user, generation)
+        return user
+
+
+class AsyncUsersService(UsersServiceMixin, AsyncMongoService):
+    @authorize_admin_action
+    async def create(self, current_user: User, new_user: NewUser) -> dict:
+        return await super().create(current_user, new_user.dict())
+
+    @authorize_admin_action
+    async def bulk_create(self, current_user: User, new_users: List[NewUser]) -> list:
+        return await super().bulk_create(current_user, [new_user.dict() for new_user in new_users])
+
+    async def retrieve_one(self, current_user: User, uid: str, fields=None) -> User:
+        user_dict = await super().retrieve_one(current_user, uid, fields=fields)
+        if user_dict is None:
+            return None
+        if fields is not None:
+            return PartialUser(**user_dict)
+        return User(**user_dict)
+
+    async def retrieve_multiple(
+        self,
+        current_user: User,
+        page: int = 1,
+        query=None,
+        page_size=10,
+        sort=UsersServiceMixin.default_sort,
+        after=None,
+        fields=None,
+    ):
+        cursor = super().retrieve_multiple(current_user, page, query, page_size, sort, after=after, fields=fields)
+        model = User if fields is None else PartialUser
+        async for user_dict in cursor:
+            yield model(**user_dict)
+
+    @authorize_admin_action
+    async def update(self, current_user: User, new_user: NewUser, uid: str, etag: str = None):
+        return await super().update(current_user, new_user.dict(), uid, etag=etag)
+
+    @authorize_admin_action
+    async def bulk_update(self, current_user: User, items: list) -> list:
+        return await super().bulk_update(current_user, [{**item, "data": item["data"].dict()} for item in items])
+
+    @authorize_admin_action
+    async def bulk_archive_action(self, current_user: User, action: str, items: list) -> list:
+        return await super().bulk_archive_action(current_user, action, items)
+
+    @authorize_admin_action
+    async def patch(self, current_user: User, data: PatchUser, uid: str, etag: str = None):
+        return await super().patch(current_user, data.dict(exclude_unset=True), uid, etag=etag)
+
+    @authorize_admin_action
+    async def delete(self, current_user: User, uid):
+        raise NotImplementedError
+
+    async def insecure_get_user(self, uid: str):
+        """Same as UsersService.insecure_get_user"""
+        if self._users is None:
+            return await self.retrieve_one(None, uid)
+        user = self._users.get(uid)
+        if user is None:
+            generation = self._users.generation
+            user = await self.retrieve_one(None, uid)
+            if user is None:
+                return None
+            self._users.put(uid, user, generation)
+        return user